@@ -4,8 +4,8 @@ from .models import User, UserProfile, ProfilePhoto, Interest, UserInterest
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    list_display = ['email', 'username', 'is_online', 'is_verified', 'last_seen', 'created_at']
-    list_filter = ['is_online', 'is_verified', 'is_staff', 'created_at']
+    list_display = ['email', 'username', 'is_verified', 'last_seen', 'created_at']
+    list_filter = ['is_verified', 'is_staff', 'created_at']
     search_fields = ['email', 'username']
     ordering = ['-created_at']
     
@@ -45,6 +45,10 @@ class UserProfileAdmin(admin.ModelAdmin):
     search_fields = ['user__email', 'user__username', 'city']
     readonly_fields = ['created_at', 'updated_at', 'age']
     inlines = [ProfilePhotoInline, UserInterestInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.refresh_interest_mask()
     
     fieldsets = (
         ('Utilisateur', {
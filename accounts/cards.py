@@ -0,0 +1,71 @@
+"""
+Cache des "cartes profil" affichées dans discover et les matches.
+
+Une carte est le JSON de ``UserProfileSerializer`` sans requête de contexte.
+Elle est mise en cache par ``(id du profil, card_version)`` ; toute écriture
+qui la modifie (profil, photos, intérêts) appelle ``invalidate_card`` qui
+incrémente la version. Les champs qui changent sans passer par ces écritures
+(utilisateur, âge, compteurs, updated_at) sont relus sur la ligne du profil à
+chaque assemblage, donc le profil doit être chargé avec ``select_related('user')`` ;
+la présence des utilisateurs est lue dans le cache avec les cartes.
+"""
+from django.core.cache import cache
+from django.db.models import F, prefetch_related_objects
+
+from . import presence
+from .models import UserProfile, profile_prefetches
+from .projections import format_datetime, profile_payload, user_payload
+
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def card_key(profile_id, version):
+    return f'profile_card:{profile_id}:{version}'
+
+
+def profile_cards(profiles):
+    """
+    Retourne les cartes des profils, dans l'ordre : un seul ``get_many`` pour
+    le cache, puis un prefetch groupé et un ``set_many`` pour les absentes.
+    """
+    profiles = list(profiles)
+    keys = {profile.pk: card_key(profile.pk, profile.card_version) for profile in profiles}
+    cards = cache.get_many(keys.values())
+    states = presence.states(profile.user for profile in profiles)
+
+    missing = [profile for profile in profiles if keys[profile.pk] not in cards]
+    if missing:
+        prefetch_related_objects(missing, *profile_prefetches())
+        fresh = {
+            keys[profile.pk]: profile_payload(profile, state=states[profile.user_id])
+            for profile in missing
+        }
+        cache.set_many(fresh, CARD_TIMEOUT)
+        cards.update(fresh)
+
+    return [
+        _with_live_fields(cards[keys[profile.pk]], profile, states[profile.user_id])
+        for profile in profiles
+    ]
+
+
+def profile_card(profile):
+    return profile_cards([profile])[0]
+
+
+def _with_live_fields(card, profile, state):
+    """Copie de la carte avec les champs non couverts par l'invalidation"""
+    card = dict(card)
+    card['user'] = user_payload(profile.user, state)
+    card['age'] = profile.age
+    card['swipe_count'] = profile.swipe_count
+    card['match_count'] = profile.match_count
+    card['updated_at'] = format_datetime(profile.updated_at)
+    return card
+
+
+def invalidate_card(profile):
+    """À appeler après toute modification du profil, de ses photos ou de ses intérêts"""
+    cache.delete(card_key(profile.pk, profile.card_version))
+    UserProfile.objects.filter(pk=profile.pk).update(card_version=F('card_version') + 1)
+    profile.card_version += 1
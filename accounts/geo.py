@@ -0,0 +1,173 @@
+"""Outils géographiques : geohash, bounding box et distance haversine.
+
+Le geohash est stocké sur ``UserProfile`` et indexé : un préfixe de geohash
+correspond à une cellule rectangulaire, ce qui permet de préfiltrer les
+candidats par plages de chaînes (index B-tree classique, compatible SQLite et
+Postgres) avant le calcul exact de la distance.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+GEOHASH_PRECISION = 8
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode une position en geohash"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Retourne (hauteur, largeur) en degrés d'une cellule de geohash"""
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def covering_precision(latitude, radius_km):
+    """
+    Précision la plus fine dont les cellules sont plus grandes que le rayon :
+    la cellule du point et ses 8 voisines couvrent alors tout le cercle.
+    Retourne 0 si aucun préfixe n'est assez grand (rayon très large).
+    """
+    # Latitude du bord du cercle le plus proche du pôle (cellules les plus étroites)
+    edge_latitude = min(abs(latitude) + radius_km / KM_PER_DEGREE, 90.0)
+    cos_lat = max(math.cos(math.radians(edge_latitude)), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lon_span = cell_size(precision)
+        height_km = lat_span * KM_PER_DEGREE
+        width_km = lon_span * KM_PER_DEGREE * cos_lat
+        if min(height_km, width_km) >= radius_km:
+            return precision
+    return 0
+
+
+def neighbour_prefixes(latitude, longitude, precision):
+    """Préfixes de la cellule contenant le point et de ses voisines"""
+    lat_span, lon_span = cell_size(precision)
+    prefixes = set()
+    for dlat in (-1, 0, 1):
+        lat = latitude + dlat * lat_span
+        if lat < -90 or lat > 90:
+            continue
+        for dlon in (-1, 0, 1):
+            lon = (longitude + dlon * lon_span + 180) % 360 - 180
+            prefixes.add(encode_geohash(lat, lon, precision))
+    return sorted(prefixes)
+
+
+def _prefix_upper_bound(prefix):
+    """Plus petite chaîne strictement supérieure à tous les geohash du préfixe"""
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def geohash_filter(latitude, longitude, radius_km, field='geohash'):
+    """
+    Filtre Q restreignant ``field`` aux cellules couvrant le cercle.
+    Chaque préfixe devient une plage ``>= préfixe AND < borne`` qui utilise
+    l'index du champ sur les deux backends (pas de LIKE).
+    """
+    precision = covering_precision(latitude, radius_km)
+    if not precision:
+        return Q(**{f'{field}__gt': ''})
+
+    condition = Q()
+    for prefix in neighbour_prefixes(latitude, longitude, precision):
+        cell = Q(**{f'{field}__gte': prefix})
+        upper = _prefix_upper_bound(prefix)
+        if upper:
+            cell &= Q(**{f'{field}__lt': upper})
+        condition |= cell
+    return condition
+
+
+def bounding_box_filter(latitude, longitude, radius_km,
+                        lat_field='latitude', lon_field='longitude'):
+    """Filtre Q sur le rectangle englobant le cercle de rayon ``radius_km``"""
+    delta_lat = radius_km / KM_PER_DEGREE
+    condition = Q(**{
+        f'{lat_field}__gte': latitude - delta_lat,
+        f'{lat_field}__lte': latitude + delta_lat,
+    })
+
+    # Étendue maximale en longitude d'un cercle sur la sphère
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / max(math.cos(math.radians(latitude)), 1e-12)
+    if ratio < 1:
+        delta_lon = math.degrees(math.asin(ratio))
+        # Pas de filtre en longitude à cheval sur l'antiméridien
+        if -180 <= longitude - delta_lon and longitude + delta_lon <= 180:
+            condition &= Q(**{
+                f'{lon_field}__gte': longitude - delta_lon,
+                f'{lon_field}__lte': longitude + delta_lon,
+            })
+    return condition
+
+
+def haversine_expression(latitude, longitude, lat_field='latitude', lon_field='longitude'):
+    """Expression SQL de la distance haversine (en km) depuis un point"""
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    lat2 = Radians(F(lat_field))
+    lon2 = Radians(F(lon_field))
+
+    a = (
+        Power(Sin((lat2 - Value(lat1)) / 2), 2)
+        + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lon2 - Value(lon1)) / 2), 2)
+    )
+    # Least() protège ASIN des erreurs d'arrondi (a légèrement > 1)
+    return ASin(Least(Sqrt(a), Value(1.0)), output_field=FloatField()) * (2 * EARTH_RADIUS_KM)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance haversine en km entre deux points"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
@@ -0,0 +1,53 @@
+"""Bitset des centres d'intérêt d'un profil.
+
+Chaque ``Interest`` reçoit une position ``bit`` (0 à INTEREST_BITS - 1) ;
+``UserProfile.interest_mask`` contient les bits de ses intérêts dans un
+entier 64 bits signé (``BigIntegerField``). Les intérêts communs à deux
+profils se comptent alors par popcount de ``a & b`` : en Python avec
+``shared_count``, sur un lot de profils avec ``shared_counts`` (colonne
+NumPy) ; ``filter_shared_interest`` filtre en SQL les profils ayant au moins
+un intérêt commun. Les intérêts sans position (au-delà de INTEREST_BITS)
+restent dans ``UserInterest`` mais ne comptent pas.
+"""
+import numpy as np
+from django.db.models import F
+
+INTEREST_BITS = 64
+_UNSIGNED = (1 << INTEREST_BITS) - 1
+
+
+def to_signed(mask):
+    """Entier non signé sur INTEREST_BITS bits -> valeur stockable en BigIntegerField"""
+    mask &= _UNSIGNED
+    return mask - (1 << INTEREST_BITS) if mask >> (INTEREST_BITS - 1) else mask
+
+
+def mask_from_bits(bits):
+    """Masque (signé) des positions ``bits`` ; les positions None sont ignorées"""
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return to_signed(mask)
+
+
+def shared_count(mask, other_mask):
+    """Nombre d'intérêts communs à deux masques"""
+    return ((mask & other_mask) & _UNSIGNED).bit_count()
+
+
+def filter_shared_interest(profiles, mask):
+    """Profils ayant au moins un intérêt commun avec ``mask`` (ET bit à bit en SQL)"""
+    return profiles.alias(
+        shared_interest_bits=F('interest_mask').bitand(mask)
+    ).exclude(shared_interest_bits=0)
+
+
+def as_unsigned(masks):
+    """Colonne NumPy de masques signés -> uint64 (même représentation binaire)"""
+    return np.asarray(masks, dtype=np.int64).view(np.uint64)
+
+
+def shared_counts(masks, mask):
+    """Nombre d'intérêts communs entre ``mask`` et chaque masque de la colonne"""
+    return np.bitwise_count(as_unsigned(masks) & np.uint64(mask & _UNSIGNED))
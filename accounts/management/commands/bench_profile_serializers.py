@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Interest, ProfilePhoto, UserInterest, UserProfile
+from accounts.projections import profile_payloads
+from accounts.serializers import UserProfileSerializer
+from config.benchmark import benchmark_database, bulk_create_profiles
+
+
+class Command(BaseCommand):
+    help = "Compare le débit (profils/s) de UserProfileSerializer et des projections rapides"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            profiles = bulk_create_profiles(options['profiles'])
+            interests = Interest.objects.bulk_create([
+                Interest(name=f'Intérêt {index}', icon='star') for index in range(20)
+            ])
+            ProfilePhoto.objects.bulk_create([
+                ProfilePhoto(profile=profile, image=f'profile_photos/{profile.id}_{order}.jpg', order=order)
+                for profile in profiles for order in range(3)
+            ], batch_size=5000)
+            UserInterest.objects.bulk_create([
+                UserInterest(profile=profile, interest=interests[(profile.id + offset) % len(interests)])
+                for profile in profiles for offset in range(4)
+            ], batch_size=5000)
+
+            loaded = list(UserProfile.objects.with_related())
+            self.report('UserProfileSerializer', lambda: UserProfileSerializer(loaded, many=True).data,
+                        len(loaded), options['repeat'])
+            self.report('profile_payloads', lambda: profile_payloads(loaded),
+                        len(loaded), options['repeat'])
+
+    def report(self, label, func, rows, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        self.stdout.write(f"{label:<25} {rows / best:12.0f} profils/s ({best * 1000:.1f}ms pour {rows})")
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:17
+
+from django.db import migrations, models
+
+from accounts.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    profiles = UserProfile.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for profile in profiles.iterator():
+        profile.geohash = encode_geohash(profile.latitude, profile.longitude)
+        profile.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userprofile_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['birth_date'], name='accounts_us_birth_d_7a47cf_idx'),
+        ),
+    ]
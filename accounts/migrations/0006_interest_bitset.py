@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:38
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from accounts.interests import INTEREST_BITS, mask_from_bits
+
+
+def backfill_interest_bitset(apps, schema_editor):
+    Interest = apps.get_model('accounts', 'Interest')
+    UserInterest = apps.get_model('accounts', 'UserInterest')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+
+    for bit, interest in enumerate(Interest.objects.order_by('id')[:INTEREST_BITS]):
+        interest.bit = bit
+        interest.save(update_fields=['bit'])
+
+    bits = defaultdict(list)
+    for profile_id, bit in UserInterest.objects.values_list('profile_id', 'interest__bit').iterator():
+        bits[profile_id].append(bit)
+    for profile_id, profile_bits in bits.items():
+        UserProfile.objects.filter(pk=profile_id).update(interest_mask=mask_from_bits(profile_bits))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_userprofile_card_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='interest',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='interest_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_interest_bitset, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
+from .geo import encode_geohash
+from .interests import INTEREST_BITS, mask_from_bits
 
 class User(AbstractUser):
     """Modèle User personnalisé"""
@@ -9,8 +12,10 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
     is_verified = models.BooleanField(default=False)
+    # Obsolète : la présence est dans le cache (voir accounts.presence),
+    # last_seen y est rafraîchi et recopié ici par lots
     is_online = models.BooleanField(default=False)
-    last_seen = models.DateTimeField(auto_now=True)
+    last_seen = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -24,6 +29,15 @@ class User(AbstractUser):
         ordering = ['-created_at']
 
 
+class UserProfileQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Charge l'utilisateur, les photos et les intérêts en un nombre fixe de
+        requêtes, quel que soit le nombre de profils (pas de N+1 à la sérialisation).
+        """
+        return self.select_related('user').prefetch_related(*profile_prefetches())
+
+
 class UserProfile(models.Model):
     """Profil utilisateur pour le matching"""
     GENDER_CHOICES = [
@@ -49,6 +63,8 @@ class UserProfile(models.Model):
     country = models.CharField(max_length=100, blank=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Geohash de la position, indexé pour le préfiltrage géographique
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     
     # Préférences de distance (en km)
     max_distance = models.IntegerField(
@@ -70,12 +86,40 @@ class UserProfile(models.Model):
     swipe_count = models.IntegerField(default=0)
     match_count = models.IntegerField(default=0)
     
+    # Version de la carte profil en cache (voir accounts.cards)
+    card_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bitset des intérêts (voir accounts.interests)
+    interest_mask = models.BigIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserProfileQuerySet.as_manager()
+
     def __str__(self):
         return f"Profile de {self.user.email}"
 
+    def save(self, *args, **kwargs):
+        # Garder le geohash synchronisé avec les coordonnées
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+
+        super().save(*args, **kwargs)
+
+    def refresh_interest_mask(self):
+        """Recalcule ``interest_mask`` depuis les intérêts enregistrés"""
+        self.interest_mask = mask_from_bits(
+            self.interests.values_list('interest__bit', flat=True)
+        )
+        UserProfile.objects.filter(pk=self.pk).update(interest_mask=self.interest_mask)
+
     @property
     def age(self):
         """Calcule l'âge à partir de la date de naissance"""
@@ -89,6 +133,10 @@ class UserProfile(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['birth_date']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
 
 
 class ProfilePhoto(models.Model):
@@ -111,10 +159,32 @@ class Interest(models.Model):
     """Centres d'intérêt"""
     name = models.CharField(max_length=50, unique=True)
     icon = models.CharField(max_length=50, blank=True)  # Nom de l'icône pour Flutter
+    # Position dans UserProfile.interest_mask (None si toutes sont prises)
+    bit = models.PositiveSmallIntegerField(null=True, blank=True, unique=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        # Deux créations concurrentes peuvent lire la même position libre :
+        # la contrainte unique départage, la perdante prend la suivante
+        while True:
+            self.bit = Interest.next_free_bit()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                bit, self.bit = self.bit, None
+                if bit is None or not Interest.objects.filter(bit=bit).exists():
+                    raise
+
+    @staticmethod
+    def next_free_bit():
+        used = set(Interest.objects.exclude(bit=None).values_list('bit', flat=True))
+        return next((bit for bit in range(INTEREST_BITS) if bit not in used), None)
+
     class Meta:
         ordering = ['name']
 
@@ -129,4 +199,18 @@ class UserInterest(models.Model):
         return f"{self.profile.user.email} - {self.interest.name}"
 
     class Meta:
-        unique_together = ['profile', 'interest']
\ No newline at end of file
+        unique_together = ['profile', 'interest']
+
+
+def profile_prefetches(prefix=''):
+    """
+    Prefetch des relations lues par ``UserProfileSerializer``.
+    ``prefix`` permet de les appliquer depuis un autre modèle (ex: ``'user1__profile__'``).
+    """
+    return [
+        f'{prefix}photos',
+        models.Prefetch(
+            f'{prefix}interests',
+            queryset=UserInterest.objects.select_related('interest')
+        ),
+    ]
@@ -0,0 +1,174 @@
+"""
+Présence des utilisateurs (en ligne, vu pour la dernière fois), hors de la
+table ``User``.
+
+- ``presence:<id>`` compte les connexions WebSocket ouvertes de l'utilisateur
+  (incr/decr atomiques dans le cache partagé). La clé expire après
+  ``PRESENCE_TTL`` secondes sans battement de cœur : une connexion perdue
+  avec son processus ne laisse pas l'utilisateur en ligne indéfiniment.
+- ``last_seen:<id>`` garde la dernière activité, lue par ``UserSerializer``
+  et ``user_payload`` à la place de la ligne.
+- ``User.last_seen`` est mis à jour par lots : chaque processus accumule les
+  dernières activités et les écrit toutes les ``PRESENCE_FLUSH_INTERVAL``
+  secondes en une requête (et à l'arrêt). ``User.is_online`` n'est plus
+  écrit.
+
+Avec ``PRESENCE_FLUSH_BACKGROUND = False`` (tests), aucun worker n'est
+démarré : ``flush()`` est appelé explicitement.
+"""
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LAST_SEEN_TIMEOUT = 60 * 60 * 24 * 7
+FLUSH_BATCH_SIZE = 500
+
+_dirty = {}
+_lock = threading.Lock()
+_worker = None
+_stop = threading.Event()
+
+
+def presence_key(user_id):
+    return f'presence:{user_id}'
+
+
+def last_seen_key(user_id):
+    return f'last_seen:{user_id}'
+
+
+def connect(user_id):
+    """Une connexion de plus pour l'utilisateur ; retourne le nombre de connexions"""
+    key = presence_key(user_id)
+    cache.add(key, 0, settings.PRESENCE_TTL)
+    try:
+        connections = cache.incr(key)
+    except ValueError:
+        # Clé expirée entre add et incr
+        cache.add(key, 1, settings.PRESENCE_TTL)
+        connections = 1
+    cache.touch(key, settings.PRESENCE_TTL)
+    seen(user_id)
+    return connections
+
+
+def disconnect(user_id):
+    """Une connexion de moins ; retourne True si l'utilisateur reste en ligne"""
+    key = presence_key(user_id)
+    seen(user_id)
+    try:
+        connections = cache.decr(key)
+    except ValueError:
+        return False
+    if connections <= 0:
+        cache.delete(key)
+        return False
+    return True
+
+
+def heartbeat(user_id):
+    """Prolonge la présence d'une connexion ouverte (toutes les ``PRESENCE_HEARTBEAT_INTERVAL`` s)"""
+    cache.touch(presence_key(user_id), settings.PRESENCE_TTL)
+    seen(user_id)
+
+
+def seen(user_id, at=None):
+    """Enregistre une activité de l'utilisateur (cache immédiatement, base au prochain flush)"""
+    at = at or timezone.now()
+    cache.set(last_seen_key(user_id), at.timestamp(), LAST_SEEN_TIMEOUT)
+    with _lock:
+        _dirty[user_id] = max(_dirty.get(user_id, at), at)
+    if settings.PRESENCE_FLUSH_BACKGROUND:
+        _ensure_worker()
+
+
+def is_online(user_id):
+    """L'utilisateur a-t-il au moins une connexion ouverte ?"""
+    return (cache.get(presence_key(user_id)) or 0) > 0
+
+
+def states(users):
+    """``{id: (is_online, last_seen)}`` des utilisateurs, en un seul ``get_many``"""
+    users = list(users)
+    keys = {}
+    for user in users:
+        keys[presence_key(user.id)] = keys[last_seen_key(user.id)] = user.id
+    values = cache.get_many(keys)
+
+    result = {}
+    for user in users:
+        last_seen = user.last_seen
+        timestamp = values.get(last_seen_key(user.id))
+        if timestamp is not None:
+            cached = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+            last_seen = cached if last_seen is None else max(last_seen, cached)
+        result[user.id] = (values.get(presence_key(user.id), 0) > 0, last_seen)
+    return result
+
+
+def state(user):
+    """``(is_online, last_seen)`` d'un utilisateur"""
+    return states([user])[user.id]
+
+
+def flush():
+    """Écrit les dernières activités accumulées dans ``User.last_seen`` ; retourne le nombre écrit"""
+    from .models import User
+
+    with _lock:
+        pending = dict(_dirty)
+        _dirty.clear()
+    if not pending:
+        return 0
+
+    # last_seen ne recule jamais (plusieurs processus écrivent)
+    users = [
+        User(pk=user_id, last_seen=Greatest(F('last_seen'), Value(at)))
+        for user_id, at in pending.items()
+    ]
+    try:
+        User.objects.bulk_update(users, ['last_seen'], batch_size=FLUSH_BATCH_SIZE)
+    except Exception:
+        with _lock:
+            for user_id, at in pending.items():
+                _dirty[user_id] = max(_dirty.get(user_id, at), at)
+        raise
+    return len(pending)
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='presence-flush', daemon=True)
+            _worker.start()
+
+
+def _run():
+    while not _stop.wait(settings.PRESENCE_FLUSH_INTERVAL):
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            logger.warning("Échec de l'écriture de last_seen, nouvel essai au prochain intervalle", exc_info=True)
+        finally:
+            close_old_connections()
+
+
+@atexit.register
+def _shutdown():
+    _stop.set()
+    try:
+        flush()
+    except Exception:
+        logger.exception("Écriture de last_seen perdue à l'arrêt")
@@ -0,0 +1,108 @@
+"""
+Sérialisation rapide, en lecture seule, des profils pour les endpoints chauds
+(discover, matches).
+
+Produit exactement le même JSON que ``UserSerializer``,
+``ProfilePhotoSerializer`` et ``UserProfileSerializer`` (mêmes clés, même
+ordre, mêmes formats) mais sans instancier de serializers DRF : les
+conversions de champs sont résolues une seule fois au chargement du module.
+Les profils doivent être chargés avec ``UserProfile.objects.with_related()``.
+"""
+from rest_framework import serializers
+from . import presence
+
+_datetime = serializers.DateTimeField().to_representation
+_date = serializers.DateField().to_representation
+
+
+def _nullable(convert, value):
+    return None if value is None else convert(value)
+
+
+def format_datetime(value):
+    """Équivalent de ``serializers.DateTimeField().to_representation``"""
+    return _nullable(_datetime, value)
+
+
+def file_url(value, request=None):
+    """Équivalent de ``serializers.ImageField().to_representation``"""
+    if not value:
+        return None
+    try:
+        url = value.url
+    except AttributeError:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def user_payload(user, state=None):
+    """
+    Équivalent de ``UserSerializer(user).data`` ; ``state`` est la présence
+    préchargée par ``presence.states`` (lue dans le cache sinon)
+    """
+    is_online, last_seen = state or presence.state(user)
+    return {
+        'id': str(user.id),
+        'email': user.email,
+        'username': user.username,
+        'phone': _nullable(str, user.phone),
+        'is_verified': bool(user.is_verified),
+        'is_online': is_online,
+        'last_seen': _nullable(_datetime, last_seen),
+        'created_at': _nullable(_datetime, user.created_at),
+    }
+
+
+def photo_payload(photo, request=None):
+    """Équivalent de ``ProfilePhotoSerializer(photo).data``"""
+    return {
+        'id': photo.id,
+        'image': file_url(photo.image, request),
+        'order': photo.order,
+        'is_primary': bool(photo.is_primary),
+        'created_at': _nullable(_datetime, photo.created_at),
+    }
+
+
+def interest_payload(interest):
+    """Équivalent de ``InterestSerializer(interest).data``"""
+    return {
+        'id': interest.id,
+        'name': interest.name,
+        'icon': interest.icon,
+    }
+
+
+def profile_payload(profile, request=None, state=None):
+    """Équivalent de ``UserProfileSerializer(profile).data``"""
+    return {
+        'id': profile.id,
+        'user': user_payload(profile.user, state),
+        'bio': profile.bio,
+        'birth_date': _nullable(_date, profile.birth_date),
+        'gender': profile.gender,
+        'looking_for': profile.looking_for,
+        'city': profile.city,
+        'country': profile.country,
+        'latitude': _nullable(float, profile.latitude),
+        'longitude': _nullable(float, profile.longitude),
+        'max_distance': profile.max_distance,
+        'min_age_preference': profile.min_age_preference,
+        'max_age_preference': profile.max_age_preference,
+        'age': profile.age,
+        'swipe_count': profile.swipe_count,
+        'match_count': profile.match_count,
+        'photos': [photo_payload(photo, request) for photo in profile.photos.all()],
+        'interests': [interest_payload(ui.interest) for ui in profile.interests.all()],
+        'created_at': _nullable(_datetime, profile.created_at),
+        'updated_at': _nullable(_datetime, profile.updated_at),
+    }
+
+
+def profile_payloads(profiles, request=None):
+    """Équivalent de ``UserProfileSerializer(profiles, many=True).data``"""
+    profiles = list(profiles)
+    states = presence.states(profile.user for profile in profiles)
+    return [profile_payload(profile, request, states[profile.user_id]) for profile in profiles]
@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from .models import User, UserProfile, ProfilePhoto, Interest, UserInterest
+from . import presence
+from .cards import invalidate_card
+from .interests import mask_from_bits
 
 
 class LoginSerializer(serializers.Serializer):
@@ -10,13 +14,25 @@ class LoginSerializer(serializers.Serializer):
 
 
 class UserSerializer(serializers.ModelSerializer):
-    """Serializer pour l'utilisateur"""
+    """
+    Serializer pour l'utilisateur ; ``is_online`` / ``last_seen`` viennent du
+    cache de présence (``context['presence']`` s'il a été préchargé avec
+    ``presence.states``).
+    """
     class Meta:
         model = User
         fields = ['id', 'email', 'username', 'phone', 'is_verified', 
                   'is_online', 'last_seen', 'created_at']
         read_only_fields = ['id', 'is_verified', 'is_online', 'last_seen', 'created_at']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        states = self.context.get('presence', {})
+        is_online, last_seen = states[instance.id] if instance.id in states else presence.state(instance)
+        data['is_online'] = is_online
+        data['last_seen'] = self.fields['last_seen'].to_representation(last_seen) if last_seen else None
+        return data
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     """Serializer pour l'inscription"""
@@ -77,7 +93,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'swipe_count', 'match_count', 'created_at', 'updated_at']
 
     def get_interests(self, obj):
-        user_interests = UserInterest.objects.filter(profile=obj).select_related('interest')
+        # Lit le cache de prefetch quand le queryset utilise with_related()
+        user_interests = obj.interests.all()
+        if 'interests' not in getattr(obj, '_prefetched_objects_cache', {}):
+            user_interests = user_interests.select_related('interest')
         return InterestSerializer([ui.interest for ui in user_interests], many=True).data
 
 
@@ -99,20 +118,41 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         interest_ids = validated_data.pop('interest_ids', None)
-        
-        # Mettre à jour le profil
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-
-        # Mettre à jour les intérêts
-        if interest_ids is not None:
-            UserInterest.objects.filter(profile=instance).delete()
-            for interest_id in interest_ids:
-                try:
-                    interest = Interest.objects.get(id=interest_id)
-                    UserInterest.objects.create(profile=instance, interest=interest)
-                except Interest.DoesNotExist:
-                    pass
+
+        with transaction.atomic():
+            # Intérêts demandés, validés en une requête (les IDs inconnus sont ignorés)
+            if interest_ids is not None:
+                interest_bits = dict(
+                    Interest.objects.filter(id__in=interest_ids).order_by().values_list('id', 'bit')
+                )
+                instance.interest_mask = mask_from_bits(interest_bits.values())
+
+            # Mettre à jour le profil (et le bitset des intérêts) : seuls les
+            # champs modifiés sont écrits, les compteurs (F()) et card_version
+            # incrémentés par d'autres requêtes ne sont pas écrasés
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            update_fields = [*validated_data, 'updated_at']
+            if interest_ids is not None:
+                update_fields.append('interest_mask')
+            instance.save(update_fields=update_fields)
+
+            # Mettre à jour les intérêts : seules les différences sont écrites
+            if interest_ids is not None:
+                current = set(
+                    UserInterest.objects.filter(profile=instance).values_list('interest_id', flat=True)
+                )
+                removed = current - interest_bits.keys()
+                if removed:
+                    UserInterest.objects.filter(profile=instance, interest_id__in=removed).delete()
+                added = interest_bits.keys() - current
+                if added:
+                    UserInterest.objects.bulk_create([
+                        UserInterest(profile=instance, interest_id=interest_id)
+                        for interest_id in added
+                    ])
+
+            # Invalider la carte profil en cache
+            invalidate_card(instance)
 
         return instance
\ No newline at end of file
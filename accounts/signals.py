@@ -0,0 +1,15 @@
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .interests import filter_shared_interest, mask_from_bits, to_signed
+from .models import Interest, UserProfile
+
+
+@receiver(post_delete, sender=Interest)
+def release_interest_bit(sender, instance, **kwargs):
+    """Effacer la position libérée des masques avant qu'elle soit réattribuée"""
+    if instance.bit is None:
+        return
+    filter_shared_interest(UserProfile.objects.all(), mask_from_bits([instance.bit])).update(
+        interest_mask=F('interest_mask').bitand(to_signed(~(1 << instance.bit)))
+    )
@@ -1,3 +1,348 @@
-from django.test import TestCase
+import math
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import presence
+from .geo import (
+    EARTH_RADIUS_KM, covering_precision, encode_geohash, neighbour_prefixes
+)
+from .models import User, UserProfile, ProfilePhoto, Interest, UserInterest
+from .cards import profile_card
+from .interests import (
+    INTEREST_BITS, filter_shared_interest, mask_from_bits, shared_count, shared_counts
+)
+from .projections import profile_payloads, user_payload
+from .serializers import UserProfileSerializer, UserProfileUpdateSerializer, UserSerializer
+
+
+def create_profile(email, interests=(), photos=2, **fields):
+    """Crée un utilisateur avec un profil complet (photos et intérêts)"""
+    user = User.objects.create_user(
+        username=email.split('@')[0], email=email, password='motdepasse-test'
+    )
+    defaults = {
+        'gender': 'F',
+        'looking_for': 'F',
+        'birth_date': date(1995, 5, 17),
+        'latitude': 48.8566,
+        'longitude': 2.3522,
+        'min_age_preference': 18,
+        'max_age_preference': 60,
+    }
+    defaults.update(fields)
+    profile = UserProfile.objects.create(user=user, **defaults)
+
+    for order in range(photos):
+        ProfilePhoto.objects.create(
+            profile=profile, image=f'profile_photos/{user.username}_{order}.jpg', order=order
+        )
+    for interest in interests:
+        UserInterest.objects.create(profile=profile, interest=interest)
+    if interests:
+        profile.refresh_interest_mask()
+    return profile
+
+
+class UserProfileQueryCountTests(TestCase):
+    """Le nombre de requêtes des endpoints profil ne dépend pas des relations"""
+
+    def setUp(self):
+        self.interests = [Interest.objects.create(name=name) for name in ('Cinéma', 'Rando', 'Jazz')]
+        self.profile = create_profile('alice@example.com', interests=self.interests, photos=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def test_me(self):
+        # profil + utilisateur (jointure), photos, intérêts
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/auth/profiles/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['photos']), 3)
+        self.assertEqual(len(response.data['interests']), 3)
+
+    def test_list(self):
+        # count de pagination + profils, photos, intérêts
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/auth/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_update_interests(self):
+        more = [Interest.objects.create(name=f'Intérêt {index}') for index in range(10)]
+        interest_ids = [self.interests[0].id] + [interest.id for interest in more] + [999999]
+        kept = UserInterest.objects.get(profile=self.profile, interest=self.interests[0])
+
+        # validation des intérêts, sauvegarde, intérêts actuels, suppression,
+        # insertion groupée, version de la carte (+ 2 savepoints),
+        # puis photos et intérêts de la réponse
+        with self.assertNumQueries(10):
+            response = self.client.patch(
+                '/api/auth/profiles/update_profile/',
+                {'bio': 'Nouvelle bio', 'interest_ids': interest_ids},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {interest['id'] for interest in response.data['interests']},
+            set(interest_ids[:-1])
+        )
+        # Les intérêts conservés ne sont pas recréés
+        self.assertTrue(UserInterest.objects.filter(pk=kept.pk).exists())
+
+    def test_update_keeps_concurrent_counters(self):
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        # Swipe et match enregistrés pendant la requête de mise à jour
+        UserProfile.objects.filter(pk=profile.pk).update(
+            swipe_count=F('swipe_count') + 3, match_count=F('match_count') + 1,
+            card_version=F('card_version') + 1,
+        )
+        serializer = UserProfileUpdateSerializer(
+            profile, data={'bio': 'Nouvelle bio', 'latitude': 45.764, 'longitude': 4.8357}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        profile.refresh_from_db()
+        self.assertEqual((profile.swipe_count, profile.match_count), (3, 1))
+        self.assertEqual(profile.card_version, 2)
+        self.assertEqual(profile.bio, 'Nouvelle bio')
+        self.assertEqual(profile.geohash, encode_geohash(45.764, 4.8357))
+
+
+class ProfileProjectionTests(TestCase):
+    """Les projections rapides produisent le même JSON que les serializers DRF"""
+
+    def setUp(self):
+        interests = [Interest.objects.create(name=name, icon='star') for name in ('Cinéma', 'Rando')]
+        create_profile('complet@example.com', interests=interests, photos=3, bio='Bonjour', city='Paris')
+        create_profile(
+            'partiel@example.com', photos=0,
+            birth_date=None, latitude=None, longitude=None
+        )
+        User.objects.filter(email='complet@example.com').update(phone='0601020304')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_profile_payloads_match_serializer(self):
+        profiles = list(UserProfile.objects.with_related())
+        self.assertEqual(
+            self.render(profile_payloads(profiles)),
+            self.render(UserProfileSerializer(profiles, many=True).data)
+        )
+
+    def test_profile_payloads_match_serializer_with_request(self):
+        request = APIRequestFactory().get('/')
+        profiles = list(UserProfile.objects.with_related())
+        self.assertEqual(
+            self.render(profile_payloads(profiles, request)),
+            self.render(UserProfileSerializer(profiles, many=True, context={'request': request}).data)
+        )
+
+    def test_user_payload_matches_serializer(self):
+        for user in User.objects.all():
+            self.assertEqual(self.render(user_payload(user)), self.render(UserSerializer(user).data))
+
+
+class ProfileCardCacheTests(TestCase):
+    """Les cartes en cache sont invalidées par les écritures sur le profil"""
+
+    def setUp(self):
+        cache.clear()
+        self.interest = Interest.objects.create(name='Cinéma')
+        self.profile = create_profile('alice@example.com', photos=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def card(self):
+        profile = UserProfile.objects.select_related('user').get(pk=self.profile.pk)
+        return profile_card(profile)
+
+    def test_card_matches_serializer(self):
+        self.card()
+        profile = UserProfile.objects.with_related().get(pk=self.profile.pk)
+        self.assertEqual(
+            JSONRenderer().render(self.card()),
+            JSONRenderer().render(UserProfileSerializer(profile).data)
+        )
+
+    def test_profile_update_invalidates_card(self):
+        self.card()
+        self.client.patch(
+            '/api/auth/profiles/update_profile/',
+            {'bio': 'Nouvelle bio', 'interest_ids': [self.interest.id]},
+            format='json'
+        )
+        card = self.card()
+        self.assertEqual(card['bio'], 'Nouvelle bio')
+        self.assertEqual([interest['name'] for interest in card['interests']], ['Cinéma'])
+
+    def test_set_primary_invalidates_card(self):
+        photo = self.profile.photos.get()
+        self.assertFalse(self.card()['photos'][0]['is_primary'])
+        self.client.post(f'/api/auth/photos/{photo.id}/set_primary/')
+        self.assertTrue(self.card()['photos'][0]['is_primary'])
+
+    def test_live_fields_are_not_cached(self):
+        self.card()
+        UserProfile.objects.filter(pk=self.profile.pk).update(swipe_count=7)
+        self.assertEqual(self.card()['swipe_count'], 7)
+
+
+class GeohashTests(TestCase):
+    """Encodage geohash et cellules couvrant un rayon"""
+
+    def test_encode(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(48.8566, 2.3522), 'u09tvw0f')
+        self.assertEqual(encode_geohash(-33.8688, 151.2093, 5), 'r3gx2')
+
+    def test_covering_precision(self):
+        # Cellules à l'équateur : 4,9 km (précision 5), 19,5 × 39 km (4), 156 km (3)
+        self.assertEqual(covering_precision(0.0, 1), 5)
+        self.assertEqual(covering_precision(0.0, 10), 4)
+        self.assertEqual(covering_precision(0.0, 100), 3)
+        # Cellules plus étroites vers les pôles : précision jamais plus fine
+        for radius_km in (1, 10, 100):
+            self.assertLessEqual(covering_precision(69.6, radius_km), covering_precision(0.0, radius_km))
+        self.assertEqual(covering_precision(0.0, 20000), 0)
+
+    def test_neighbour_cells_cover_the_circle(self):
+        for latitude, longitude in ((48.8566, 2.3522), (-33.8688, 151.2093), (0.01, 179.99)):
+            for radius_km in (5, 25, 100):
+                precision = covering_precision(latitude, radius_km)
+                prefixes = neighbour_prefixes(latitude, longitude, precision)
+                for bearing in range(0, 360, 15):
+                    lat, lon = destination(latitude, longitude, radius_km * 0.999, bearing)
+                    self.assertIn(encode_geohash(lat, lon, precision), prefixes)
+
+
+def destination(latitude, longitude, distance_km, bearing):
+    """Point à ``distance_km`` dans la direction ``bearing`` (degrés)"""
+    delta = distance_km / EARTH_RADIUS_KM
+    theta, phi1, lambda1 = math.radians(bearing), math.radians(latitude), math.radians(longitude)
+    phi2 = math.asin(math.sin(phi1) * math.cos(delta) + math.cos(phi1) * math.sin(delta) * math.cos(theta))
+    lambda2 = lambda1 + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(phi1), math.cos(delta) - math.sin(phi1) * math.sin(phi2)
+    )
+    return math.degrees(phi2), (math.degrees(lambda2) + 540) % 360 - 180
+
+
+class InterestBitsetTests(TestCase):
+    """Bitset des intérêts : positions, synchronisation et popcount"""
+
+    def setUp(self):
+        cache.clear()
+        self.interests = [Interest.objects.create(name=f'Intérêt {index}') for index in range(INTEREST_BITS)]
+        self.profile = create_profile('alice@example.com', photos=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def test_bits_are_unique_and_bounded(self):
+        self.assertEqual(sorted(interest.bit for interest in self.interests), list(range(INTEREST_BITS)))
+        self.assertIsNone(Interest.objects.create(name='Hors bitset').bit)
+
+    def test_deleted_interest_bit_is_cleared(self):
+        removed, kept = self.interests[3], self.interests[INTEREST_BITS - 1]
+        bob = create_profile('bob@example.com', interests=[removed, kept], photos=0)
+        removed.delete()
+
+        bob.refresh_from_db()
+        self.assertEqual(bob.interest_mask, mask_from_bits([kept.bit]))
+        # La position libérée est réattribuée sans hériter des anciens profils
+        reused = Interest.objects.create(name='Nouveau')
+        self.assertEqual(reused.bit, removed.bit)
+        shared = filter_shared_interest(UserProfile.objects.all(), mask_from_bits([reused.bit]))
+        self.assertFalse(shared.exists())
+
+    def test_concurrent_creation_takes_next_bit(self):
+        freed = self.interests[5]
+        freed.delete()
+        # Position lue par une création concurrente déjà commitée
+        with mock.patch.object(Interest, 'next_free_bit', side_effect=[0, freed.bit]):
+            interest = Interest.objects.create(name='Concurrent')
+        self.assertEqual(interest.bit, freed.bit)
+
+        with self.assertRaises(IntegrityError):
+            Interest.objects.create(name='Concurrent')
+
+    def test_update_keeps_mask_in_sync(self):
+        chosen = [self.interests[0], self.interests[INTEREST_BITS - 1]]
+        self.client.patch(
+            '/api/auth/profiles/update_profile/',
+            {'interest_ids': [interest.id for interest in chosen]},
+            format='json'
+        )
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        self.assertEqual(profile.interest_mask, mask_from_bits(interest.bit for interest in chosen))
+        self.assertLess(profile.interest_mask, 0)
+
+    def test_overlap(self):
+        bob = create_profile('bob@example.com', interests=self.interests[:3], photos=0)
+        carol = create_profile('carol@example.com', interests=self.interests[-2:], photos=0)
+        mask = mask_from_bits([0, 1, INTEREST_BITS - 1])
+
+        self.assertEqual(shared_count(mask, bob.interest_mask), 2)
+        self.assertEqual(
+            list(shared_counts([bob.interest_mask, carol.interest_mask, 0], mask)),
+            [2, 1, 0]
+        )
+        shared = filter_shared_interest(UserProfile.objects.all(), mask_from_bits([2]))
+        self.assertEqual(list(shared), [bob])
+
+
+@override_settings(PRESENCE_FLUSH_BACKGROUND=False)
+class PresenceTests(TestCase):
+    """Présence dans le cache, last_seen écrit par lots"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_profile('alice@example.com', photos=0).user
+        self.addCleanup(presence.flush)
+
+    def test_connections_are_counted(self):
+        self.assertEqual(presence.connect(self.user.id), 1)
+        self.assertEqual(presence.connect(self.user.id), 2)
+        self.assertTrue(UserSerializer(self.user).data['is_online'])
+
+        self.assertTrue(presence.disconnect(self.user.id))
+        self.assertFalse(presence.disconnect(self.user.id))
+        self.assertFalse(UserSerializer(self.user).data['is_online'])
+        self.assertFalse(presence.disconnect(self.user.id))
+
+    def test_login_does_not_write_user_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post(
+                '/api/auth/login/', {'email': 'alice@example.com', 'password': 'motdepasse-test'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+
+        # last_seen lu dans le cache avant d'être écrit sur la ligne
+        row = User.objects.get(pk=self.user.pk)
+        self.assertEqual(row.last_seen, self.user.last_seen)
+        self.assertGreater(presence.state(row)[1], row.last_seen)
+
+    def test_flush_writes_last_seen_in_batch(self):
+        others = [create_profile(f'user{index}@example.com', photos=0).user for index in range(5)]
+        later = timezone.now() + timedelta(minutes=5)
+        for user in others:
+            presence.seen(user.id, later)
+        User.objects.filter(pk=others[0].pk).update(last_seen=later + timedelta(minutes=1))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(presence.flush(), 5)
+        last_seen = dict(User.objects.filter(pk__in=[user.pk for user in others]).values_list('pk', 'last_seen'))
+        self.assertEqual(last_seen[others[1].pk], later)
+        # last_seen ne recule pas
+        self.assertEqual(last_seen[others[0].pk], later + timedelta(minutes=1))
+        self.assertEqual(presence.flush(), 0)
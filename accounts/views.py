@@ -4,7 +4,9 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from . import presence
 from .models import User, UserProfile, ProfilePhoto, Interest
+from .cards import invalidate_card
 from .serializers import (
     RegisterSerializer, UserSerializer, UserProfileSerializer,
     UserProfileUpdateSerializer, ProfilePhotoSerializer, InterestSerializer,LoginSerializer
@@ -53,9 +55,8 @@ class LoginView(generics.GenericAPIView):
         # Authenticate avec email
         user = User.objects.filter(email=email).first()
         if user and user.check_password(password):
-            # Mettre à jour le statut en ligne
-            user.is_online = True
-            user.save()
+            # Activité enregistrée dans le cache de présence (pas d'écriture de la ligne)
+            presence.seen(user.id)
 
             # Générer les tokens
             refresh = RefreshToken.for_user(user)
@@ -77,9 +78,8 @@ class LogoutView(generics.GenericAPIView):
 
     def post(self, request):
         try:
-            # Mettre à jour le statut hors ligne
-            request.user.is_online = False
-            request.user.save()
+            # Le statut en ligne suit les WebSockets ouverts : seule l'activité est enregistrée
+            presence.seen(request.user.id)
 
             # Blacklist le refresh token
             refresh_token = request.data.get("refresh")
@@ -98,7 +98,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return UserProfile.objects.filter(user=self.request.user).with_related()
 
     def get_serializer_class(self):
         if self.action in ['update', 'partial_update']:
@@ -109,7 +109,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     def me(self, request):
         """Récupérer le profil de l'utilisateur connecté"""
         try:
-            profile = request.user.profile
+            profile = self.get_queryset().get()
             serializer = self.get_serializer(profile)
             return Response(serializer.data)
         except UserProfile.DoesNotExist:
@@ -154,6 +154,16 @@ class ProfilePhotoViewSet(viewsets.ModelViewSet):
             )
         
         serializer.save(profile=profile)
+        invalidate_card(profile)
+
+    def perform_update(self, serializer):
+        photo = serializer.save()
+        invalidate_card(photo.profile)
+
+    def perform_destroy(self, instance):
+        profile = instance.profile
+        instance.delete()
+        invalidate_card(profile)
 
     @action(detail=True, methods=['post'])
     def set_primary(self, request, pk=None):
@@ -166,6 +176,8 @@ class ProfilePhotoViewSet(viewsets.ModelViewSet):
         # Définir cette photo comme principale
         photo.is_primary = True
         photo.save()
+
+        invalidate_card(photo.profile)
         
         return Response(ProfilePhotoSerializer(photo).data)
 
@@ -11,8 +11,8 @@ class ConversationAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['sender', 'conversation', 'message_type', 'is_read', 'created_at']
-    list_filter = ['message_type', 'is_read', 'created_at']
+    list_display = ['sender', 'conversation', 'message_type', 'created_at']
+    list_filter = ['message_type', 'created_at']
     search_fields = ['sender__email', 'content']
     date_hierarchy = 'created_at'
     ordering = ['-created_at']
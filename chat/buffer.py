@@ -0,0 +1,197 @@
+"""
+Écriture différée des messages reçus par WebSocket.
+
+``add`` construit le message en mémoire (identifiant et ``created_at``
+attribués à la réception) : le consumer le diffuse aussitôt, sans attendre
+la base. Un worker local (thread) insère ensuite les messages en attente
+par lots, avec ``bulk_create``, dès que ``CHAT_BUFFER_MAX_BATCH`` messages
+attendent ou au plus tard après ``CHAT_BUFFER_FLUSH_INTERVAL`` secondes ;
+les compteurs de non lus et ``updated_at`` des conversations sont mis à
+jour dans la même transaction.
+
+Ordre : les ``created_at`` sont strictement croissants dans le processus et
+les lots sont insérés dans l'ordre de réception par un seul worker ; un lot
+en échec est inséré par moitiés avant les suivants, pour qu'un message
+invalide ne fasse pas perdre ceux des autres conversations. Durabilité : les
+messages en attente sont insérés à l'arrêt du processus (``atexit``, arrêt
+propre du serveur ASGI) ; un message abandonné après ``MAX_ATTEMPTS`` essais
+est journalisé.
+
+Avec ``CHAT_BUFFER_BACKGROUND = False`` (tests), aucun worker n'est démarré :
+les messages attendent un appel explicite à ``flush()``.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from . import unread
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.05
+
+_pending = deque()
+_pending_ids = set()
+_last_created_at = None
+# Protège la file ; _flush_lock sérialise les insertions (worker et flush())
+_lock = threading.Condition()
+_flush_lock = threading.Lock()
+_worker = None
+_stopping = False
+
+
+def add(conversation, sender, content, message_type='text'):
+    """
+    Met un message en attente d'insertion et le retourne (non encore en
+    base) ; ``conversation.match`` doit être chargé.
+    """
+    global _last_created_at
+    with _lock:
+        created_at = timezone.now()
+        if _last_created_at is not None and created_at <= _last_created_at:
+            # Horloge identique ou reculée : l'ordre de réception est conservé
+            created_at = _last_created_at + timedelta(microseconds=1)
+        _last_created_at = created_at
+
+        message = Message(
+            id=uuid.uuid4(),
+            conversation=conversation,
+            sender=sender,
+            content=content,
+            message_type=message_type,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        _pending.append(message)
+        _pending_ids.add(str(message.id))
+        # Réveil du worker : file jusqu'ici vide, ou lot complet
+        if len(_pending) in (1, settings.CHAT_BUFFER_MAX_BATCH):
+            _lock.notify()
+
+    if settings.CHAT_BUFFER_BACKGROUND:
+        _ensure_worker()
+    return message
+
+
+def is_pending(message_id):
+    """Le message est-il encore en attente d'insertion ?"""
+    with _lock:
+        return str(message_id) in _pending_ids
+
+
+def pending_count():
+    with _lock:
+        return len(_pending)
+
+
+def flush():
+    """Insère tous les messages en attente ; retourne le nombre inséré"""
+    flushed = 0
+    with _flush_lock:
+        while True:
+            batch = _take_batch()
+            if not batch:
+                return flushed
+            flushed += _insert(batch)
+            _release(batch)
+
+
+def _take_batch():
+    """Premiers messages de la file (ils y restent jusqu'à leur insertion)"""
+    with _lock:
+        size = min(len(_pending), settings.CHAT_BUFFER_MAX_BATCH)
+        return [_pending[index] for index in range(size)]
+
+
+def _release(batch):
+    with _lock:
+        for message in batch:
+            _pending.popleft()
+            _pending_ids.discard(str(message.id))
+
+
+def _write(batch):
+    with transaction.atomic():
+        Message.objects.bulk_create(batch)
+        unread.record_messages(batch)
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='chat-message-buffer', daemon=True)
+            _worker.start()
+
+
+def _run():
+    while True:
+        with _lock:
+            if not _pending and not _stopping:
+                _lock.wait()
+            if _stopping:
+                return
+            if len(_pending) < settings.CHAT_BUFFER_MAX_BATCH:
+                # Laisser le lot se remplir pendant l'intervalle de vidage
+                _lock.wait(settings.CHAT_BUFFER_FLUSH_INTERVAL)
+        _flush_with_retry()
+
+
+def _flush_with_retry():
+    with _flush_lock:
+        batch = _take_batch()
+        if batch:
+            _insert(batch, reconnect=True)
+            _release(batch)
+
+
+def _insert(batch, reconnect=False):
+    """
+    Insère le lot en isolant les messages invalides : si le lot échoue, ses
+    deux moitiés sont insérées séparément ; un message seul est réessayé
+    jusqu'à ``MAX_ATTEMPTS`` fois puis abandonné (journalisé). Retourne le
+    nombre de messages insérés.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if reconnect:
+            close_old_connections()
+        try:
+            _write(batch)
+            return len(batch)
+        except Exception:
+            if len(batch) > 1:
+                logger.warning(
+                    "Échec de l'insertion de %d messages, insertion par moitiés", len(batch), exc_info=True
+                )
+                middle = len(batch) // 2
+                return _insert(batch[:middle], reconnect) + _insert(batch[middle:], reconnect)
+            if attempt == MAX_ATTEMPTS:
+                logger.exception("Abandon de l'insertion du message %s", batch[0].id)
+                return 0
+            logger.warning("Échec de l'insertion du message %s, nouvel essai", batch[0].id, exc_info=True)
+            time.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+        finally:
+            if reconnect:
+                close_old_connections()
+
+
+@atexit.register
+def _shutdown():
+    """Arrête le worker et insère les messages encore en attente"""
+    global _stopping
+    with _lock:
+        _stopping = True
+        _lock.notify_all()
+    if _worker is not None:
+        _worker.join(timeout=5)
+    while pending_count():
+        _flush_with_retry()
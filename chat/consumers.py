@@ -1,16 +1,360 @@
+"""
+Consumers WebSocket du chat.
+
+- ``UserConsumer`` (``ws/user/``) : une seule connexion par utilisateur,
+  membre du seul groupe ``user_<id>``. Elle reçoit les messages et accusés
+  de lecture de toutes ses conversations et les nouveaux matches ; le
+  client s'abonne (``subscribe``) aux conversations ouvertes à l'écran pour
+  y écrire et recevoir les indicateurs "en train d'écrire" et de présence.
+- ``ChatConsumer`` (``ws/chat/<conversation_id>/``) : ancienne connexion
+  par conversation, conservée pour les clients existants.
+
+Les événements d'une conversation sont publiés dans les groupes
+``user_<id>`` des deux participants, et dans ``chat_<id>`` tant que
+``CHAT_LEGACY_ROOMS`` est actif.
+"""
+import asyncio
 import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
-from .models import Conversation, Message, TypingStatus
-from accounts.models import User
-from .serializers import MessageSerializer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from .models import Message
+from accounts import presence
+from .projections import message_payload
+from . import buffer as message_buffer, membership, unread
+from .typing_indicators import TypingThrottle
+
+MAX_SUBSCRIPTIONS = 100
+MESSAGE_TYPES = {value for value, _ in Message.MESSAGE_TYPES}
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def room_group(conversation_id):
+    return f'chat_{conversation_id}'
+
+
+class BaseChatConsumer(AsyncWebsocketConsumer):
+    """Présence, envoi de messages, accusés de lecture et publication des événements"""
+    heartbeat_task = None
+
+    async def start_presence(self):
+        """Mettre l'utilisateur en ligne (une connexion de plus) et entretenir la présence"""
+        await self.presence(presence.connect)
+        self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
+
+    async def stop_presence(self):
+        """Une connexion de moins ; retourne True si l'utilisateur reste en ligne"""
+        self.heartbeat_task.cancel()
+        return await self.presence(presence.disconnect)
+
+    async def send_heartbeats(self):
+        """Prolonger la présence de l'utilisateur tant que la connexion est ouverte"""
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            await self.presence(presence.heartbeat)
+
+    async def presence(self, update, user_id=None):
+        """Lire ou mettre à jour la présence (cache seulement, hors du thread de la base)"""
+        return await sync_to_async(update, thread_sensitive=False)(user_id or self.user.id)
+
+    async def publish(self, conversation, event):
+        """Publier un événement aux connexions des deux participants"""
+        event = {**event, 'conversation': str(conversation.id)}
+        match = conversation.match
+        groups = [user_group(match.user1_id), user_group(match.user2_id)]
+        if settings.CHAT_LEGACY_ROOMS:
+            groups.append(room_group(conversation.id))
+        for group in groups:
+            await self.channel_layer.group_send(group, event)
+
+    async def send_chat_message(self, conversation, data):
+        """Diffuser un message tout de suite ; l'insertion en base est différée et groupée"""
+        content = data.get('content', '')
+        message_type = data.get('message_type', 'text')
+
+        # Validé ici : un message invalide ne doit pas atteindre le lot d'insertion
+        if message_type not in MESSAGE_TYPES or not isinstance(content, str):
+            await self.reject(conversation, 'Message invalide')
+            return
+        if not content and message_type == 'text':
+            return
+        if not await self.has_access(conversation):
+            await self.access_revoked(conversation)
+            return
+
+        # Ligne User chargée au premier message (la connexion n'a que les claims du token)
+        sender = await self.user.aload()
+        if sender is None:
+            await self.close()
+            return
+
+        # Présence de l'expéditeur lue dans le cache hors de la boucle d'événements
+        sender_state = await sync_to_async(presence.state, thread_sensitive=False)(sender)
+        message = message_buffer.add(conversation, sender, content, message_type)
+        await self.publish(conversation, {
+            'type': 'chat_message',
+            'message': message_payload(message, sender_state)
+        })
+
+    async def send_read_receipt(self, conversation, data):
+        """Marquer un message reçu (et les précédents) comme lu et notifier l'expéditeur"""
+        message_id = data.get('message_id')
+        if not message_id:
+            return
+        if not await self.has_access(conversation):
+            await self.access_revoked(conversation)
+            return
+
+        if await self.mark_message_read(conversation.id, message_id):
+            await self.publish(conversation, {
+                'type': 'read_receipt',
+                'message_id': message_id,
+                'user_id': str(self.user.id)
+            })
 
+    async def access_revoked(self, conversation):
+        """Le match a été annulé pendant la connexion : la fermer"""
+        await self.close()
+
+    async def reject(self, conversation, error):
+        """Signaler au client un message refusé"""
+        await self.send(text_data=json.dumps({'error': error}))
+
+    async def send_typing(self, conversation, is_typing):
+        await self.publish(conversation, {
+            'type': 'typing',
+            'user_id': str(self.user.id),
+            'is_typing': is_typing,
+            'ttl': settings.TYPING_TTL
+        })
+
+    async def send_user_status(self, conversation, is_online):
+        await self.publish(conversation, {
+            'type': 'user_status',
+            'user_id': str(self.user.id),
+            'is_online': is_online
+        })
+
+    # Accès à la base de données
+
+    @database_sync_to_async
+    def get_conversation(self, conversation_id):
+        """Conversation (identifiants du match) si l'utilisateur en fait partie, sinon None"""
+        return membership.conversation_for(conversation_id, self.user.id)
+
+    @database_sync_to_async
+    def has_access(self, conversation):
+        """Le match est-il toujours actif ? (cache ; annulé par ``unmatch``)"""
+        return membership.is_member(conversation.id, self.user.id)
+
+    @database_sync_to_async
+    def mark_message_read(self, conversation_id, message_id):
+        """Avancer le filigrane de lecture jusqu'à un message reçu"""
+        if message_buffer.is_pending(message_id):
+            # Message diffusé mais pas encore inséré
+            message_buffer.flush()
+        try:
+            message = Message.objects.select_related('conversation__match').exclude(
+                sender_id=self.user.id
+            ).get(id=message_id, conversation_id=conversation_id)
+        except (Message.DoesNotExist, ValidationError):
+            return False
+        return unread.mark_read_through(message.conversation, self.user.id, message.created_at) > 0
+
+
+class UserConsumer(BaseChatConsumer):
+    """
+    Connexion multiplexée de l'utilisateur. Messages du client
+    (``conversation`` requis sauf pour ``ping``) :
+
+    - ``subscribe`` / ``unsubscribe`` : conversation ouverte / fermée ;
+    - ``chat_message``, ``typing``, ``read_receipt`` : dans une conversation
+      souscrite.
+
+    Le serveur répond ``subscribed`` (avec la présence de l'autre
+    participant), ``unsubscribed``, ``pong`` ou ``error`` et envoie les
+    événements : ``chat_message`` et ``read_receipt`` de toutes les
+    conversations, ``typing`` et ``user_status`` des conversations
+    souscrites, ``match_created``.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.subscriptions = {}
+        self.typing_throttles = {}
+
+        # Vérifier que l'utilisateur est authentifié
+        if self.user.is_anonymous:
+            await self.close()
+            return
+
+        # Un seul groupe, quel que soit le nombre de conversations
+        self.group_name = user_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.start_presence()
+
+    async def disconnect(self, close_code):
+        # Connexion refusée dans connect()
+        if self.heartbeat_task is None:
+            return
+
+        is_online = await self.stop_presence()
+        for conversation_id in list(self.subscriptions):
+            await self.unsubscribe(conversation_id, is_online)
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        """Recevoir un message du WebSocket"""
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_json({'type': 'error', 'error': 'Invalid JSON'})
+            return
+        if not isinstance(data, dict):
+            return
+
+        message_type = data.get('type')
+        conversation_id = str(data.get('conversation', ''))
+
+        if message_type == 'ping':
+            await self.presence(presence.heartbeat)
+            await self.send_json({'type': 'pong'})
+            return
+
+        if message_type == 'subscribe':
+            await self.subscribe(conversation_id)
+            return
+
+        if message_type == 'unsubscribe':
+            if conversation_id in self.subscriptions:
+                await self.unsubscribe(conversation_id, True)
+            await self.send_json({'type': 'unsubscribed', 'conversation': conversation_id})
+            return
+
+        conversation = self.subscriptions.get(conversation_id)
+        if conversation is None:
+            await self.send_error(conversation_id, 'Conversation non souscrite')
+            return
+
+        if message_type == 'chat_message':
+            await self.send_chat_message(conversation, data)
+
+        elif message_type == 'typing':
+            # Regroupé, sans base de données
+            await self.typing_throttles[conversation_id].update(bool(data.get('is_typing', False)))
+
+        elif message_type == 'read_receipt':
+            await self.send_read_receipt(conversation, data)
+
+    async def subscribe(self, conversation_id):
+        """S'abonner à une conversation (accès vérifié une seule fois)"""
+        if conversation_id not in self.subscriptions:
+            if len(self.subscriptions) >= MAX_SUBSCRIPTIONS:
+                await self.send_error(conversation_id, 'Trop de conversations souscrites')
+                return
+            conversation = await self.get_conversation(conversation_id)
+            if conversation is None:
+                await self.send_error(conversation_id, 'Conversation non trouvée')
+                return
+            self.subscriptions[conversation_id] = conversation
+            self.typing_throttles[conversation_id] = TypingThrottle(
+                lambda is_typing: self.send_typing(conversation, is_typing)
+            )
+            await self.send_user_status(conversation, True)
+
+        match = self.subscriptions[conversation_id].match
+        other_user_id = match.user2_id if match.user1_id == self.user.id else match.user1_id
+        await self.send_json({
+            'type': 'subscribed',
+            'conversation': conversation_id,
+            'other_user': {
+                'id': str(other_user_id),
+                'is_online': await self.presence(presence.is_online, other_user_id)
+            }
+        })
+
+    async def unsubscribe(self, conversation_id, is_online):
+        conversation = self.subscriptions.pop(conversation_id)
+        await self.typing_throttles.pop(conversation_id).close()
+        if not is_online:
+            await self.send_user_status(conversation, False)
+
+    async def access_revoked(self, conversation):
+        conversation_id = str(conversation.id)
+        if conversation_id in self.subscriptions:
+            await self.unsubscribe(conversation_id, True)
+        await self.send_error(conversation_id, 'Conversation non trouvée')
+
+    async def reject(self, conversation, error):
+        await self.send_error(str(conversation.id), error)
+
+    async def send_json(self, data):
+        await self.send(text_data=json.dumps(data))
+
+    async def send_error(self, conversation_id, error):
+        await self.send_json({'type': 'error', 'conversation': conversation_id, 'error': error})
+
+    # Handlers des événements du groupe user_<id>
+
+    async def chat_message(self, event):
+        """Message d'une conversation de l'utilisateur"""
+        await self.send_json({
+            'type': 'chat_message',
+            'conversation': event['conversation'],
+            'message': event['message']
+        })
+
+    async def read_receipt(self, event):
+        """Accusé de lecture dans une conversation de l'utilisateur"""
+        await self.send_json({
+            'type': 'read_receipt',
+            'conversation': event['conversation'],
+            'message_id': event['message_id'],
+            'user_id': event['user_id']
+        })
+
+    async def typing(self, event):
+        """Statut 'en train d'écrire' de l'autre participant (conversations souscrites)"""
+        if event['conversation'] in self.subscriptions and event['user_id'] != str(self.user.id):
+            await self.send_json({
+                'type': 'typing',
+                'conversation': event['conversation'],
+                'user_id': event['user_id'],
+                'is_typing': event['is_typing'],
+                'ttl': event['ttl']
+            })
+
+    async def user_status(self, event):
+        """Statut en ligne de l'autre participant (conversations souscrites)"""
+        if event['conversation'] in self.subscriptions and event['user_id'] != str(self.user.id):
+            await self.send_json({
+                'type': 'user_status',
+                'conversation': event['conversation'],
+                'user_id': event['user_id'],
+                'is_online': event['is_online']
+            })
+
+    async def match_created(self, event):
+        """Nouveau match (voir matching.pipeline)"""
+        await self.send_json({
+            'type': 'match_created',
+            'match_id': event['match_id'],
+            'other_user_id': event['other_user_id']
+        })
+
+
+class ChatConsumer(BaseChatConsumer):
+    """Connexion par conversation (remplacée par ``UserConsumer``)"""
 
-class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
-        self.room_group_name = f'chat_{self.conversation_id}'
+        self.room_group_name = room_group(self.conversation_id)
         self.user = self.scope['user']
 
         # Vérifier que l'utilisateur est authentifié
@@ -19,8 +363,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Vérifier que l'utilisateur fait partie de cette conversation
-        has_access = await self.check_conversation_access()
-        if not has_access:
+        self.conversation = await self.get_conversation(self.conversation_id)
+        if self.conversation is None:
             await self.close()
             return
 
@@ -32,35 +376,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
-        # Mettre l'utilisateur en ligne
-        await self.set_user_online(True)
+        await self.start_presence()
+        self.typing_throttle = TypingThrottle(
+            lambda is_typing: self.send_typing(self.conversation, is_typing)
+        )
 
         # Notifier les autres utilisateurs que cet utilisateur est en ligne
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'user_id': str(self.user.id),
-                'is_online': True
-            }
-        )
+        await self.send_user_status(self.conversation, True)
 
     async def disconnect(self, close_code):
-        # Mettre l'utilisateur hors ligne
-        await self.set_user_online(False)
+        # Connexion refusée dans connect()
+        if self.heartbeat_task is None:
+            return
+
+        # Une connexion de moins : hors ligne si c'était la dernière
+        is_online = await self.stop_presence()
 
         # Arrêter le statut "en train d'écrire"
-        await self.update_typing_status(False)
+        await self.typing_throttle.close()
 
-        # Notifier que l'utilisateur est hors ligne
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'user_id': str(self.user.id),
-                'is_online': False
-            }
-        )
+        # Notifier le statut de l'utilisateur
+        await self.send_user_status(self.conversation, is_online)
 
         # Quitter le groupe
         await self.channel_layer.group_discard(
@@ -76,51 +412,54 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             if message_type == 'chat_message':
                 # Envoyer un message de chat
-                await self.handle_chat_message(data)
+                await self.send_chat_message(self.conversation, data)
 
             elif message_type == 'typing':
-                # Gérer le statut "en train d'écrire"
-                await self.handle_typing(data)
+                # Gérer le statut "en train d'écrire" (regroupé, sans base de données)
+                await self.typing_throttle.update(bool(data.get('is_typing', False)))
 
             elif message_type == 'read_receipt':
                 # Gérer l'accusé de lecture
-                await self.handle_read_receipt(data)
+                await self.send_read_receipt(self.conversation, data)
 
         except json.JSONDecodeError:
             await self.send(text_data=json.dumps({
                 'error': 'Invalid JSON'
             }))
 
-    async def handle_chat_message(self, data):
-        """Gérer l'envoi d'un message de chat"""
-        content = data.get('content', '')
-        message_type = data.get('message_type', 'text')
-
-        if not content and message_type == 'text':
-            return
-
-        # Sauvegarder le message en base de données
-        message = await self.save_message(content, message_type)
+    # Handlers des événements du groupe
 
-        if message:
-            # Serialiser le message
-            message_data = await self.serialize_message(message)
+    async def chat_message(self, event):
+        """Envoyer un message de chat au WebSocket"""
+        await self.send(text_data=json.dumps({
+            'type': 'chat_message',
+            'message': event['message']
+        }))
 
-            # Envoyer le message au groupe
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': message_data
-                }
-            )
+    async def user_status(self, event):
+        """Envoyer le statut en ligne d'un utilisateur"""
+        # Ne pas renvoyer son propre statut
+        if event['user_id'] != str(self.user.id):
+            await self.send(text_data=json.dumps({
+                'type': 'user_status',
+                'user_id': event['user_id'],
+                'is_online': event['is_online']
+            }))
 
-    async def handle_typing(self, data):
-        """Gérer le statut 'en train d'écrire'"""
-        is_typing = data.get('is_typing', False)
-        
-        # Mettre à jour le statut en base de données
-        await self.update_typing_status(is_typing)
+    async def typing(self, event):
+        """Envoyer le statut 'en train d'écrire'"""
+        if event['user_id'] != str(self.user.id):
+            await self.send(text_data=json.dumps({
+                'type': 'typing',
+                'user_id': event['user_id'],
+                'is_typing': event['is_typing'],
+                'ttl': event['ttl']
+            }))
 
-        # Notifier les autres utilisateurs
-        await self.channel_la
\ No newline at end of file
+    async def read_receipt(self, event):
+        """Envoyer un accusé de lecture"""
+        await self.send(text_data=json.dumps({
+            'type': 'read_receipt',
+            'message_id': event['message_id'],
+            'user_id': event['user_id']
+        }))
@@ -0,0 +1,81 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from chat import buffer as message_buffer, unread
+from chat.models import Conversation, Message
+from chat.projections import message_payload
+from chat.serializers import MessageSerializer
+from config.benchmark import benchmark_database, bulk_create_profiles
+from matching.models import Match
+
+
+class Command(BaseCommand):
+    help = "Débit d'un worker (messages/s) : insertion message par message et tampon d'écriture groupée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000, help="Messages envoyés par scénario")
+        parser.add_argument('--conversations', type=int, default=50)
+        parser.add_argument('--batch', type=int, default=200, help="Taille maximale d'un lot du tampon")
+
+    def handle(self, *args, **options):
+        count = options['messages']
+
+        with benchmark_database(), override_settings(
+            CHAT_BUFFER_BACKGROUND=False, CHAT_BUFFER_MAX_BATCH=options['batch']
+        ):
+            profiles = bulk_create_profiles(2 * options['conversations'])
+            users = [profile.user for profile in profiles]
+            matches = Match.objects.bulk_create([
+                Match(user1=users[index], user2=users[index + 1]) for index in range(0, len(users), 2)
+            ])
+            Conversation.objects.bulk_create([Conversation(match=match) for match in matches])
+            conversations = list(Conversation.objects.select_related('match__user1', 'match__user2'))
+
+            def senders():
+                for index in range(count):
+                    conversation = conversations[index % len(conversations)]
+                    match = conversation.match
+                    yield conversation, match.user1 if index % 2 else match.user2, f'Message {index}'
+
+            def one_by_one():
+                # Ancien chemin du consumer : une transaction par message
+                for conversation, sender, content in senders():
+                    with transaction.atomic():
+                        message = Message.objects.create(
+                            conversation=conversation, sender=sender, content=content
+                        )
+                        unread.record_message(conversation, sender.id)
+                    MessageSerializer(message).data
+
+            broadcast = []
+
+            def buffered():
+                start = time.perf_counter()
+                for conversation, sender, content in senders():
+                    message_payload(message_buffer.add(conversation, sender, content))
+                broadcast.append(time.perf_counter() - start)
+                message_buffer.flush()
+
+            queries = []
+
+            def count_queries(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            for label, func in (('un par un', one_by_one), ('tampon (bulk)', buffered)):
+                queries.clear()
+                with connection.execute_wrapper(count_queries):
+                    start = time.perf_counter()
+                    func()
+                    elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{label:<14} {count / elapsed:10.0f} messages/s "
+                    f"({elapsed * 1000:.1f}ms, {len(queries)} requêtes)"
+                )
+            self.stdout.write(
+                f"{'diffusion':<14} {count / broadcast[0]:10.0f} messages/s "
+                f"(avant insertion, {broadcast[0] * 1000:.1f}ms)"
+            )
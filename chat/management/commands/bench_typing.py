@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from chat.models import Conversation, TypingStatus
+from chat.typing_indicators import TypingThrottle
+from config.benchmark import benchmark_database, bulk_create_profiles
+from matching.models import Match
+
+
+class Command(BaseCommand):
+    help = (
+        "Simule une session de chat (un état \"écrit\" par frappe) et compare les "
+        "requêtes et diffusions de l'ancien TypingStatus et des indicateurs regroupés"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20, help="Messages envoyés pendant la session")
+        parser.add_argument('--keystrokes', type=int, default=25, help="Frappes par message")
+        parser.add_argument('--keystroke-ms', type=float, default=150)
+        parser.add_argument('--pause-ms', type=float, default=2000, help="Pause entre deux messages")
+        parser.add_argument(
+            '--speed', type=float, default=20,
+            help="Accélération du temps simulé (frappes, pauses, intervalle et TTL)"
+        )
+
+    def session(self):
+        """Événements du client : (délai en s avant l'événement, is_typing)"""
+        for _ in range(self.options['messages']):
+            for _ in range(self.options['keystrokes']):
+                yield self.options['keystroke_ms'] / 1000, True
+            yield 0, False
+            yield self.options['pause_ms'] / 1000, None
+
+    def handle(self, *args, **options):
+        self.options = options
+        events = [is_typing for _, is_typing in self.session() if is_typing is not None]
+        speed = options['speed']
+
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with benchmark_database():
+            user, other = [profile.user for profile in bulk_create_profiles(2)]
+            conversation = Conversation.objects.create(match=Match.objects.create(user1=user, user2=other))
+
+            # Ancien chemin : update_or_create à chaque état, et à la déconnexion
+            with connection.execute_wrapper(count_queries):
+                for is_typing in events + [False]:
+                    TypingStatus.objects.update_or_create(
+                        conversation=conversation, user=user, defaults={'is_typing': is_typing}
+                    )
+            old_queries = len(queries)
+
+        broadcasts = []
+
+        async def broadcast(is_typing):
+            broadcasts.append(is_typing)
+
+        async def run():
+            throttle = TypingThrottle(broadcast)
+            for delay, is_typing in self.session():
+                await asyncio.sleep(delay / speed)
+                if is_typing is not None:
+                    await throttle.update(is_typing)
+            await throttle.close()
+
+        queries.clear()
+        with override_settings(
+            TYPING_THROTTLE_INTERVAL=settings.TYPING_THROTTLE_INTERVAL / speed,
+            TYPING_TTL=settings.TYPING_TTL / speed,
+        ), connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            asyncio.run(run())
+            elapsed = (time.perf_counter() - start) * speed
+
+        self.stdout.write(f"Session simulée : {len(events)} états envoyés par le client en {elapsed:.0f}s")
+        self.stdout.write(f"{'TypingStatus':<14} {old_queries:6d} requêtes {len(events) + 1:6d} diffusions")
+        self.stdout.write(f"{'regroupé':<14} {len(queries):6d} requêtes {len(broadcasts):6d} diffusions")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de messages non lus qui ont dérivé (à lancer chaque nuit)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=1000, help="Conversations corrigées par requête")
+
+    def handle(self, *args, **options):
+        fixed = reconcile(batch_size=options['batch'])
+        self.stdout.write(f"{fixed} conversations corrigées")
@@ -0,0 +1,68 @@
+"""
+Cache des participants des conversations, pour autoriser l'écriture dans
+une conversation (REST et WebSocket) sans requête.
+
+``conversation_members:<id>`` contient ``(match_id, user1_id, user2_id)``
+tant que le match est actif, ``()`` sinon. La clé est remplie avec
+``cache.add`` et l'annulation d'un match y écrit ``()`` avec ``cache.set`` :
+une lecture concurrente ne peut pas y remettre l'ancien état, et les
+utilisateurs d'un match annulé perdent l'accès immédiatement, dans tous
+les processus (le cache est partagé : pas de copie locale par processus).
+"""
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from matching.models import Match
+from .models import Conversation
+
+MEMBERS_TIMEOUT = 60 * 60 * 24
+REVOKED = ()
+
+
+def members_key(conversation_id):
+    return f'conversation_members:{conversation_id}'
+
+
+def members(conversation_id):
+    """``(match_id, user1_id, user2_id)`` si le match est actif, sinon None"""
+    key = members_key(conversation_id)
+    entry = cache.get(key)
+    if entry is None:
+        try:
+            entry = Conversation.objects.filter(
+                pk=conversation_id, match__is_active=True
+            ).values_list('match_id', 'match__user1_id', 'match__user2_id').first()
+        except ValidationError:
+            return None
+        entry = tuple(entry) if entry else REVOKED
+        cache.add(key, entry, MEMBERS_TIMEOUT)
+    return entry or None
+
+
+def conversation_for(conversation_id, user_id):
+    """
+    Conversation (non relue en base : identifiants du match seulement) si
+    ``user_id`` y participe et que le match est actif, sinon None. Suffit à
+    ``buffer.add``, ``unread.record_message`` et à sérialiser un nouveau
+    message ; les filigranes de lecture n'y sont pas chargés.
+    """
+    entry = members(conversation_id)
+    if entry is None or user_id not in entry[1:]:
+        return None
+    match_id, user1_id, user2_id = entry
+    return Conversation(
+        pk=Conversation._meta.pk.to_python(conversation_id),
+        match=Match(pk=match_id, user1_id=user1_id, user2_id=user2_id, is_active=True)
+    )
+
+
+def is_member(conversation_id, user_id):
+    entry = members(conversation_id)
+    return entry is not None and user_id in entry[1:]
+
+
+def revoke(conversation_ids):
+    """Coupe l'accès aux conversations après le commit en cours"""
+    keys = [members_key(conversation_id) for conversation_id in conversation_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, REVOKED), MEMBERS_TIMEOUT))
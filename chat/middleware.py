@@ -1,50 +1,90 @@
+"""
+Authentification JWT des WebSockets, sans requête à la connexion.
+
+Le token d'accès (``?token=...``) est vérifié une seule fois : ses claims
+sont gardées dans le cache partagé, sous l'empreinte SHA-256 du token,
+jusqu'à son expiration. Les reconnexions (redéploiement, réseau mobile)
+ne décodent plus le token et ne lisent plus la table ``User`` :
+``scope['user']`` est un ``WebSocketUser`` construit à partir des claims,
+et la ligne ``User`` n'est chargée (``aload``) que lorsqu'un consumer en a
+besoin, au premier message envoyé.
+"""
+import hashlib
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.conf import settings
-from jwt import decode as jwt_decode
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from accounts.models import User
 
 
-@database_sync_to_async
-def get_user(token):
-    """Récupérer l'utilisateur à partir du token JWT"""
-    try:
-        # Valider le token
-        UntypedToken(token)
-        
-        # Décoder le token
-        decoded_data = jwt_decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=["HS256"]
-        )
-        
-        # Récupérer l'utilisateur
-        user_id = decoded_data.get('user_id')
-        if user_id:
-            user = User.objects.get(id=user_id)
-            return user
-    except (InvalidToken, TokenError, User.DoesNotExist):
-        pass
-    
-    return AnonymousUser()
+def token_key(token):
+    return 'ws_token:' + hashlib.sha256(token.encode()).hexdigest()
+
+
+def get_claims(token):
+    """Claims d'un token d'accès valide (cache jusqu'à son expiration), sinon None"""
+    key = token_key(token)
+    claims = cache.get(key)
+    if claims is None:
+        try:
+            claims = AccessToken(token).payload
+        except TokenError:
+            return None
+        if api_settings.USER_ID_CLAIM not in claims:
+            return None
+        cache.set(key, claims, max(int(claims['exp'] - time.time()), 1))
+    if claims['exp'] <= time.time():
+        return None
+    return claims
+
+
+class WebSocketUser(TokenUser):
+    """
+    Utilisateur authentifié par les claims du token : ``id`` sans requête,
+    ``aload()`` pour la ligne ``User`` (None si supprimé ou désactivé)
+    """
+
+    def __init__(self, claims):
+        super().__init__(claims)
+        self._user = None
+
+    @cached_property
+    def id(self):
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    async def aload(self):
+        if self._user is None:
+            self._user = await database_sync_to_async(
+                User.objects.filter(pk=self.id, is_active=True).first
+            )()
+        return self._user
 
 
 class JWTAuthMiddleware(BaseMiddleware):
     """Middleware pour l'authentification JWT dans les WebSockets"""
-    
+
     async def __call__(self, scope, receive, send):
         # Récupérer le token depuis les query parameters
         query_string = scope.get('query_string', b'').decode()
-        params = dict(qp.split('=') for qp in query_string.split('&') if '=' in qp)
-        token = params.get('token')
-        
+        token = parse_qs(query_string).get('token', [None])[0]
+
+        claims = None
         if token:
-            scope['user'] = await get_user(token)
-        else:
-            scope['user'] = AnonymousUser()
-        
-        return await super().__call__(scope, receive, send)
\ No newline at end of file
+            # Cache seulement, hors du thread de la base
+            claims = await sync_to_async(get_claims, thread_sensitive=False)(token)
+        scope['user'] = WebSocketUser(claims) if claims else AnonymousUser()
+
+        return await super().__call__(scope, receive, send)
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:48
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+
+    unread = defaultdict(list)
+    for conversation_id, sender_id, count in Message.objects.filter(is_read=False).values_list(
+        'conversation_id', 'sender_id'
+    ).annotate(count=Count('id')).order_by().iterator():
+        unread[conversation_id].append((sender_id, count))
+
+    for conversation in Conversation.objects.filter(pk__in=unread).select_related('match'):
+        match = conversation.match
+        senders = unread[conversation.pk]
+        conversation.user1_unread = sum(count for sender_id, count in senders if sender_id != match.user1_id)
+        conversation.user2_unread = sum(count for sender_id, count in senders if sender_id != match.user2_id)
+        conversation.save(update_fields=['user1_unread', 'user2_unread'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user1_unread',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user2_unread',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
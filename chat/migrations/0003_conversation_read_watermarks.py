@@ -0,0 +1,83 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:12
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Max, Q
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+
+    # Dernier message lu de chaque expéditeur, par conversation
+    read = defaultdict(dict)
+    for conversation_id, sender_id, through, read_at in Message.objects.filter(is_read=True).values_list(
+        'conversation_id', 'sender_id'
+    ).annotate(through=Max('created_at'), last_read_at=Max('read_at')).order_by().iterator():
+        read[conversation_id][sender_id] = (through, read_at)
+
+    for conversation in Conversation.objects.filter(pk__in=read).select_related('match').iterator():
+        match = conversation.match
+        senders = read[conversation.pk]
+        # Le filigrane d'un participant est le dernier message de l'autre qu'il a lu
+        for reader, sender_id in (('user1', match.user2_id), ('user2', match.user1_id)):
+            through, read_at = senders.get(sender_id, (None, None))
+            setattr(conversation, f'{reader}_read_through', through)
+            setattr(conversation, f'{reader}_read_at', read_at or through)
+            unread = Message.objects.filter(conversation=conversation, sender_id=sender_id)
+            if through is not None:
+                unread = unread.filter(created_at__gt=through)
+            setattr(conversation, f'{reader}_unread', unread.count())
+        conversation.save(update_fields=[
+            'user1_read_through', 'user1_read_at', 'user1_unread',
+            'user2_read_through', 'user2_read_at', 'user2_unread',
+        ])
+
+
+def restore_is_read(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+
+    for conversation in Conversation.objects.select_related('match').filter(
+        Q(user1_read_through__isnull=False) | Q(user2_read_through__isnull=False)
+    ).iterator():
+        match = conversation.match
+        for reader, sender_id in (('user1', match.user2_id), ('user2', match.user1_id)):
+            through = getattr(conversation, f'{reader}_read_through')
+            if through is not None:
+                Message.objects.filter(
+                    conversation=conversation, sender_id=sender_id,
+                    created_at__lte=through, is_read=False
+                ).update(is_read=True, read_at=getattr(conversation, f'{reader}_read_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_conversation_unread_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='user1_read_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user1_read_through',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user2_read_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user2_read_through',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_read_watermarks, restore_is_read),
+    ]
@@ -1,8 +1,29 @@
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, When
+from django.utils import timezone
 from accounts.models import User
 from matching.models import Match
 import uuid
 
+class ConversationQuerySet(models.QuerySet):
+    def for_inbox(self, user):
+        """
+        Annote ``last_message_id`` (sous-requête corrélée sur l'index
+        ``(conversation, created_at)``) et ``unread_count`` (compteur de
+        ``user``) et charge le match et ses deux utilisateurs : la boîte de
+        réception coûte un nombre fixe de requêtes quel que soit le nombre de
+        conversations.
+        """
+        messages = Message.objects.filter(conversation=OuterRef('pk'))
+        return self.select_related('match__user1', 'match__user2').annotate(
+            last_message_id=Subquery(messages.order_by('-created_at', '-id').values('id')[:1]),
+            unread_count=Case(
+                When(match__user1=user, then=F('user1_unread')),
+                default=F('user2_unread'),
+            ),
+        )
+
+
 class Conversation(models.Model):
     """Conversation entre deux utilisateurs matchés"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -10,6 +31,19 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Filigranes de lecture de match.user1 / match.user2 : date du dernier
+    # message lu et date de la lecture (voir chat.unread)
+    user1_read_through = models.DateTimeField(null=True, blank=True, editable=False)
+    user1_read_at = models.DateTimeField(null=True, blank=True, editable=False)
+    user2_read_through = models.DateTimeField(null=True, blank=True, editable=False)
+    user2_read_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Messages non lus par match.user1 / match.user2 (voir chat.unread)
+    user1_unread = models.PositiveIntegerField(default=0, editable=False)
+    user2_unread = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ConversationQuerySet.as_manager()
+
     def __str__(self):
         return f"Conversation: {self.match}"
 
@@ -33,10 +67,14 @@ class Message(models.Model):
     content = models.TextField(blank=True)  # Pour les messages texte
     file = models.FileField(upload_to='chat_files/%Y/%m/%d/', blank=True, null=True)
     
+    # Obsolètes : l'état de lecture est déduit des filigranes de la
+    # conversation (chat.unread.read_state) ; colonnes conservées pour
+    # les anciens clients et le retour arrière de la migration
     is_read = models.BooleanField(default=False)
     read_at = models.DateTimeField(null=True, blank=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Horodaté à la réception (voir chat.buffer), pas à l'insertion
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -51,7 +89,10 @@ class Message(models.Model):
 
 
 class TypingStatus(models.Model):
-    """Statut "en train d'écrire" """
+    """
+    Statut "en train d'écrire" ; plus écrit par le WebSocket, les
+    indicateurs passent par le channel layer (voir chat.typing_indicators)
+    """
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='typing_statuses')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     is_typing = models.BooleanField(default=False)
@@ -0,0 +1,84 @@
+"""
+Pagination de la boîte de réception et de l'historique des messages.
+
+L'historique est paginé par curseur : ``before=<id>`` (messages plus anciens que ce message),
+``after=<id>`` (messages plus récents) et ``limit``. Sans curseur, la page
+contient les messages les plus récents. Les pages sont lues par keyset sur
+``(created_at, id)`` via l'index ``(conversation, created_at)``, borné par
+``created_at`` (``<=`` / ``>=`` le curseur) : le coût d'une page ne dépend
+ni de la longueur de la conversation ni de la position (pas d'OFFSET).
+Les messages sont toujours renvoyés dans l'ordre chronologique.
+"""
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+class InboxPagination(PageNumberPagination):
+    """Boîte de réception : 50 conversations par page"""
+    page_size = 50
+
+
+class MessageCursorPagination(BasePagination):
+    default_limit = 50
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        self.limit = self.get_limit(request)
+        before, after = params.get('before'), params.get('after')
+
+        if after:
+            created_at, message_id = self.get_position(queryset, after)
+            page = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=message_id),
+                # Borne de l'index : le OR seul n'en est pas une
+                created_at__gte=created_at,
+            ).order_by('created_at', 'id')[:self.limit + 1])
+            self.has_newer = len(page) > self.limit
+            self.has_older = True
+            return page[:self.limit]
+
+        if before:
+            created_at, message_id = self.get_position(queryset, before)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=message_id),
+                created_at__lte=created_at,
+            )
+        page = list(queryset.order_by('-created_at', '-id')[:self.limit + 1])
+        self.has_older = len(page) > self.limit
+        self.has_newer = bool(before)
+        return page[:self.limit][::-1]
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def get_position(self, queryset, message_id):
+        """``(created_at, id)`` du message servant de curseur"""
+        try:
+            return queryset.values_list('created_at', 'id').get(id=message_id)
+        except (queryset.model.DoesNotExist, ValidationError):
+            raise NotFound('Curseur invalide')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'results': data,
+            'has_older': self.has_older,
+            'has_newer': self.has_newer,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'results': schema,
+                'has_older': {'type': 'boolean'},
+                'has_newer': {'type': 'boolean'},
+            },
+        }
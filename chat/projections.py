@@ -0,0 +1,29 @@
+"""
+Sérialisation rapide des messages diffusés par WebSocket : même JSON que
+``MessageSerializer`` (voir ``accounts.projections``), sans instancier de
+serializers DRF pour chaque message.
+"""
+from accounts.projections import file_url, format_datetime, user_payload
+from .unread import read_state
+
+
+def message_payload(message, sender_state=None):
+    """
+    Équivalent de ``MessageSerializer(message).data``, identifiants en
+    chaînes (``message.conversation.match`` doit être chargé) ;
+    ``sender_state`` est la présence préchargée de l'expéditeur (lue dans
+    le cache sinon : à précharger hors de la boucle d'événements)
+    """
+    is_read, read_at = read_state(message)
+    return {
+        'id': str(message.id),
+        'conversation': str(message.conversation_id),
+        'sender': user_payload(message.sender, sender_state),
+        'message_type': message.message_type,
+        'content': message.content,
+        'file': file_url(message.file),
+        'is_read': is_read,
+        'read_at': format_datetime(read_at),
+        'created_at': format_datetime(message.created_at),
+        'updated_at': format_datetime(message.updated_at),
+    }
@@ -2,5 +2,8 @@ from django.urls import re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    # Connexion unique de l'utilisateur, multiplexée sur ses conversations
+    re_path(r'ws/user/$', consumers.UserConsumer.as_asgi()),
+    # Ancienne connexion par conversation
     re_path(r'ws/chat/(?P<conversation_id>[0-9a-f-]+)/$', consumers.ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
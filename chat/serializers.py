@@ -1,11 +1,19 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Conversation, Message, TypingStatus
+from .unread import read_state
+from accounts import presence
 from accounts.serializers import UserSerializer
 
 
 class MessageSerializer(serializers.ModelSerializer):
-    """Serializer pour les messages"""
+    """
+    Serializer pour les messages ; ``is_read`` / ``read_at`` sont déduits du
+    filigrane de lecture du destinataire (charger ``conversation__match``).
+    """
     sender = UserSerializer(read_only=True)
+    is_read = serializers.SerializerMethodField()
+    read_at = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
@@ -15,9 +23,21 @@ class MessageSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'sender', 'created_at', 'updated_at']
 
+    def get_is_read(self, obj):
+        return read_state(obj)[0]
+
+    def get_read_at(self, obj):
+        read_at = read_state(obj)[1]
+        return serializers.DateTimeField().to_representation(read_at) if read_at else None
+
 
 class MessageCreateSerializer(serializers.ModelSerializer):
-    """Serializer pour créer un message"""
+    """
+    Serializer pour créer un message ; la conversation est un identifiant,
+    son accès est vérifié par la vue (voir chat.membership)
+    """
+    conversation = serializers.UUIDField()
+
     class Meta:
         model = Message
         fields = ['conversation', 'message_type', 'content', 'file']
@@ -36,8 +56,36 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class ConversationListSerializer(serializers.ListSerializer):
+    """
+    Charge les derniers messages de toute la page en une seule requête, et
+    la présence des participants en un seul ``get_many``
+    """
+
+    def to_representation(self, data):
+        conversations = list(data.all() if isinstance(data, models.Manager) else data)
+        last_messages = Message.objects.select_related('sender').in_bulk([
+            conversation.last_message_id for conversation in conversations
+            if getattr(conversation, 'last_message_id', None)
+        ])
+        # Conversation déjà chargée : état de lecture sans requête supplémentaire
+        for conversation in conversations:
+            last_message = last_messages.get(conversation.last_message_id)
+            if last_message is not None:
+                last_message.conversation = conversation
+        self.context['last_messages'] = last_messages
+        self.context['presence'] = presence.states(
+            user for conversation in conversations
+            for user in (conversation.match.user1, conversation.match.user2)
+        )
+        return super().to_representation(conversations)
+
+
 class ConversationSerializer(serializers.ModelSerializer):
-    """Serializer pour les conversations"""
+    """
+    Serializer pour les conversations ; les conversations doivent être
+    chargées avec ``Conversation.objects.for_inbox(user)``.
+    """
     last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
     other_user = serializers.SerializerMethodField()
@@ -46,21 +94,25 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = Conversation
         fields = ['id', 'match', 'last_message', 'unread_count', 'other_user', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+        list_serializer_class = ConversationListSerializer
 
     def get_last_message(self, obj):
-        last_message = obj.messages.last()
-        if last_message:
-            return MessageSerializer(last_message).data
-        return None
+        if obj.last_message_id is None:
+            return None
+        last_messages = self.context.get('last_messages', {})
+        last_message = last_messages.get(obj.last_message_id)
+        if last_message is None:
+            last_message = Message.objects.select_related('sender').get(pk=obj.last_message_id)
+            last_message.conversation = obj
+        return MessageSerializer(last_message, context=self.context).data
 
     def get_unread_count(self, obj):
-        request_user = self.context.get('request').user
-        return obj.messages.filter(is_read=False).exclude(sender=request_user).count()
+        return obj.unread_count
 
     def get_other_user(self, obj):
         request_user = self.context.get('request').user
         other_user = obj.match.get_other_user(request_user)
-        return UserSerializer(other_user).data
+        return UserSerializer(other_user, context=self.context).data
 
 
 class TypingStatusSerializer(serializers.ModelSerializer):
@@ -1,11 +1,27 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete
 from django.dispatch import receiver
-from matching.models import Match
+from matching.signals import matches_created, matches_ended
+from . import membership
 from .models import Conversation
 
 
-@receiver(post_save, sender=Match)
-def create_conversation(sender, instance, created, **kwargs):
-    """Créer automatiquement une conversation quand il y a un match"""
-    if created:
-        Conversation.objects.create(match=instance)
\ No newline at end of file
+@receiver(matches_created)
+def create_conversations(sender, matches, **kwargs):
+    """Créer les conversations des nouveaux matches (idempotent)"""
+    Conversation.objects.bulk_create(
+        [Conversation(match=match) for match in matches],
+        ignore_conflicts=True
+    )
+
+
+@receiver(matches_ended)
+def revoke_conversations(sender, matches, **kwargs):
+    """Couper l'accès aux conversations des matches annulés"""
+    membership.revoke(
+        Conversation.objects.filter(match__in=matches).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Conversation)
+def revoke_deleted_conversation(sender, instance, **kwargs):
+    membership.revoke([instance.pk])
@@ -1,3 +1,624 @@
-from django.test import TestCase
+import asyncio
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from accounts import presence
+from accounts.tests import create_profile
+from matching.models import Match
+from . import buffer as message_buffer
+from .middleware import JWTAuthMiddleware, WebSocketUser
+from .models import Conversation, Message
+from .projections import message_payload
+from .routing import websocket_urlpatterns
+from .serializers import MessageSerializer
+from .typing_indicators import TypingThrottle
+from .unread import mark_read_through, reconcile
+
+
+def create_conversation(user, other_user):
+    """Crée le match et la conversation de deux utilisateurs"""
+    user1, user2 = sorted([user, other_user], key=lambda u: u.id)
+    return Conversation.objects.create(match=Match.objects.create(user1=user1, user2=user2))
+
+
+def create_messages(conversation, senders, count, start=None):
+    """Crée ``count`` messages espacés d'une seconde, en alternant les expéditeurs"""
+    start = start or timezone.now() - timedelta(days=1)
+    messages = Message.objects.bulk_create([
+        Message(conversation=conversation, sender=senders[index % len(senders)], content=f'Message {index}')
+        for index in range(count)
+    ])
+    for index, message in enumerate(messages):
+        message.created_at = start + timedelta(seconds=index)
+    Message.objects.bulk_update(messages, ['created_at'])
+    return messages
+
+
+class MessageHistoryTests(TestCase):
+    """Historique des messages paginé par curseur"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com').user
+        self.bob = create_profile('bob@example.com').user
+        self.conversation = create_conversation(self.alice, self.bob)
+        self.messages = create_messages(self.conversation, [self.alice, self.bob], 30)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def history(self, **params):
+        response = self.client.get(
+            '/api/chat/messages/', {'conversation': str(self.conversation.id), **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data):
+        return [message['id'] for message in data['results']]
+
+    def expected(self, start, stop):
+        return [str(message.id) for message in self.messages[start:stop]]
+
+    def test_latest_page(self):
+        data = self.history(limit=10)
+        self.assertEqual(self.ids(data), self.expected(20, 30))
+        self.assertEqual((data['has_older'], data['has_newer']), (True, False))
+
+    def test_scroll_back_and_forward(self):
+        data = self.history(before=str(self.messages[20].id), limit=15)
+        self.assertEqual(self.ids(data), self.expected(5, 20))
+        self.assertEqual((data['has_older'], data['has_newer']), (True, True))
+
+        data = self.history(before=str(self.messages[5].id), limit=15)
+        self.assertEqual(self.ids(data), self.expected(0, 5))
+        self.assertFalse(data['has_older'])
+
+        data = self.history(after=str(self.messages[24].id), limit=10)
+        self.assertEqual(self.ids(data), self.expected(25, 30))
+        self.assertEqual((data['has_older'], data['has_newer']), (True, False))
+
+    def test_same_timestamp_is_not_skipped(self):
+        Message.objects.filter(pk__in=[m.pk for m in self.messages[10:20]]).update(
+            created_at=self.messages[10].created_at
+        )
+        seen = []
+        cursor = {}
+        while True:
+            data = self.history(limit=4, **cursor)
+            seen = self.ids(data) + seen
+            if not data['has_older']:
+                break
+            cursor = {'before': data['results'][0]['id']}
+        self.assertCountEqual(seen, self.expected(0, 30))
+        self.assertEqual(len(seen), 30)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/chat/messages/', {
+            'conversation': str(self.conversation.id), 'before': 'pas-un-uuid'
+        })
+        self.assertEqual(response.status_code, 404)
+
+    def test_query_count_does_not_depend_on_position(self):
+        create_messages(self.conversation, [self.bob], 500, start=timezone.now() - timedelta(days=2))
+        # message curseur, puis page (messages + expéditeurs)
+        with self.assertNumQueries(2):
+            self.history(before=str(self.messages[15].id), limit=20)
+
+    @skipUnless(connection.vendor == 'sqlite', "plan d'exécution propre à SQLite")
+    def test_cursor_bounds_index_search(self):
+        for params, bound in [({'before': self.messages[15].id}, 'created_at<'), ({'after': self.messages[15].id}, 'created_at>')]:
+            with CaptureQueriesContext(connection) as queries:
+                self.history(limit=5, **params)
+            with connection.cursor() as cursor:
+                page_sql = next(query['sql'] for query in queries if 'LIMIT 6' in query['sql'])
+                cursor.execute('EXPLAIN QUERY PLAN ' + page_sql)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            # Recherche dans l'index à partir du curseur, pas un parcours des messages plus récents
+            self.assertIn(f'(conversation_id=? AND {bound}', plan)
+
+
+class InboxTests(TestCase):
+    """Boîte de réception en un nombre fixe de requêtes"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+        self.conversations = []
+        for index in range(50):
+            other = create_profile(f'user{index}@example.com', photos=0).user
+            conversation = create_conversation(self.alice, other)
+            create_messages(conversation, [other, self.alice, other], 3)
+            self.conversations.append((conversation, other))
+        # Messages insérés en lot : compteurs recalculés
+        reconcile()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_inbox(self):
+        conversation, other = self.conversations[0]
+        self.client.post('/api/chat/messages/mark_all_read/', {'conversation': str(conversation.id)})
+
+        # count de pagination, conversations (annotées) + match + utilisateurs, derniers messages
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/chat/conversations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 50)
+
+        inbox = {item['id']: item for item in response.data['results']}
+        for conversation, other in self.conversations[:20]:
+            item = inbox[str(conversation.id)]
+            last = conversation.messages.order_by('created_at').last()
+            self.assertEqual(item['last_message']['id'], str(last.id))
+            self.assertEqual(item['other_user']['id'], str(other.id))
+        self.assertEqual(inbox[str(self.conversations[0][0].id)]['unread_count'], 0)
+        self.assertEqual(inbox[str(self.conversations[1][0].id)]['unread_count'], 2)
+
+    def test_retrieve(self):
+        conversation, other = self.conversations[0]
+        response = self.client.get(f'/api/chat/conversations/{conversation.id}/')
+        self.assertEqual(response.data['unread_count'], 2)
+        self.assertEqual(response.data['last_message']['sender']['id'], str(other.id))
+
+
+class UnreadCounterTests(TestCase):
+    """Compteurs de non lus par participant"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+        self.bob = create_profile('bob@example.com', photos=0).user
+        self.conversation = create_conversation(self.alice, self.bob)
+        self.client = APIClient()
+
+    def send(self, sender, content):
+        self.client.force_authenticate(sender)
+        response = self.client.post('/api/chat/messages/', {
+            'conversation': str(self.conversation.id), 'message_type': 'text', 'content': content
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def unread(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get(f'/api/chat/conversations/{self.conversation.id}/')
+        return response.data['unread_count']
+
+    def test_counters_follow_messages_and_reads(self):
+        first = self.send(self.alice, 'Salut')
+        self.send(self.alice, 'Ça va ?')
+        self.send(self.bob, 'Oui !')
+        self.assertEqual((self.unread(self.alice), self.unread(self.bob)), (1, 2))
+
+        self.client.force_authenticate(self.bob)
+        self.client.post(f'/api/chat/messages/{first}/mark_read/?conversation={self.conversation.id}')
+        self.client.post(f'/api/chat/messages/{first}/mark_read/?conversation={self.conversation.id}')
+        self.assertEqual(self.unread(self.bob), 1)
+
+        response = self.client.post(
+            '/api/chat/messages/mark_all_read/', {'conversation': str(self.conversation.id)}
+        )
+        self.assertEqual(response.data['status'], '1 messages marqués comme lus')
+        self.assertEqual((self.unread(self.alice), self.unread(self.bob)), (1, 0))
+
+    def test_reconcile_repairs_drift(self):
+        self.send(self.alice, 'Salut')
+        create_messages(self.conversation, [self.bob], 3)
+        Conversation.objects.filter(pk=self.conversation.pk).update(user2_unread=7)
+
+        self.assertEqual(reconcile(), 1)
+        conversation = Conversation.objects.select_related('match').get(pk=self.conversation.pk)
+        counters = {
+            conversation.match.user1_id: conversation.user1_unread,
+            conversation.match.user2_id: conversation.user2_unread,
+        }
+        self.assertEqual(counters, {self.alice.id: 3, self.bob.id: 1})
+        self.assertEqual(reconcile(), 0)
+
+    def test_watermark_reads_earlier_messages(self):
+        messages = create_messages(self.conversation, [self.alice, self.bob, self.alice], 30)
+        reconcile()
+        self.client.force_authenticate(self.bob)
+
+        # verrou et filigrane, comptage, mise à jour (+ savepoint) : indépendant du nombre de messages
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                f'/api/chat/messages/{messages[18].id}/mark_read/?conversation={self.conversation.id}'
+            )
+        self.assertTrue(response.data['is_read'])
+        self.assertEqual(self.unread(self.bob), 7)
+
+        response = self.client.get('/api/chat/messages/', {'conversation': str(self.conversation.id)})
+        read = {message['id']: message['is_read'] for message in response.data['results']}
+        for index, message in enumerate(messages):
+            if message.sender_id == self.alice.id:
+                self.assertEqual(read[str(message.id)], index <= 18)
+
+        # Le filigrane ne recule pas ; les messages eux-mêmes ne sont pas modifiés
+        self.client.post(f'/api/chat/messages/{messages[0].id}/mark_read/?conversation={self.conversation.id}')
+        self.assertEqual(self.unread(self.bob), 7)
+        self.assertFalse(Message.objects.filter(is_read=True).exists())
+
+
+class MembershipTests(TestCase):
+    """Accès aux conversations vérifié dans le cache des participants"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+        self.bob = create_profile('bob@example.com', photos=0).user
+        self.conversation = create_conversation(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def send(self, conversation_id=None):
+        return self.client.post('/api/chat/messages/', {
+            'conversation': str(conversation_id or self.conversation.id), 'content': 'Salut'
+        })
+
+    def test_access_check_is_cached(self):
+        self.assertEqual(self.send().status_code, 201)
+        # Insertion et compteur (dans un savepoint) : aucune requête pour l'accès
+        with self.assertNumQueries(4):
+            self.assertEqual(self.send().status_code, 201)
+
+    def test_outsiders_are_refused(self):
+        carol = create_profile('carol@example.com', photos=0).user
+        self.client.force_authenticate(carol)
+        self.assertEqual(self.send().status_code, 403)
+        self.assertEqual(self.send('00000000-0000-0000-0000-000000000000').status_code, 404)
+
+    def test_unmatch_cuts_off_access(self):
+        self.assertEqual(self.send().status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/matching/matches/{self.conversation.match_id}/unmatch/')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.send().status_code, 404)
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.send().status_code, 404)
+
+
+@override_settings(CHAT_BUFFER_BACKGROUND=False, CHAT_BUFFER_MAX_BATCH=4)
+class MessageBufferTests(TestCase):
+    """Messages WebSocket diffusés puis insérés par lots"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+        self.bob = create_profile('bob@example.com', photos=0).user
+        conversation = create_conversation(self.alice, self.bob)
+        self.conversation = Conversation.objects.select_related('match').get(pk=conversation.pk)
+        self.addCleanup(message_buffer.flush)
+
+    def add(self, sender, count):
+        return [
+            message_buffer.add(self.conversation, sender, f'Message {index}')
+            for index in range(count)
+        ]
+
+    def counters(self):
+        conversation = Conversation.objects.select_related('match').get(pk=self.conversation.pk)
+        return {
+            conversation.match.user1_id: conversation.user1_unread,
+            conversation.match.user2_id: conversation.user2_unread,
+        }
+
+    def test_flush_keeps_order_and_counters(self):
+        sent = self.add(self.alice, 5) + self.add(self.bob, 4)
+        self.assertFalse(Message.objects.exists())
+        self.assertTrue(message_buffer.is_pending(str(sent[0].id)))
+
+        # 3 lots : insertion groupée, verrou des conversations, compteurs
+        with self.assertNumQueries(3 * 3 + 6):
+            self.assertEqual(message_buffer.flush(), 9)
+        self.assertEqual(message_buffer.pending_count(), 0)
+
+        stored = list(self.conversation.messages.order_by('created_at', 'id'))
+        self.assertEqual([message.id for message in stored], [message.id for message in sent])
+        self.assertEqual(len({message.created_at for message in stored}), 9)
+        self.assertEqual(self.counters(), {self.alice.id: 4, self.bob.id: 5})
+
+    def test_messages_read_before_insertion_are_not_counted(self):
+        pending = self.add(self.alice, 2)
+        # Bob lit un message plus récent (envoyé par l'API) avant l'insertion du lot
+        later = Message.objects.create(conversation=self.conversation, sender=self.alice, content='API')
+        mark_read_through(self.conversation, self.bob.id, later.created_at)
+        message_buffer.flush()
+        self.assertEqual(self.counters(), {self.alice.id: 0, self.bob.id: 0})
+        self.assertTrue(message_payload(pending[0])['is_read'])
+
+        self.add(self.alice, 1)
+        message_buffer.flush()
+        self.assertEqual(self.counters(), {self.alice.id: 0, self.bob.id: 1})
+
+    def test_invalid_message_does_not_drop_batch(self):
+        carol = create_profile('carol@example.com', photos=0).user
+        other = Conversation.objects.select_related('match').get(pk=create_conversation(self.bob, carol).pk)
+
+        valid = [
+            message_buffer.add(self.conversation, self.alice, 'Avant'),
+            message_buffer.add(other, carol, 'Autre conversation'),
+        ]
+        # Refusé par la base (content NOT NULL) : seul ce message est perdu
+        message_buffer.add(self.conversation, self.alice, None)
+        valid.append(message_buffer.add(self.conversation, self.bob, 'Après'))
+
+        with mock.patch.object(message_buffer, 'RETRY_DELAY', 0), self.assertLogs('chat.buffer', 'WARNING'):
+            self.assertEqual(message_buffer.flush(), 3)
+        self.assertEqual(message_buffer.pending_count(), 0)
+        self.assertEqual(
+            set(Message.objects.values_list('id', flat=True)), {message.id for message in valid}
+        )
+        self.assertEqual(self.counters(), {self.alice.id: 1, self.bob.id: 1})
+
+    def test_payload_matches_serializer(self):
+        message = self.add(self.alice, 1)[0]
+        message_buffer.flush()
+        message = Message.objects.select_related('sender', 'conversation__match').get(pk=message.pk)
+        self.assertEqual(
+            JSONRenderer().render(message_payload(message)),
+            JSONRenderer().render(MessageSerializer(message).data)
+        )
+
+
+@override_settings(TYPING_THROTTLE_INTERVAL=0.05, TYPING_TTL=0.2)
+class TypingThrottleTests(TestCase):
+    """Indicateurs "en train d'écrire" regroupés, sans base de données"""
+
+    def run_session(self, steps):
+        broadcasts = []
+
+        async def broadcast(is_typing):
+            broadcasts.append(is_typing)
+
+        async def session():
+            throttle = TypingThrottle(broadcast)
+            for delay, is_typing in steps:
+                await asyncio.sleep(delay)
+                if is_typing is None:
+                    await throttle.close()
+                else:
+                    await throttle.update(is_typing)
+
+        with self.assertNumQueries(0):
+            async_to_sync(session)()
+        return broadcasts
+
+    def test_keystrokes_are_coalesced(self):
+        # 10 frappes en 40 ms puis envoi : un début, un arrêt
+        steps = [(0.004, True)] * 10 + [(0, False), (0.1, None)]
+        self.assertEqual(self.run_session(steps), [True, False])
+
+    def test_long_typing_is_refreshed_then_expires(self):
+        # Frappes pendant 0,3 s : prolongé après TTL/2, puis arrêt par expiration
+        steps = [(0.02, True)] * 15 + [(0.35, None)]
+        broadcasts = self.run_session(steps)
+        self.assertEqual(broadcasts[-1], False)
+        self.assertEqual(set(broadcasts[:-1]), {True})
+        self.assertGreaterEqual(len(broadcasts[:-1]), 2)
+        self.assertLess(len(broadcasts), 15)
+
+    def test_close_stops_typing(self):
+        self.assertEqual(self.run_session([(0, True), (0, None)]), [True, False])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_BUFFER_BACKGROUND=False,
+    PRESENCE_FLUSH_BACKGROUND=False,
+)
+class UserConsumerTests(TransactionTestCase):
+    """Connexion WebSocket unique, multiplexée sur les conversations de l'utilisateur"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+        self.bob = create_profile('bob@example.com', photos=0).user
+        self.conversation = create_conversation(self.alice, self.bob)
+        self.addCleanup(presence.flush)
+        self.addCleanup(message_buffer.flush)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), f'/ws/user/?token={AccessToken.for_user(user)}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator, expected_type):
+        while True:
+            event = await communicator.receive_json_from()
+            if event['type'] == expected_type:
+                return event
+
+    def test_multiplexed_session(self):
+        async_to_sync(self.session)()
+
+    async def session(self):
+        conversation_id = str(self.conversation.id)
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+
+        # Écrire dans une conversation non souscrite est refusé
+        await alice.send_json_to({'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut'})
+        self.assertEqual((await self.receive(alice, 'error'))['error'], 'Conversation non souscrite')
+
+        await alice.send_json_to({'type': 'subscribe', 'conversation': conversation_id})
+        subscribed = await self.receive(alice, 'subscribed')
+        self.assertEqual(subscribed['other_user'], {'id': str(self.bob.id), 'is_online': True})
+
+        # Type invalide refusé avant la mise en attente
+        await alice.send_json_to({
+            'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut', 'message_type': 'x' * 20
+        })
+        self.assertEqual((await self.receive(alice, 'error'))['error'], 'Message invalide')
+        self.assertEqual(message_buffer.pending_count(), 0)
+
+        # Les messages arrivent sur la connexion de Bob sans souscription
+        await alice.send_json_to({'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut'})
+        event = await self.receive(bob, 'chat_message')
+        self.assertEqual(event['conversation'], conversation_id)
+        self.assertEqual(event['message']['content'], 'Salut')
+
+        # Les indicateurs seulement dans les conversations souscrites
+        await alice.send_json_to({'type': 'typing', 'conversation': conversation_id, 'is_typing': True})
+        self.assertTrue(await bob.receive_nothing(0.1))
+        await bob.send_json_to({'type': 'subscribe', 'conversation': conversation_id})
+        await self.receive(bob, 'subscribed')
+        self.assertTrue((await self.receive(alice, 'user_status'))['is_online'])
+        await alice.send_json_to({'type': 'typing', 'conversation': conversation_id, 'is_typing': False})
+        self.assertFalse((await self.receive(bob, 'typing'))['is_typing'])
+
+        # Nouveau match poussé par matching.pipeline dans le groupe user_<id>
+        await get_channel_layer().group_send(f'user_{self.bob.id}', {
+            'type': 'match.created', 'match_id': 'm1', 'other_user_id': str(self.alice.id)
+        })
+        self.assertEqual((await self.receive(bob, 'match_created'))['match_id'], 'm1')
+
+        # Une seule appartenance de groupe par connexion
+        groups = get_channel_layer().groups
+        self.assertEqual(
+            {name: len(channels) for name, channels in groups.items() if channels},
+            {f'user_{self.alice.id}': 1, f'user_{self.bob.id}': 1}
+        )
+
+        await bob.disconnect()
+        self.assertFalse((await self.receive(alice, 'user_status'))['is_online'])
+        await alice.disconnect()
+
+    def test_sender_presence_read_off_event_loop(self):
+        async_to_sync(self.presence_session)()
+
+    async def presence_session(self):
+        conversation_id = str(self.conversation.id)
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        await alice.send_json_to({'type': 'subscribe', 'conversation': conversation_id})
+        await self.receive(alice, 'subscribed')
+
+        # La lecture du cache (Redis en production) ne bloque pas la boucle
+        loop_thread = threading.get_ident()
+        threads = []
+        state = presence.state
+
+        def record(user):
+            threads.append(threading.get_ident())
+            return state(user)
+
+        with mock.patch.object(presence, 'state', record):
+            await alice.send_json_to({'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut'})
+            event = await self.receive(bob, 'chat_message')
+        self.assertTrue(event['message']['sender']['is_online'])
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+        await alice.disconnect()
+        await bob.disconnect()
+
+    def test_unmatch_cuts_off_open_connection(self):
+        async_to_sync(self.unmatch_session)()
+
+    async def unmatch_session(self):
+        conversation_id = str(self.conversation.id)
+        alice = await self.connect(self.alice)
+        await alice.send_json_to({'type': 'subscribe', 'conversation': conversation_id})
+        await self.receive(alice, 'subscribed')
+
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        response = await database_sync_to_async(client.post)(
+            f'/api/matching/matches/{self.conversation.match_id}/unmatch/'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Connexion ouverte, mais la conversation n'est plus accessible
+        await alice.send_json_to({'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut'})
+        self.assertEqual((await self.receive(alice, 'error'))['error'], 'Conversation non trouvée')
+        await alice.send_json_to({'type': 'chat_message', 'conversation': conversation_id, 'content': 'Salut'})
+        self.assertEqual((await self.receive(alice, 'error'))['error'], 'Conversation non souscrite')
+        self.assertEqual(message_buffer.pending_count(), 0)
+        await alice.disconnect()
+
+    def test_unmatch_closes_conversation_connection(self):
+        async_to_sync(self.legacy_unmatch_session)()
+
+    async def legacy_unmatch_session(self):
+        alice = WebsocketCommunicator(
+            JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+            f'/ws/chat/{self.conversation.id}/?token={AccessToken.for_user(self.alice)}'
+        )
+        connected, _ = await alice.connect()
+        self.assertTrue(connected)
+
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        response = await database_sync_to_async(client.post)(
+            f'/api/matching/matches/{self.conversation.match_id}/unmatch/'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Connexion par conversation : fermée par défaut
+        await alice.send_json_to({'type': 'chat_message', 'content': 'Salut'})
+        while True:
+            output = await alice.receive_output()
+            if output['type'] == 'websocket.close':
+                break
+        self.assertEqual(message_buffer.pending_count(), 0)
+
+
+class WebSocketAuthTests(TestCase):
+    """Authentification des WebSockets par les claims du token, en cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com', photos=0).user
+
+    def authenticate(self, query_string):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        async_to_sync(JWTAuthMiddleware(app))({'type': 'websocket', 'query_string': query_string}, None, None)
+        return scopes[0]['user']
+
+    def test_handshake_does_not_query_users(self):
+        token = AccessToken.for_user(self.alice)
+        for _ in range(2):
+            with self.assertNumQueries(0):
+                user = self.authenticate(f'v=2&token={token}&next=/a?b=c'.encode())
+            self.assertIsInstance(user, WebSocketUser)
+            self.assertEqual(user.id, self.alice.id)
+
+        # Ligne User chargée une seule fois, au premier besoin
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(user.aload)(), self.alice)
+            self.assertEqual(async_to_sync(user.aload)(), self.alice)
+
+    def test_invalid_tokens_are_anonymous(self):
+        refresh = RefreshToken.for_user(self.alice)
+        expired = AccessToken.for_user(self.alice)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        for query_string in [b'', b'token=', b'token=abc', f'token={refresh}'.encode(), f'token={expired}'.encode()]:
+            self.assertTrue(self.authenticate(query_string).is_anonymous)
+
+    def test_deactivated_user_is_not_loaded(self):
+        user = self.authenticate(f'token={AccessToken.for_user(self.alice)}'.encode())
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertIsNone(async_to_sync(user.aload)())
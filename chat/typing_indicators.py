@@ -0,0 +1,85 @@
+"""
+Indicateurs "en train d'écrire", éphémères : ils passent uniquement par le
+channel layer, jamais par la base.
+
+Chaque connexion WebSocket regroupe les changements d'état envoyés par le
+client (souvent un par frappe) avec ``TypingThrottle`` :
+- au plus une diffusion par ``TYPING_THROTTLE_INTERVAL`` secondes ; un
+  changement arrivé pendant l'intervalle est diffusé à sa fin (seul le
+  dernier état compte) ;
+- un état "écrit" déjà diffusé n'est rediffusé que pour le prolonger, après
+  la moitié de ``TYPING_TTL`` ;
+- sans nouvel état "écrit" pendant ``TYPING_TTL`` secondes, l'arrêt est
+  diffusé par le serveur. Les événements portent aussi ``ttl`` pour que les
+  clients expirent eux-mêmes un indicateur dont l'arrêt serait perdu.
+"""
+import asyncio
+
+from django.conf import settings
+
+
+class TypingThrottle:
+    def __init__(self, broadcast):
+        # broadcast(is_typing) : coroutine qui diffuse l'état au groupe
+        self.broadcast = broadcast
+        self.interval = settings.TYPING_THROTTLE_INTERVAL
+        self.ttl = settings.TYPING_TTL
+        self.sent = False
+        self.wanted = False
+        self.sent_at = None
+        self._trailing = None
+        self._expiry = None
+
+    async def update(self, is_typing):
+        """Nouvel état envoyé par le client"""
+        self.wanted = is_typing
+        self._cancel('_expiry')
+        if is_typing:
+            self._expiry = asyncio.create_task(self._expire())
+        await self._apply()
+
+    async def close(self):
+        """Fin de connexion : annule les minuteries et diffuse l'arrêt si besoin"""
+        self._cancel('_trailing')
+        self._cancel('_expiry')
+        if self.sent:
+            await self._send(False)
+
+    async def _apply(self):
+        now = asyncio.get_running_loop().time()
+        elapsed = None if self.sent_at is None else now - self.sent_at
+
+        if self.wanted == self.sent:
+            # Prolongation d'un état "écrit" déjà diffusé
+            if self.wanted and elapsed >= self.ttl / 2 and self._trailing is None:
+                await self._send(True)
+            return
+
+        if elapsed is None or elapsed >= self.interval:
+            self._cancel('_trailing')
+            await self._send(self.wanted)
+        elif self._trailing is None:
+            self._trailing = asyncio.create_task(self._send_later(self.interval - elapsed))
+
+    async def _send_later(self, delay):
+        await asyncio.sleep(delay)
+        self._trailing = None
+        if self.wanted != self.sent:
+            await self._send(self.wanted)
+
+    async def _expire(self):
+        await asyncio.sleep(self.ttl)
+        self._expiry = None
+        self.wanted = False
+        await self._apply()
+
+    async def _send(self, is_typing):
+        self.sent = is_typing
+        self.sent_at = asyncio.get_running_loop().time()
+        await self.broadcast(is_typing)
+
+    def _cancel(self, name):
+        task = getattr(self, name)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        setattr(self, name, None)
@@ -0,0 +1,174 @@
+"""
+État de lecture des conversations : filigranes de lecture et compteurs de
+messages non lus, par participant.
+
+``Conversation.user1_read_through`` / ``user2_read_through`` est la date du
+dernier message lu par ``match.user1`` / ``match.user2`` : un message de
+l'autre participant est lu s'il n'est pas postérieur au filigrane. Lire un
+message lit tous les précédents ; la lecture avance le filigrane (une ligne)
+au lieu de modifier chaque message. ``Message.is_read`` / ``read_at`` ne
+sont plus écrits : ``read_state`` les déduit du filigrane pour l'API.
+
+``Conversation.user1_unread`` / ``user2_unread`` dénormalisent le nombre de
+messages postérieurs au filigrane : +1 pour le destinataire à chaque
+message (``UPDATE ... = F() + 1``), recalculés quand le filigrane avance.
+Les écarts éventuels sont réparés par ``manage.py reconcile_unread_counters``.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from matching.models import Match
+from .models import Conversation, Message
+
+# Filigrane d'un participant qui n'a encore rien lu
+NOTHING_READ = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def participant(match, user_id):
+    """``'user1'`` ou ``'user2'`` selon la place de ``user_id`` dans le match (None s'il n'y participe pas)"""
+    if user_id == match.user1_id:
+        return 'user1'
+    if user_id == match.user2_id:
+        return 'user2'
+    return None
+
+
+def record_message(conversation, sender_id):
+    """
+    Incrémente le compteur du destinataire et met à jour ``updated_at``
+    en une requête (``conversation.match`` doit être chargé).
+    """
+    recipient = 'user2_unread' if conversation.match.user1_id == sender_id else 'user1_unread'
+    conversation.updated_at = timezone.now()
+    Conversation.objects.filter(pk=conversation.pk).update(
+        updated_at=conversation.updated_at,
+        **{recipient: F(recipient) + 1}
+    )
+
+
+def record_messages(messages):
+    """
+    Version groupée de ``record_message`` pour des messages insérés en lot
+    (``message.conversation.match`` doit être chargé) : une requête pour
+    verrouiller les conversations et lire les filigranes, puis une mise à jour
+    par conversation. Les messages déjà couverts par le filigrane du
+    destinataire (lu pendant que le message attendait son insertion) ne
+    sont pas comptés.
+    """
+    conversations = {message.conversation_id: message.conversation for message in messages}
+    watermarks = {
+        pk: {'user1': user1_through, 'user2': user2_through}
+        for pk, user1_through, user2_through in Conversation.objects.select_for_update().filter(
+            pk__in=conversations
+        ).order_by('pk').values_list('pk', 'user1_read_through', 'user2_read_through')
+    }
+
+    increments = {pk: {'user1_unread': 0, 'user2_unread': 0} for pk in watermarks}
+    updated_at = {}
+    for message in messages:
+        pk = message.conversation_id
+        if pk not in watermarks:
+            continue
+        recipient = 'user2' if message.sender_id == conversations[pk].match.user1_id else 'user1'
+        through = watermarks[pk][recipient]
+        if through is None or message.created_at > through:
+            increments[pk][f'{recipient}_unread'] += 1
+        updated_at[pk] = max(updated_at.get(pk, message.created_at), message.created_at)
+
+    for pk, counts in increments.items():
+        Conversation.objects.filter(pk=pk).update(
+            updated_at=Greatest(F('updated_at'), Value(updated_at[pk])),
+            **{field: F(field) + count for field, count in counts.items() if count}
+        )
+
+
+def mark_read_through(conversation, reader_id, through):
+    """
+    Avance le filigrane de ``reader_id`` jusqu'à ``through`` (date d'un
+    message) et recalcule son compteur ; le filigrane ne recule jamais.
+    Retourne le nombre de messages nouvellement lus
+    (``conversation.match`` doit être chargé).
+    """
+    reader = participant(conversation.match, reader_id)
+    if reader is None:
+        return 0
+    watermark = f'{reader}_read_through'
+
+    with transaction.atomic():
+        # Verrou sur la conversation : deux lectures concurrentes ne comptent
+        # pas les mêmes messages, et l'incrément d'un nouveau message attend
+        previous = Conversation.objects.select_for_update().values_list(
+            watermark, flat=True
+        ).get(pk=conversation.pk) or NOTHING_READ
+        if through <= previous:
+            return 0
+
+        counts = conversation.messages.filter(
+            created_at__gt=previous
+        ).exclude(sender_id=reader_id).aggregate(
+            newly_read=Count('pk', filter=Q(created_at__lte=through)),
+            unread=Count('pk', filter=Q(created_at__gt=through)),
+        )
+        read_at = timezone.now()
+        Conversation.objects.filter(pk=conversation.pk).update(**{
+            watermark: through,
+            f'{reader}_read_at': read_at,
+            f'{reader}_unread': counts['unread'],
+        })
+
+    setattr(conversation, watermark, through)
+    setattr(conversation, f'{reader}_read_at', read_at)
+    setattr(conversation, f'{reader}_unread', counts['unread'])
+    return counts['newly_read']
+
+
+def read_state(message):
+    """
+    ``(is_read, read_at)`` d'un message, déduits du filigrane de son
+    destinataire (``message.conversation.match`` doit être chargé).
+    """
+    conversation = message.conversation
+    recipient = 'user2' if message.sender_id == conversation.match.user1_id else 'user1'
+    through = getattr(conversation, f'{recipient}_read_through')
+    if through is None or message.created_at > through:
+        return False, None
+    return True, getattr(conversation, f'{recipient}_read_at')
+
+
+def _actual_unread(reader):
+    """Sous-requête : messages de l'autre participant postérieurs au filigrane de ``match.<reader>``"""
+    return Coalesce(Subquery(
+        Message.objects.filter(
+            conversation=OuterRef('pk'),
+            created_at__gt=Coalesce(OuterRef(f'{reader}_read_through'), Value(NOTHING_READ)),
+        ).exclude(
+            # Pas de jointure possible dans un UPDATE : participant lu via le match
+            sender_id=Subquery(
+                Match.objects.filter(pk=OuterRef(OuterRef('match_id'))).values(f'{reader}_id')
+            )
+        ).order_by().values('conversation').annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def reconcile(batch_size=1000):
+    """Recalcule les compteurs erronés depuis les filigranes ; retourne le nombre corrigé"""
+    drifted = Conversation.objects.annotate(
+        actual1=_actual_unread('user1'),
+        actual2=_actual_unread('user2'),
+    ).filter(
+        ~Q(user1_unread=F('actual1')) | ~Q(user2_unread=F('actual2'))
+    ).values_list('pk', flat=True)
+
+    fixed = 0
+    ids = list(drifted)
+    for start in range(0, len(ids), batch_size):
+        # Recalcul dans l'UPDATE même, pour ne pas écraser un message arrivé entre-temps
+        fixed += Conversation.objects.filter(pk__in=ids[start:start + batch_size]).update(
+            user1_unread=_actual_unread('user1'),
+            user2_unread=_actual_unread('user2'),
+        )
+    return fixed
@@ -2,9 +2,11 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
 from django.db.models import Q
-from django.utils import timezone
 from .models import Conversation, Message, TypingStatus
+from .pagination import InboxPagination, MessageCursorPagination
+from . import membership, unread
 from .serializers import (
     ConversationSerializer, MessageSerializer,
     MessageCreateSerializer, TypingStatusSerializer
@@ -16,6 +18,7 @@ class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet pour gérer les conversations"""
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = InboxPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -23,7 +26,7 @@ class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
         return Conversation.objects.filter(
             Q(match__user1=user) | Q(match__user2=user),
             match__is_active=True
-        ).order_by('-updated_at')
+        ).for_inbox(user).order_by('-updated_at')
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -32,11 +35,15 @@ class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
 class MessageViewSet(viewsets.ModelViewSet):
     """ViewSet pour gérer les messages"""
     permission_classes = [IsAuthenticated]
+    # Historique paginé par curseur : ?conversation=<id>&before=<id>|after=<id>&limit=<n>
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         conversation_id = self.request.query_params.get('conversation')
         if conversation_id:
-            return Message.objects.filter(conversation_id=conversation_id).order_by('created_at')
+            return Message.objects.filter(
+                conversation_id=conversation_id
+            ).select_related('sender', 'conversation__match').order_by('created_at')
         return Message.objects.none()
 
     def get_serializer_class(self):
@@ -48,34 +55,31 @@ class MessageViewSet(viewsets.ModelViewSet):
         """Créer un nouveau message"""
         serializer = MessageCreateSerializer(data=request.data)
         if serializer.is_valid():
-            # Vérifier que l'utilisateur fait partie de la conversation
-            conversation_id = serializer.validated_data.get('conversation').id
-            try:
-                conversation = Conversation.objects.get(id=conversation_id)
-                match = conversation.match
-                
-                if request.user not in [match.user1, match.user2]:
-                    return Response(
-                        {'error': 'Vous ne faites pas partie de cette conversation'},
-                        status=status.HTTP_403_FORBIDDEN
-                    )
-                
-                # Créer le message
-                message = serializer.save(sender=request.user)
-                
-                # Mettre à jour le timestamp de la conversation
-                conversation.updated_at = timezone.now()
-                conversation.save()
-                
-                return Response(
-                    MessageSerializer(message).data,
-                    status=status.HTTP_201_CREATED
-                )
-            except Conversation.DoesNotExist:
+            # Vérifier que l'utilisateur fait partie de la conversation (cache, sans requête)
+            conversation_id = serializer.validated_data['conversation']
+            if membership.members(conversation_id) is None:
                 return Response(
                     {'error': 'Conversation non trouvée'},
                     status=status.HTTP_404_NOT_FOUND
                 )
+            conversation = membership.conversation_for(conversation_id, request.user.id)
+            if conversation is None:
+                return Response(
+                    {'error': 'Vous ne faites pas partie de cette conversation'},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
+            with transaction.atomic():
+                # Créer le message
+                message = serializer.save(sender=request.user, conversation=conversation)
+
+                # Compteur du destinataire et timestamp de la conversation
+                unread.record_message(conversation, request.user.id)
+
+            return Response(
+                MessageSerializer(message).data,
+                status=status.HTTP_201_CREATED
+            )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -91,9 +95,8 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        message.is_read = True
-        message.read_at = timezone.now()
-        message.save()
+        # Lire un message lit aussi les précédents : le filigrane avance
+        unread.mark_read_through(message.conversation, request.user.id, message.created_at)
         
         return Response(MessageSerializer(message).data)
 
@@ -108,11 +111,16 @@ class MessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        messages = Message.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).exclude(sender=request.user)
-        
-        messages.update(is_read=True, read_at=timezone.now())
+        conversation = Conversation.objects.select_related('match').filter(pk=conversation_id).first()
+        if conversation is None:
+            return Response(
+                {'error': 'Conversation non trouvée'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        last_message = conversation.messages.exclude(sender=request.user).order_by('-created_at').first()
+        count = 0
+        if last_message is not None:
+            count = unread.mark_read_through(conversation, request.user.id, last_message.created_at)
         
-        return Response({'status': f'{messages.count()} messages marqués comme lus'})
\ No newline at end of file
+        return Response({'status': f'{count} messages marqués comme lus'})
\ No newline at end of file
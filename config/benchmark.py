@@ -0,0 +1,105 @@
+"""Outils communs aux commandes de benchmark (``manage.py bench_*``)"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Crée une base de test jetable (comme ``manage.py test``) pour que les
+    benchmarks ne touchent jamais la base de développement.
+    """
+    old_name = connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+
+
+def measure(func, repeat=20, warmup=2):
+    """Exécute ``func`` plusieurs fois et retourne les durées en millisecondes"""
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """Résumé (moyenne, p50, p95) d'une liste de durées en ms"""
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        'mean': statistics.mean(ordered),
+        'p50': statistics.median(ordered),
+        'p95': p95,
+    }
+
+
+def format_summary(label, timings):
+    stats = summarize(timings)
+    return (
+        f"{label:<40} mean={stats['mean']:8.2f}ms "
+        f"p50={stats['p50']:8.2f}ms p95={stats['p95']:8.2f}ms"
+    )
+
+
+def bulk_create_profiles(count, batch_size=5000, seed=0, **overrides):
+    """
+    Insère ``count`` utilisateurs et profils aléatoires (répartis sur le globe)
+    et retourne la liste des profils créés.
+    """
+    import random
+    import uuid
+    from datetime import date, timedelta
+
+    from accounts.geo import encode_geohash
+    from accounts.models import User, UserProfile
+
+    rng = random.Random(seed)
+    today = date.today()
+    profiles = []
+
+    for offset in range(0, count, batch_size):
+        size = min(batch_size, count - offset)
+        users = []
+        for _ in range(size):
+            user_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+            users.append(User(
+                id=user_id,
+                email=f'{user_id.hex}@bench.local',
+                username=user_id.hex,
+                password='!',
+            ))
+        User.objects.bulk_create(users, batch_size=batch_size)
+
+        batch = []
+        for user in users:
+            latitude = rng.uniform(-60, 70)
+            longitude = rng.uniform(-180, 180)
+            fields = {
+                'user': user,
+                'gender': rng.choice('MFO'),
+                'looking_for': rng.choice('MFB'),
+                'birth_date': today - timedelta(days=rng.randint(18 * 365, 60 * 365)),
+                'latitude': latitude,
+                'longitude': longitude,
+                'geohash': encode_geohash(latitude, longitude),
+                'max_distance': rng.choice([10, 25, 50, 100]),
+                'min_age_preference': rng.randint(18, 30),
+                'max_age_preference': rng.randint(30, 60),
+            }
+            fields.update(overrides)
+            batch.append(UserProfile(**fields))
+        profiles.extend(UserProfile.objects.bulk_create(batch, batch_size=batch_size))
+
+    return profiles
@@ -94,6 +94,55 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache (Redis en production, mémoire locale en développement)
+USE_REDIS_CACHE = os.environ.get('USE_REDIS_CACHE', str(not DEBUG)) == 'True'
+
+if USE_REDIS_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Index des likes reçus dans le cache (détection de match sans requête Swipe).
+# Le cache doit être partagé entre les processus : actif par défaut avec Redis.
+LIKE_INDEX_ENABLED = os.environ.get('LIKE_INDEX_ENABLED', str(USE_REDIS_CACHE)) == 'True'
+
+# Pipeline post-match (compteurs, conversation, notification) : exécuté par un
+# worker en arrière-plan, ou directement au commit si MATCH_PIPELINE_EAGER
+MATCH_PIPELINE_EAGER = os.environ.get('MATCH_PIPELINE_EAGER', 'False') == 'True'
+
+# Messages WebSocket insérés par lots après diffusion (voir chat.buffer) :
+# au plus CHAT_BUFFER_MAX_BATCH messages, au plus tard après l'intervalle (s)
+CHAT_BUFFER_FLUSH_INTERVAL = float(os.environ.get('CHAT_BUFFER_FLUSH_INTERVAL', '0.005'))
+CHAT_BUFFER_MAX_BATCH = int(os.environ.get('CHAT_BUFFER_MAX_BATCH', '200'))
+CHAT_BUFFER_BACKGROUND = os.environ.get('CHAT_BUFFER_BACKGROUND', 'True') == 'True'
+
+# Présence dans le cache (voir accounts.presence) : expiration sans battement
+# de cœur, battements des WebSockets et écriture groupée de last_seen (s)
+PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', '90'))
+PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', '30'))
+PRESENCE_FLUSH_INTERVAL = int(os.environ.get('PRESENCE_FLUSH_INTERVAL', '30'))
+PRESENCE_FLUSH_BACKGROUND = os.environ.get('PRESENCE_FLUSH_BACKGROUND', 'True') == 'True'
+
+# Événements des conversations aussi publiés dans les groupes chat_<id> de
+# l'ancien WebSocket par conversation (à désactiver quand les clients
+# utilisent tous ws/user/)
+CHAT_LEGACY_ROOMS = os.environ.get('CHAT_LEGACY_ROOMS', 'True') == 'True'
+
+# Indicateurs "en train d'écrire" (voir chat.typing_indicators) : au plus une
+# diffusion par intervalle et par connexion, arrêt automatique après le TTL (s)
+TYPING_THROTTLE_INTERVAL = float(os.environ.get('TYPING_THROTTLE_INTERVAL', '1'))
+TYPING_TTL = float(os.environ.get('TYPING_TTL', '5'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
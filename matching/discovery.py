@@ -0,0 +1,255 @@
+"""
+Construction de la requête des profils candidats pour le swipe et file
+d'attente de découverte par utilisateur.
+
+La file (stockée dans le cache, Redis en production) contient les IDs des
+prochains candidats : ``/discover/`` dépile au lieu de relancer la requête
+complète, un worker (``manage.py refill_discovery_queues``) la remplit en
+arrière-plan et chaque swipe retire le profil concerné. Chaque remplissage
+classe une fenêtre de candidats (``scoring``) et n'en garde que les meilleurs.
+Ces trois écritures passent par un verrou par file (``queue_lock``) : le
+worker ne peut pas réécrire un état lu avant un dépilement ou un retrait.
+"""
+import hashlib
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from accounts.geo import bounding_box_filter, geohash_filter, haversine_expression
+from accounts.interests import filter_shared_interest
+from accounts.models import UserProfile
+from .models import Swipe
+from .scoring import CandidateStore, score_candidates, top_candidates
+
+
+def candidate_queryset(user, user_profile, shared_interests_only=False):
+    """
+    Retourne les profils compatibles avec les préférences de l'utilisateur
+    (et partageant au moins un de ses intérêts si ``shared_interests_only``)
+    """
+    # Filtrer les profils selon les préférences, sans ceux déjà swipés
+    profiles = exclude_swiped(
+        UserProfile.objects.exclude(user=user),
+        user
+    ).filter(
+        looking_for__in=['B', user_profile.gender]
+    )
+    if user_profile.looking_for != 'B':
+        profiles = profiles.filter(gender=user_profile.looking_for)
+
+    # Filtrer par âge : les préférences deviennent un intervalle de dates de naissance
+    profiles = profiles.filter(birth_date_range(
+        user_profile.min_age_preference,
+        user_profile.max_age_preference
+    ))
+
+    # Les préférences d'âge du candidat doivent aussi inclure l'utilisateur
+    viewer_age = user_profile.age
+    if viewer_age is not None:
+        profiles = profiles.filter(
+            min_age_preference__lte=viewer_age,
+            max_age_preference__gte=viewer_age
+        )
+
+    # Filtrer par distance (si coordonnées disponibles)
+    if user_profile.latitude is not None and user_profile.longitude is not None:
+        profiles = filter_by_distance(
+            profiles,
+            user_profile.latitude,
+            user_profile.longitude,
+            user_profile.max_distance
+        )
+
+    if shared_interests_only:
+        profiles = filter_shared_interest(profiles, user_profile.interest_mask)
+
+    return profiles
+
+
+def exclude_swiped(profiles, user):
+    """
+    Exclut les profils déjà swipés par ``user`` avec un NOT EXISTS corrélé
+    (anti-jointure sur l'index ``(from_user, to_user)``) plutôt qu'une
+    liste IN matérialisée qui grossit avec l'historique de swipes.
+    """
+    already_swiped = Swipe.objects.filter(from_user=user, to_user=OuterRef('user'))
+    return profiles.filter(~Exists(already_swiped))
+
+
+def birth_date_range(min_age, max_age, today=None):
+    """
+    Filtre Q équivalent à ``min_age <= age <= max_age`` sur ``birth_date``,
+    utilisable par l'index (l'âge est une propriété Python non requêtable).
+    """
+    today = today or date.today()
+    return Q(
+        birth_date__lte=years_before(today, min_age),
+        birth_date__gt=years_before(today, max_age + 1)
+    )
+
+
+def years_before(day, years):
+    """Même jour ``years`` ans plus tôt (le 29 février devient le 28)"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def filter_by_distance(profiles, latitude, longitude, max_distance):
+    """
+    Restreint les profils au rayon ``max_distance`` (km) :
+    préfiltre par cellules geohash et bounding box (index), puis
+    distance haversine exacte calculée en SQL et annotée dans ``distance``.
+
+    Les cellules sont lues dans une sous-requête ``pk IN (...)`` : seule, la
+    disjonction des plages geohash est parcourue par l'index, alors que
+    mêlée aux autres filtres le planificateur lui préfère l'index
+    ``birth_date`` (intervalle d'âge peu sélectif) et parcourt la table.
+    """
+    nearby = UserProfile.objects.order_by().filter(
+        geohash_filter(latitude, longitude, max_distance)
+    ).values('pk')
+    return profiles.filter(
+        bounding_box_filter(latitude, longitude, max_distance),
+        pk__in=nearby,
+    ).annotate(
+        distance=haversine_expression(latitude, longitude)
+    ).filter(
+        distance__lte=max_distance
+    )
+
+
+# File de découverte
+QUEUE_SIZE = 200
+QUEUE_LOW_WATERMARK = 60
+QUEUE_TIMEOUT = 60 * 60
+PAGE_SIZE = 20
+QUEUE_LOCK_TIMEOUT = 10
+QUEUE_LOCK_POLL = 0.01
+# Candidats classés à chaque remplissage (les meilleurs complètent la file)
+SCORING_WINDOW = 1000
+
+
+def queue_key(user_profile, shared_interests_only=False):
+    """
+    Clé de la file : elle inclut une empreinte des préférences et des
+    intérêts (filtre et classement) pour qu'une modification du profil
+    invalide la file sans invalidation explicite.
+    """
+    fingerprint = hashlib.md5(repr((
+        user_profile.gender, user_profile.looking_for,
+        user_profile.latitude, user_profile.longitude, user_profile.max_distance,
+        user_profile.min_age_preference, user_profile.max_age_preference,
+        user_profile.birth_date, user_profile.interest_mask, shared_interests_only,
+    )).encode()).hexdigest()[:12]
+    return f'discover_queue:v2:{user_profile.user_id}:{fingerprint}'
+
+
+@contextmanager
+def queue_lock(key):
+    """
+    Sérialise les lecture-modification-écriture d'une file (remplissage par
+    le worker, dépilement, retrait au swipe) : ``cache.add`` est atomique.
+    Le verrou expire après QUEUE_LOCK_TIMEOUT si son détenteur disparaît.
+    """
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    while not cache.add(lock_key, token, QUEUE_LOCK_TIMEOUT):
+        time.sleep(QUEUE_LOCK_POLL)
+    try:
+        yield
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def refill_queue(user, user_profile, force=False, shared_interests_only=False):
+    """
+    Complète la file jusqu'à QUEUE_SIZE candidats ; retourne son état.
+
+    Les candidats sont parcourus par pagination keyset sur ``(created_at, id)``
+    à partir du curseur enregistré avec la file : chaque remplissage lit la
+    fenêtre de SCORING_WINDOW profils suivante au lieu de rescanner la table,
+    la classe et ajoute les meilleurs à la file ; les nouveaux swipes (exclus
+    par l'anti-jointure) ne décalent pas le curseur. Quand le parcours est
+    épuisé, il recommence depuis les profils les plus récents, ce qui
+    redonne leur chance aux candidats écartés.
+    """
+    key = queue_key(user_profile, shared_interests_only)
+    with queue_lock(key):
+        state = cache.get(key) or {'ids': [], 'cursor': None}
+        if len(state['ids']) >= QUEUE_LOW_WATERMARK and not force:
+            return state
+        _refill(state, user, user_profile, shared_interests_only)
+        cache.set(key, state, QUEUE_TIMEOUT)
+    return state
+
+
+def _refill(state, user, user_profile, shared_interests_only):
+    """Ajoute à ``state`` les meilleurs candidats de la fenêtre suivante (verrou de la file tenu)"""
+    missing = QUEUE_SIZE - len(state['ids'])
+    if missing <= 0:
+        return
+    store = CandidateStore.load(
+        user_profile,
+        after_cursor(
+            candidate_queryset(user, user_profile, shared_interests_only),
+            state['cursor']
+        )
+        .exclude(user_id__in=state['ids'])
+        .order_by('-created_at', '-id')[:SCORING_WINDOW]
+    )
+    ranked = top_candidates(score_candidates(user_profile, store), missing)
+    state['ids'] = state['ids'] + [store.user_ids[index] for index in ranked]
+    # Fin du parcours : repartir du début au prochain remplissage
+    state['cursor'] = (
+        (store.created_at[-1], store.profile_ids[-1])
+        if len(store) == SCORING_WINDOW else None
+    )
+
+
+def after_cursor(profiles, cursor):
+    """Profils situés après ``cursor = (created_at, id)`` dans l'ordre décroissant"""
+    if cursor is None:
+        return profiles
+    created_at, profile_id = cursor
+    return profiles.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=profile_id),
+        # Borne de l'index created_at : le OR seul n'en est pas une
+        created_at__lte=created_at,
+    )
+
+
+def pop_candidates(user, user_profile, count=PAGE_SIZE, shared_interests_only=False):
+    """Dépile les ``count`` prochains profils de la file (remplie si besoin)"""
+    key = queue_key(user_profile, shared_interests_only)
+    with queue_lock(key):
+        state = cache.get(key) or {'ids': [], 'cursor': None}
+        if len(state['ids']) < count:
+            _refill(state, user, user_profile, shared_interests_only)
+
+        page = state['ids'][:count]
+        state['ids'] = state['ids'][count:]
+        cache.set(key, state, QUEUE_TIMEOUT)
+
+    profiles = UserProfile.objects.filter(user_id__in=page).select_related('user')
+    positions = {user_id: index for index, user_id in enumerate(page)}
+    return sorted(profiles, key=lambda profile: positions[str(profile.user_id)])
+
+
+def remove_from_queue(user_profile, *swiped_user_ids):
+    """Retire les utilisateurs swipés des files (avec et sans filtre d'intérêts)"""
+    swiped = {str(user_id) for user_id in swiped_user_ids}
+    for shared_interests_only in (False, True):
+        key = queue_key(user_profile, shared_interests_only)
+        if not cache.get(key):
+            continue
+        with queue_lock(key):
+            state = cache.get(key)
+            if state and swiped.intersection(state['ids']):
+                state['ids'] = [user_id for user_id in state['ids'] if user_id not in swiped]
+                cache.set(key, state, QUEUE_TIMEOUT)
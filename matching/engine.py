@@ -0,0 +1,189 @@
+"""
+Moteur de swipe : enregistrement d'un swipe et création du match éventuel.
+
+Aucune étape ne fait de lecture-modification-écriture côté Python :
+- le swipe est inséré directement, un doublon est détecté par la contrainte
+  d'unicité ``(from_user, to_user)`` ;
+- les compteurs sont incrémentés en SQL avec ``F()`` ;
+- le like réciproque est vérifié après le commit du swipe : de deux likes
+  mutuels concurrents, au moins le second voit le premier. Avec
+  ``LIKE_INDEX_ENABLED``, elle lit l'index des likes reçus (``like_index``)
+  au lieu de la table ``Swipe`` ;
+- le match est créé sur la paire canonique ``(user1 < user2)`` protégée par
+  une contrainte d'unicité, un conflit signifie que l'autre requête l'a créé ;
+- compteurs de matches, conversation et notifications sont traités après le
+  commit, hors de la requête (``pipeline``).
+"""
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from accounts.models import User, UserProfile
+from . import like_index, pipeline
+from .like_index import LIKE_TYPES
+from .models import Swipe, Match
+
+
+class AlreadySwiped(Exception):
+    """L'utilisateur a déjà swipé ce profil"""
+
+
+def record_swipe(from_user, to_user_id, swipe_type):
+    """Enregistre un swipe ; retourne ``(swipe, match)`` (match vaut None sans like mutuel)"""
+    # Lève ValidationError si l'identifiant n'est pas un UUID
+    to_user_id = User._meta.pk.to_python(to_user_id)
+
+    try:
+        with transaction.atomic():
+            swipe = Swipe.objects.create(
+                from_user=from_user,
+                to_user_id=to_user_id,
+                swipe_type=swipe_type
+            )
+            UserProfile.objects.filter(user=from_user).update(swipe_count=F('swipe_count') + 1)
+            if swipe_type in LIKE_TYPES:
+                like_index.add_likes(from_user.id, to_user_id)
+    except IntegrityError:
+        if Swipe.objects.filter(from_user=from_user, to_user_id=to_user_id).exists():
+            raise AlreadySwiped()
+        raise
+
+    match = None
+    if swipe_type in LIKE_TYPES and liked_by(from_user, [to_user_id]):
+        match = create_match(from_user.id, to_user_id)
+
+    return swipe, match
+
+
+def liked_by(user, other_user_ids):
+    """Parmi ``other_user_ids``, ceux qui ont liké ``user``"""
+    if settings.LIKE_INDEX_ENABLED:
+        return like_index.likers_among(user.id, other_user_ids)
+    return set(Swipe.objects.filter(
+        from_user_id__in=other_user_ids,
+        to_user=user,
+        swipe_type__in=LIKE_TYPES
+    ).values_list('from_user_id', flat=True))
+
+
+def canonical_pair(user_id, other_user_id):
+    """Ordre ``(user1, user2)`` utilisé pour tous les matches"""
+    return (user_id, other_user_id) if user_id < other_user_id else (other_user_id, user_id)
+
+
+def create_match(user_id, other_user_id):
+    """Crée le match de la paire (idempotent) et planifie son traitement une seule fois"""
+    user1_id, user2_id = canonical_pair(user_id, other_user_id)
+    try:
+        with transaction.atomic():
+            match = Match.objects.create(user1_id=user1_id, user2_id=user2_id)
+            pipeline.schedule(match.pk)
+    except IntegrityError:
+        # Match déjà créé par la requête concurrente de l'autre utilisateur
+        match = Match.objects.get(user1_id=user1_id, user2_id=user2_id)
+    return match
+
+
+def record_swipes(from_user, items):
+    """
+    Enregistre un lot de swipes ``[{'to_user': ..., 'swipe_type': ...}]``
+    en un nombre constant de requêtes : un seul ``bulk_create`` pour les
+    swipes, une seule requête de likes réciproques et un ``bulk_create``
+    pour les matches. Retourne un résultat par élément, dans l'ordre :
+    ``{'to_user', 'status', 'match'}`` avec status ``created``,
+    ``duplicate`` ou ``invalid``.
+    """
+    valid_types = {choice for choice, _ in Swipe.SWIPE_CHOICES}
+    results = []
+    pending = {}
+    for item in items:
+        result = {'to_user': None, 'status': 'invalid', 'match': None}
+        results.append(result)
+        if not isinstance(item, dict):
+            continue
+        result['to_user'] = item.get('to_user')
+        try:
+            to_user_id = User._meta.pk.to_python(result['to_user'])
+        except ValidationError:
+            continue
+        swipe_type = item.get('swipe_type', 'pass')
+        # Type non hachable (liste, objet) : invalide, sans lever TypeError
+        if not isinstance(swipe_type, str) or swipe_type not in valid_types:
+            continue
+        if to_user_id is None or to_user_id == from_user.id:
+            continue
+        if to_user_id in pending:
+            result['status'] = 'duplicate'
+            continue
+        result['to_user'] = str(to_user_id)
+        pending[to_user_id] = (result, swipe_type)
+
+    # Utilisateurs inexistants et swipes déjà enregistrés
+    existing_users = set(User.objects.filter(id__in=pending).values_list('id', flat=True))
+    already_swiped = set(Swipe.objects.filter(
+        from_user=from_user, to_user_id__in=existing_users
+    ).values_list('to_user_id', flat=True))
+
+    swipes = []
+    for to_user_id, (result, swipe_type) in pending.items():
+        if to_user_id not in existing_users:
+            continue
+        if to_user_id in already_swiped:
+            result['status'] = 'duplicate'
+            continue
+        swipes.append(Swipe(from_user=from_user, to_user_id=to_user_id, swipe_type=swipe_type))
+
+    with transaction.atomic():
+        Swipe.objects.bulk_create(swipes, ignore_conflicts=True)
+        # Avec ignore_conflicts, seuls les swipes réellement insérés portent nos identifiants
+        inserted = set(Swipe.objects.filter(
+            id__in=[swipe.id for swipe in swipes]
+        ).values_list('to_user_id', flat=True))
+        if inserted:
+            UserProfile.objects.filter(user=from_user).update(
+                swipe_count=F('swipe_count') + len(inserted)
+            )
+        liked = [
+            to_user_id for to_user_id in inserted
+            if pending[to_user_id][1] in LIKE_TYPES
+        ]
+        if liked:
+            like_index.add_likes(from_user.id, *liked)
+
+    for to_user_id in inserted:
+        pending[to_user_id][0]['status'] = 'created'
+
+    if liked:
+        reciprocal = liked_by(from_user, liked)
+        if reciprocal:
+            for other_user_id, match in create_matches(from_user.id, reciprocal).items():
+                pending[other_user_id][0]['match'] = match
+
+    return results
+
+
+def create_matches(user_id, other_user_ids):
+    """
+    Version groupée de ``create_match`` pour un utilisateur et plusieurs
+    autres ; retourne ``{autre utilisateur: match}``.
+    """
+    candidates = [
+        Match(user1_id=user1_id, user2_id=user2_id)
+        for user1_id, user2_id in (canonical_pair(user_id, other) for other in other_user_ids)
+    ]
+
+    with transaction.atomic():
+        Match.objects.bulk_create(candidates, ignore_conflicts=True)
+        matches = list(Match.objects.filter(
+            Q(user1_id=user_id, user2_id__in=other_user_ids)
+            | Q(user2_id=user_id, user1_id__in=other_user_ids)
+        ))
+
+        # Avec ignore_conflicts, seuls les matches réellement insérés portent nos identifiants
+        created_ids = {match.pk for match in candidates}
+        pipeline.schedule(*[match.pk for match in matches if match.pk in created_ids])
+
+    return {
+        (match.user2_id if match.user1_id == user_id else match.user1_id): match
+        for match in matches
+    }
@@ -0,0 +1,169 @@
+"""
+Index des likes reçus, pour détecter un match sans interroger ``Swipe``.
+
+L'index vit dans le cache (Redis en production) : pour chaque utilisateur,
+un ensemble Redis des IDs des utilisateurs qui l'ont liké. Une vérification
+ne lit que les membres demandés (SMISMEMBER), jamais l'ensemble entier.
+
+L'ensemble est chargé depuis ``Swipe`` à la première lecture (ou par
+``manage.py rebuild_like_index`` au démarrage) et marqué d'un membre
+sentinelle ; chaque like y est ajouté après le commit du swipe, que
+l'ensemble soit déjà chargé ou non. Le chargement fait l'union avec ces
+ajouts : de deux likes mutuels concurrents, au moins le second voit le
+premier, comme avec la requête sur ``Swipe``. L'ensemble est évincé d'un
+bloc par Redis : sans sentinelle, il est rechargé, aucun like n'est perdu.
+Un like annulé ou modifié change la génération de l'ensemble, qui est alors
+rechargé.
+
+Hors Redis (mémoire locale en développement), l'ensemble est émulé par une
+valeur du cache, sans garantie d'atomicité entre processus.
+"""
+import time
+from itertools import islice
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from accounts.models import User
+from .models import Swipe
+
+LIKE_TYPES = ['like', 'super_like']
+INDEX_TIMEOUT = 60 * 60 * 24
+REBUILD_BATCH = 1000
+# Membre sentinelle : l'ensemble a été chargé depuis Swipe
+LOADED = ''
+
+
+def _generation_key(user_id):
+    return f'likes_in_gen:{user_id}'
+
+
+def _likers_key(user_id, generation):
+    return f'likes_in:{user_id}:{generation}'
+
+
+def _redis_client():
+    """Client Redis du cache, None hors Redis"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        return backend._cache.get_client(write=True)
+    return None
+
+
+def _generations(user_ids):
+    key_map = {_generation_key(user_id): user_id for user_id in user_ids}
+    generations = cache.get_many(key_map)
+    for key, user_id in key_map.items():
+        if key not in generations:
+            # Nouvelle génération : ne jamais réutiliser un ensemble d'une génération perdue
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return {user_id: generations[key] for key, user_id in key_map.items()}
+
+
+def _add_members(sets):
+    """Ajoute les membres aux ensembles (``{clé: membres}``), en un aller-retour"""
+    client = _redis_client()
+    if client is None:
+        stored = cache.get_many(sets)
+        cache.set_many({
+            key: stored.get(key, frozenset()) | frozenset(members)
+            for key, members in sets.items()
+        }, INDEX_TIMEOUT)
+        return
+    pipe = client.pipeline(transaction=False)
+    for key, members in sets.items():
+        key = cache.make_and_validate_key(key)
+        pipe.sadd(key, *members)
+        pipe.expire(key, INDEX_TIMEOUT)
+    pipe.execute()
+
+
+def _contains(key, members):
+    """Appartenance de chaque membre à l'ensemble ``key``"""
+    client = _redis_client()
+    if client is None:
+        stored = cache.get(key, frozenset())
+        return [member in stored for member in members]
+    return [bool(found) for found in client.smismember(cache.make_and_validate_key(key), members)]
+
+
+def _load(user_id, key):
+    likers = {
+        str(liker_id) for liker_id in Swipe.objects.filter(
+            to_user_id=user_id,
+            swipe_type__in=LIKE_TYPES
+        ).values_list('from_user_id', flat=True)
+    }
+    _add_members({key: likers | {LOADED}})
+    return likers
+
+
+def likers_among(user_id, candidate_ids):
+    """Parmi ``candidate_ids``, ceux qui ont liké ``user_id``"""
+    candidate_ids = list(candidate_ids)
+    key = _likers_key(user_id, _generations([user_id])[user_id])
+    loaded, *found = _contains(key, [LOADED, *(str(candidate) for candidate in candidate_ids)])
+    if not loaded:
+        # Jamais chargé, expiré ou évincé : Swipe fait foi
+        likers = _load(user_id, key)
+        found = [liked or str(candidate) in likers for candidate, liked in zip(candidate_ids, found)]
+    return {candidate for candidate, liked in zip(candidate_ids, found) if liked}
+
+
+def has_liked(liker_id, user_id):
+    """True si ``liker_id`` a liké (ou super liké) ``user_id``"""
+    return bool(likers_among(user_id, [liker_id]))
+
+
+def add_likes(from_user_id, *to_user_ids):
+    """Indexe les likes de ``from_user_id``, après le commit de la transaction en cours"""
+    def index():
+        generations = _generations(to_user_ids)
+        _add_members({
+            _likers_key(to_user_id, generation): {str(from_user_id)}
+            for to_user_id, generation in generations.items()
+        })
+
+    transaction.on_commit(index)
+
+
+def discard(from_user_id, *to_user_ids):
+    """
+    Retire de l'index les swipes de ``from_user_id`` modifiés ou supprimés,
+    après le commit de la transaction en cours.
+    """
+    def forget():
+        for to_user_id in to_user_ids:
+            try:
+                cache.incr(_generation_key(to_user_id))
+            except ValueError:
+                _generations([to_user_id])
+
+    transaction.on_commit(forget)
+
+
+def rebuild(user_ids=None):
+    """Recharge les ensembles depuis la table Swipe (tous les utilisateurs par défaut)"""
+    if user_ids is None:
+        user_ids = User.objects.values_list('id', flat=True).iterator(chunk_size=REBUILD_BATCH)
+    user_ids = iter(user_ids)
+
+    rebuilt = 0
+    while batch := [User._meta.pk.to_python(user_id) for user_id in islice(user_ids, REBUILD_BATCH)]:
+        # Générations lues avant le chargement, comme dans likers_among ; les
+        # utilisateurs sans like reçu ont aussi leur ensemble (sentinelle seule)
+        generations = _generations(batch)
+        likers = {user_id: {LOADED} for user_id in batch}
+        for to_user_id, from_user_id in Swipe.objects.filter(
+            swipe_type__in=LIKE_TYPES,
+            to_user_id__in=batch
+        ).values_list('to_user_id', 'from_user_id').iterator():
+            likers[to_user_id].add(str(from_user_id))
+
+        _add_members({
+            _likers_key(user_id, generations[user_id]): members
+            for user_id, members in likers.items()
+        })
+        rebuilt += len(batch)
+    return rebuilt
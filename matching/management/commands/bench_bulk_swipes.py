@@ -0,0 +1,65 @@
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from config.benchmark import benchmark_database, bulk_create_profiles
+from matching import pipeline
+from matching.engine import record_swipe, record_swipes
+from matching.models import Swipe
+
+
+class Command(BaseCommand):
+    help = "Compare le rejeu de swipes un par un et l'ingestion groupée"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=500, help="Swipes par lot")
+        parser.add_argument(
+            '--like-ratio', type=float, default=0.3,
+            help="Part des cibles ayant déjà liké l'utilisateur (matches)"
+        )
+
+    def handle(self, *args, **options):
+        batch = options['batch']
+
+        with benchmark_database():
+            profiles = bulk_create_profiles(2 * batch + 2)
+            single_user, bulk_user = profiles[0].user, profiles[1].user
+            single_targets = [profile.user for profile in profiles[2:batch + 2]]
+            bulk_targets = [profile.user for profile in profiles[batch + 2:]]
+
+            # Une partie des cibles a déjà liké : ces swipes créent des matches
+            likers = int(batch * options['like_ratio'])
+            Swipe.objects.bulk_create(
+                [Swipe(from_user=target, to_user=single_user, swipe_type='like')
+                 for target in single_targets[:likers]]
+                + [Swipe(from_user=target, to_user=bulk_user, swipe_type='like')
+                   for target in bulk_targets[:likers]]
+            )
+
+            def one_by_one():
+                for target in single_targets:
+                    record_swipe(single_user, str(target.id), 'like')
+
+            def batched():
+                record_swipes(bulk_user, [
+                    {'to_user': str(target.id), 'swipe_type': 'like'} for target in bulk_targets
+                ])
+
+            # Seule l'ingestion est mesurée : le pipeline post-match tourne hors
+            # de la requête, son worker fausserait les temps (verrous, Redis)
+            with mock.patch.object(pipeline, 'schedule'):
+                for label, func in (('un par un', one_by_one), ('lot (bulk)', batched)):
+                    self.measure(label, func, batch)
+
+    def measure(self, label, func, batch):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:<12} {batch / elapsed:10.0f} swipes/s "
+            f"({elapsed * 1000:.1f}ms, {len(queries)} requêtes)"
+        )
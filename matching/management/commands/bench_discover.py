@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from accounts.geo import haversine_expression
+from accounts.models import UserProfile
+from config.benchmark import benchmark_database, bulk_create_profiles, format_summary, measure
+from matching.discovery import candidate_queryset
+
+
+class Command(BaseCommand):
+    help = "Mesure la latence de la requête discover selon le nombre de profils"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10000,100000,1000000',
+            help="Nombres de profils à tester, séparés par des virgules"
+        )
+        parser.add_argument('--viewers', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+
+        with benchmark_database():
+            created = 0
+            for size in sizes:
+                self.stdout.write(f"Insertion de {size - created} profils...")
+                bulk_create_profiles(size - created, seed=size)
+                created = size
+
+                viewers = list(
+                    UserProfile.objects.select_related('user').order_by('?')[:options['viewers']]
+                )
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{size} profils"))
+
+                self.stdout.write(format_summary(
+                    'haversine seul (scan complet)',
+                    self._run(viewers, options['repeat'], self._full_scan)
+                ))
+                self.stdout.write(format_summary(
+                    'geohash + bbox + haversine',
+                    self._run(viewers, options['repeat'], self._indexed)
+                ))
+
+    def _run(self, viewers, repeat, query):
+        timings = []
+        for viewer in viewers:
+            timings.extend(measure(lambda: list(query(viewer)[:20]), repeat=repeat, warmup=1))
+        return timings
+
+    def _full_scan(self, viewer):
+        return UserProfile.objects.exclude(user=viewer.user).annotate(
+            distance=haversine_expression(viewer.latitude, viewer.longitude)
+        ).filter(distance__lte=viewer.max_distance)
+
+    def _indexed(self, viewer):
+        return candidate_queryset(viewer.user, viewer)
@@ -0,0 +1,48 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserProfile
+from config.benchmark import format_summary, measure
+from matching.scoring import CandidateStore, score_candidates, top_candidates
+
+
+class Command(BaseCommand):
+    help = "Mesure le classement vectorisé d'un lot de candidats (sans base de données)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=10000)
+        parser.add_argument('--limit', type=int, default=200, help="Candidats gardés après classement")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        count = options['candidates']
+        rng = np.random.default_rng(0)
+        viewer = UserProfile(
+            latitude=48.8566, longitude=2.3522, max_distance=50,
+            min_age_preference=25, max_age_preference=35,
+        )
+        store = CandidateStore(
+            profile_ids=range(count),
+            user_ids=[str(index) for index in range(count)],
+            created_at=[None] * count,
+            latitude=48.8566 + rng.uniform(-0.4, 0.4, count),
+            longitude=2.3522 + rng.uniform(-0.6, 0.6, count),
+            age=rng.uniform(18, 60, count),
+            last_seen=time.time() - rng.exponential(3 * 24 * 3600, count),
+            shared_interests=rng.integers(0, 5, count),
+            liked_you=rng.random(count) < 0.05,
+        )
+
+        self.stdout.write(format_summary(
+            f'score ({count} candidats)',
+            measure(lambda: score_candidates(viewer, store), repeat=options['repeat'])
+        ))
+        self.stdout.write(format_summary(
+            f'score + top {options["limit"]}',
+            measure(
+                lambda: top_candidates(score_candidates(viewer, store), options['limit']),
+                repeat=options['repeat']
+            )
+        ))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from accounts.models import UserProfile
+from config.benchmark import benchmark_database, bulk_create_profiles, format_summary, measure
+from matching.discovery import exclude_swiped
+from matching.models import Swipe
+
+
+class Command(BaseCommand):
+    help = "Compare l'exclusion des profils swipés (IN matérialisé vs NOT EXISTS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=100000)
+        parser.add_argument(
+            '--histories', default='100,1000,10000,50000',
+            help="Tailles d'historique de swipes, séparées par des virgules"
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        histories = sorted(int(size) for size in options['histories'].split(','))
+        if histories[-1] >= options['profiles']:
+            self.stderr.write("--profiles doit dépasser la plus grande taille d'historique")
+            return
+
+        with benchmark_database():
+            profiles = bulk_create_profiles(options['profiles'])
+            viewer = profiles[0].user
+            # Swiper d'abord les profils les plus récents : le pire cas pour la pagination
+            targets = sorted(profiles[1:], key=lambda profile: profile.created_at, reverse=True)
+
+            swiped = 0
+            for size in histories:
+                Swipe.objects.bulk_create([
+                    Swipe(from_user=viewer, to_user=profile.user, swipe_type='pass')
+                    for profile in targets[swiped:size]
+                ], batch_size=5000)
+                swiped = size
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{size} swipes"))
+                self.stdout.write(format_summary(
+                    'exclude(user__id__in=swipes)',
+                    measure(lambda: list(self._materialised(viewer)[:20]), repeat=options['repeat'])
+                ))
+                self.stdout.write(format_summary(
+                    'NOT EXISTS (anti-jointure)',
+                    measure(lambda: list(self._anti_join(viewer)[:20]), repeat=options['repeat'])
+                ))
+
+    def _materialised(self, user):
+        swiped_user_ids = Swipe.objects.filter(from_user=user).values_list('to_user_id', flat=True)
+        return UserProfile.objects.exclude(Q(user=user) | Q(user__id__in=swiped_user_ids))
+
+    def _anti_join(self, user):
+        return exclude_swiped(UserProfile.objects.exclude(user=user), user)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from matching import like_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index des likes reçus depuis la table Swipe (à lancer au démarrage)"
+
+    def handle(self, *args, **options):
+        rebuilt = like_index.rebuild()
+        self.stdout.write(f"{rebuilt} utilisateurs indexés")
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import UserProfile
+from matching.discovery import refill_queue
+
+
+class Command(BaseCommand):
+    help = "Remplit en arrière-plan les files de découverte des utilisateurs actifs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--active-within', type=int, default=60,
+            help="Ne traiter que les utilisateurs vus depuis N minutes"
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help="Relancer toutes les N secondes (0 = un seul passage)"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            refilled = self.refill_active(options['active_within'])
+            self.stdout.write(f"{refilled} files de découverte traitées")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def refill_active(self, active_within):
+        since = timezone.now() - timedelta(minutes=active_within)
+        profiles = UserProfile.objects.filter(
+            user__last_seen__gte=since
+        ).select_related('user')
+
+        count = 0
+        for profile in profiles.iterator():
+            refill_queue(profile.user, profile)
+            count += 1
+        return count
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from matching.models import Match
+from matching.pipeline import process
+
+
+class Command(BaseCommand):
+    help = "Relance le pipeline post-match des matches restés incomplets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=5,
+            help="Ne reprendre que les matches créés depuis plus de N minutes"
+        )
+        parser.add_argument('--batch', type=int, default=500, help="Matches par lot")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(minutes=options['older_than'])
+        match_ids = list(Match.objects.filter(
+            Q(counters_applied=False) | Q(conversation__isnull=True),
+            matched_at__lt=before
+        ).values_list('id', flat=True))
+
+        for start in range(0, len(match_ids), options['batch']):
+            process(match_ids[start:start + options['batch']])
+        self.stdout.write(f"{len(match_ids)} matches retraités")
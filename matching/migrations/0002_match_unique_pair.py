@@ -0,0 +1,105 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:25
+
+from django.db import migrations, models
+from django.db.models import F, Q
+
+
+def merge_duplicate_matches(apps, schema_editor):
+    """
+    Un seul match par couple avant la contrainte : les doublons (et les
+    matches enregistrés dans l'ordre inverse) sont fusionnés dans le plus
+    ancien match actif, leurs messages dans sa conversation, puis
+    ``match_count`` est recalculé pour les utilisateurs concernés.
+    """
+    Match = apps.get_model('matching', 'Match')
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+
+    duplicates = Match.objects.values_list('user1_id', 'user2_id').annotate(
+        count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    reversed_pairs = Match.objects.filter(user1__gt=F('user2')).values_list('user1_id', 'user2_id')
+    # Paires canoniques (user1 < user2, voir matching.engine.canonical_pair)
+    pairs = {tuple(sorted(pair[:2])) for pair in [*duplicates, *reversed_pairs]}
+
+    users = set()
+    for user1_id, user2_id in pairs:
+        group = list(Match.objects.filter(
+            Q(user1_id=user1_id, user2_id=user2_id) | Q(user1_id=user2_id, user2_id=user1_id)
+        ).order_by('matched_at', 'pk'))
+        if not group:
+            continue
+        users.update((user1_id, user2_id))
+        keeper = next((match for match in group if match.is_active), group[0])
+
+        # État par utilisateur, quel que soit l'ordre de chaque doublon
+        seen = {user1_id: False, user2_id: False}
+        for match in group:
+            seen[match.user1_id] |= match.user1_seen
+            seen[match.user2_id] |= match.user2_seen
+
+        conversations = {
+            conversation.match_id: conversation
+            for conversation in Conversation.objects.filter(match__in=group)
+        }
+        kept = conversations.get(keeper.pk) or next(
+            (conversations[match.pk] for match in group if match.pk in conversations), None
+        )
+        watermarks = {user1_id: (None, None), user2_id: (None, None)}
+        for match in group:
+            conversation = conversations.get(match.pk)
+            if conversation is None:
+                continue
+            for side in ('user1', 'user2'):
+                user_id = getattr(match, f'{side}_id')
+                through = getattr(conversation, f'{side}_read_through')
+                if through is not None and (watermarks[user_id][0] is None or through > watermarks[user_id][0]):
+                    watermarks[user_id] = (through, getattr(conversation, f'{side}_read_at'))
+            if conversation.pk != kept.pk:
+                Message.objects.filter(conversation=conversation).update(conversation=kept)
+                conversation.delete()
+
+        if kept is not None:
+            fields = {}
+            for side, user_id, other_user_id in (('user1', user1_id, user2_id), ('user2', user2_id, user1_id)):
+                through, read_at = watermarks[user_id]
+                unread = Message.objects.filter(conversation=kept, sender_id=other_user_id)
+                if through is not None:
+                    unread = unread.filter(created_at__gt=through)
+                fields.update({
+                    f'{side}_read_through': through,
+                    f'{side}_read_at': read_at,
+                    f'{side}_unread': unread.count(),
+                })
+            Conversation.objects.filter(pk=kept.pk).update(match=keeper, **fields)
+
+        Match.objects.filter(pk__in=[match.pk for match in group if match.pk != keeper.pk]).delete()
+        Match.objects.filter(pk=keeper.pk).update(
+            user1_id=user1_id, user2_id=user2_id,
+            is_active=any(match.is_active for match in group),
+            user1_seen=seen[user1_id], user2_seen=seen[user2_id],
+        )
+
+    for user_id in users:
+        UserProfile.objects.filter(user_id=user_id).update(
+            match_count=Match.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0001_initial'),
+        ('accounts', '0001_initial'),
+        # Les conversations fusionnées ont leurs compteurs et filigranes
+        ('chat', '0003_conversation_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_matches, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.UniqueConstraint(fields=('user1', 'user2'), name='unique_match_pair'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0002_match_unique_pair'),
+    ]
+
+    operations = [
+        # Les matches existants ont déjà leurs compteurs incrémentés
+        migrations.AddField(
+            model_name='match',
+            name='counters_applied',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='counters_applied',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -28,6 +28,15 @@ class Swipe(models.Model):
         ]
 
 
+class MatchQuerySet(models.QuerySet):
+    def with_profiles(self):
+        """
+        Charge les deux utilisateurs et leurs profils ; photos et intérêts
+        viennent du cache des cartes profil (accounts.cards).
+        """
+        return self.select_related('user1__profile', 'user2__profile')
+
+
 class Match(models.Model):
     """Match entre deux utilisateurs (like mutuel)"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -40,6 +49,11 @@ class Match(models.Model):
     user1_seen = models.BooleanField(default=False)
     user2_seen = models.BooleanField(default=False)
 
+    # Compteurs match_count déjà incrémentés par le pipeline post-match
+    counters_applied = models.BooleanField(default=False, editable=False)
+
+    objects = MatchQuerySet.as_manager()
+
     def __str__(self):
         return f"Match: {self.user1.email} <-> {self.user2.email}"
 
@@ -49,6 +63,10 @@ class Match(models.Model):
             models.Index(fields=['user1', 'user2']),
             models.Index(fields=['is_active', 'matched_at']),
         ]
+        constraints = [
+            # Paire canonique (user1 < user2) : un seul match par couple
+            models.UniqueConstraint(fields=['user1', 'user2'], name='unique_match_pair'),
+        ]
 
     def get_other_user(self, user):
         """Retourne l'autre utilisateur du match"""
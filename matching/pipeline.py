@@ -0,0 +1,116 @@
+"""
+Traitements consécutifs à un match, exécutés hors de la requête de swipe.
+
+La requête ne fait qu'insérer le match ; après son commit, les identifiants
+sont confiés à un worker local (thread et file en mémoire) qui :
+1. incrémente les compteurs ``match_count`` des deux profils ;
+2. envoie ``matches_created`` (création des conversations par l'app chat) ;
+3. pousse un événement ``match.created`` dans le groupe ``user_<id>`` de
+   chacun des deux utilisateurs.
+
+Chaque étape est idempotente (drapeau ``counters_applied`` sur le match,
+conversations uniques par match), le traitement entier est donc relancé en
+cas d'échec, avec un délai croissant ; l'événement peut alors être reçu deux
+fois, le client le dédoublonne par ``match_id``. Les matches restés
+incomplets (arrêt du processus) sont repris par
+``manage.py replay_match_pipeline``.
+"""
+import logging
+import queue
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from accounts.models import UserProfile
+from .models import Match
+from .signals import matches_created
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.5
+
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def schedule(*match_ids):
+    """Planifie le traitement des matches après le commit de la transaction en cours"""
+    if match_ids:
+        transaction.on_commit(lambda: _enqueue(list(match_ids)))
+
+
+def _enqueue(match_ids):
+    if settings.MATCH_PIPELINE_EAGER:
+        process(match_ids)
+        return
+    _ensure_worker()
+    _jobs.put((match_ids, 1))
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='match-pipeline', daemon=True)
+            _worker.start()
+
+
+def _run():
+    while True:
+        match_ids, attempt = _jobs.get()
+        close_old_connections()
+        try:
+            process(match_ids)
+        except Exception:
+            if attempt >= MAX_ATTEMPTS:
+                logger.exception("Abandon du traitement des matches %s", match_ids)
+            else:
+                logger.warning("Échec du traitement des matches %s, nouvel essai", match_ids, exc_info=True)
+                _retry_later(match_ids, attempt + 1)
+        finally:
+            close_old_connections()
+            _jobs.task_done()
+
+
+def _retry_later(match_ids, attempt):
+    timer = threading.Timer(RETRY_DELAY * 2 ** (attempt - 2), _jobs.put, args=[(match_ids, attempt)])
+    timer.daemon = True
+    timer.start()
+
+
+def process(match_ids):
+    """Exécute toutes les étapes pour ces matches (idempotent)"""
+    matches = list(Match.objects.filter(pk__in=match_ids))
+    if not matches:
+        return
+    apply_counters(matches)
+    matches_created.send(sender=Match, matches=matches)
+    notify(matches)
+
+
+def apply_counters(matches):
+    """Incrémente ``match_count`` une seule fois par match"""
+    for match in matches:
+        with transaction.atomic():
+            # Le passage du drapeau et les compteurs sont commités ensemble
+            if Match.objects.filter(pk=match.pk, counters_applied=False).update(counters_applied=True):
+                UserProfile.objects.filter(
+                    user_id__in=[match.user1_id, match.user2_id]
+                ).update(match_count=F('match_count') + 1)
+
+
+def notify(matches):
+    """Pousse l'événement ``match.created`` aux deux utilisateurs de chaque match"""
+    group_send = async_to_sync(get_channel_layer().group_send)
+    for match in matches:
+        for user_id, other_user_id in ((match.user1_id, match.user2_id), (match.user2_id, match.user1_id)):
+            group_send(f'user_{user_id}', {
+                'type': 'match.created',
+                'match_id': str(match.id),
+                'other_user_id': str(other_user_id),
+            })
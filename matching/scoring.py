@@ -0,0 +1,129 @@
+"""
+Classement des candidats de découverte.
+
+Les caractéristiques d'un lot de candidats sont chargées en colonnes NumPy
+(``CandidateStore``), puis ``score_candidates`` calcule le score de tout le
+lot en une seule passe vectorisée. Le score est une somme pondérée de
+signaux dans [0, 1] :
+- distance : 1 au même endroit, 0 à ``max_distance`` ;
+- âge : 1 au milieu de l'intervalle de préférences, 0 aux bornes ;
+- intérêts communs : ``1 - 0.5 ** n`` pour n intérêts partagés ;
+- activité : demi-vie de ``RECENCY_HALF_LIFE_HOURS`` sur ``last_seen`` ;
+- like reçu : 1 si le candidat a déjà liké l'utilisateur.
+"""
+from datetime import date
+
+import numpy as np
+from django.utils import timezone
+from accounts.geo import EARTH_RADIUS_KM
+from accounts.interests import shared_counts
+from .engine import liked_by
+
+WEIGHTS = {
+    'distance': 0.30,
+    'age': 0.20,
+    'interests': 0.25,
+    'recency': 0.15,
+    'liked_you': 0.10,
+}
+RECENCY_HALF_LIFE_HOURS = 72
+DAYS_PER_YEAR = 365.2425
+
+
+class CandidateStore:
+    """Caractéristiques d'un lot de candidats, une colonne NumPy par signal"""
+
+    FIELDS = (
+        'id', 'user_id', 'created_at', 'latitude', 'longitude', 'birth_date',
+        'user__last_seen', 'interest_mask',
+    )
+
+    def __init__(self, profile_ids, user_ids, created_at, latitude, longitude, age,
+                 last_seen, shared_interests, liked_you):
+        self.profile_ids = list(profile_ids)
+        self.user_ids = list(user_ids)
+        # Conservé pour le curseur keyset de la file de découverte
+        self.created_at = list(created_at)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self.age = np.asarray(age, dtype=np.float32)
+        # Timestamps Unix en secondes
+        self.last_seen = np.asarray(last_seen, dtype=np.float64)
+        self.shared_interests = np.asarray(shared_interests, dtype=np.int16)
+        self.liked_you = np.asarray(liked_you, dtype=bool)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def load(cls, user_profile, profiles):
+        """
+        Charge les candidats de ``profiles`` (ordonnés et découpés par
+        l'appelant) en deux requêtes : les profils, puis les likes reçus de
+        ces candidats ; les intérêts partagés viennent des bitsets.
+        """
+        rows = list(profiles.values_list(*cls.FIELDS))
+        if not rows:
+            return cls([], [], [], [], [], [], [], [], [])
+        (profile_ids, user_ids, created_at, latitude, longitude,
+         birth_dates, last_seen, masks) = zip(*rows)
+
+        likers = liked_by(user_profile.user, user_ids)
+        today = date.today()
+        return cls(
+            profile_ids,
+            [str(user_id) for user_id in user_ids],
+            created_at,
+            [np.nan if value is None else value for value in latitude],
+            [np.nan if value is None else value for value in longitude],
+            [np.nan if value is None else (today - value).days / DAYS_PER_YEAR for value in birth_dates],
+            [np.nan if value is None else value.timestamp() for value in last_seen],
+            shared_counts(masks, user_profile.interest_mask),
+            [user_id in likers for user_id in user_ids],
+        )
+
+
+def score_candidates(user_profile, store, now=None):
+    """Score de chaque candidat du lot (tableau aligné sur ``store.user_ids``)"""
+    if not len(store):
+        return np.zeros(0, dtype=np.float32)
+    now = (now or timezone.now()).timestamp()
+
+    if user_profile.latitude is None or user_profile.longitude is None:
+        distance = np.full(len(store), 0.5)
+    else:
+        lat1 = np.radians(float(user_profile.latitude))
+        lat2 = np.radians(store.latitude)
+        dlat = lat2 - lat1
+        dlon = np.radians(store.longitude - float(user_profile.longitude))
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        distance = 1 - km / max(user_profile.max_distance, 1)
+
+    middle = (user_profile.min_age_preference + user_profile.max_age_preference) / 2
+    half_range = max((user_profile.max_age_preference - user_profile.min_age_preference) / 2, 1)
+    age = 1 - np.abs(store.age - middle) / half_range
+
+    interests = 1 - np.float32(0.5) ** store.shared_interests
+    hours = np.maximum(now - store.last_seen, 0) / 3600
+    recency = 0.5 ** (hours / RECENCY_HALF_LIFE_HOURS)
+
+    scores = (
+        WEIGHTS['distance'] * np.clip(np.nan_to_num(distance), 0, 1)
+        + WEIGHTS['age'] * np.clip(np.nan_to_num(age), 0, 1)
+        + WEIGHTS['interests'] * interests
+        + WEIGHTS['recency'] * np.nan_to_num(recency)
+        + WEIGHTS['liked_you'] * store.liked_you
+    )
+    return scores.astype(np.float32)
+
+
+def top_candidates(scores, limit):
+    """
+    Indices des ``limit`` meilleurs candidats par score décroissant ;
+    à score égal, l'ordre du lot est conservé.
+    """
+    if limit < len(scores):
+        best = np.sort(np.argpartition(-scores, limit - 1)[:limit])
+        return best[np.argsort(-scores[best], kind='stable')]
+    return np.argsort(-scores, kind='stable')
@@ -1,6 +1,11 @@
+from django.db import models
 from rest_framework import serializers
 from .models import Swipe, Match
-from accounts.serializers import UserSerializer, UserProfileSerializer
+from accounts import presence
+from accounts.models import UserProfile
+from accounts.serializers import UserSerializer
+from accounts.cards import profile_card, profile_cards
+from accounts.projections import user_payload
 
 
 class SwipeSerializer(serializers.ModelSerializer):
@@ -29,18 +34,41 @@ class MatchSerializer(serializers.ModelSerializer):
     def get_user1_profile(self, obj):
         try:
             profile = obj.user1.profile
-            return UserProfileSerializer(profile).data
+            return profile_card(profile)
         except:
             return None
 
     def get_user2_profile(self, obj):
         try:
             profile = obj.user2.profile
-            return UserProfileSerializer(profile).data
+            return profile_card(profile)
         except:
             return None
 
 
+class MatchDetailListSerializer(serializers.ListSerializer):
+    """Récupère les cartes profil et la présence de toute la page en un seul get_many chacune"""
+
+    def to_representation(self, data):
+        matches = list(data.all() if isinstance(data, models.Manager) else data)
+        request_user = self.context.get('request').user
+
+        other_users = [match.get_other_user(request_user) for match in matches]
+        self.context['presence'] = presence.states(other_users)
+
+        profiles = []
+        for other_user in other_users:
+            try:
+                profiles.append(other_user.profile)
+            except UserProfile.DoesNotExist:
+                pass
+        self.context['profile_cards'] = {
+            profile.pk: card for profile, card in zip(profiles, profile_cards(profiles))
+        }
+
+        return super().to_representation(matches)
+
+
 class MatchDetailSerializer(serializers.ModelSerializer):
     """Serializer détaillé pour un match (avec l'autre utilisateur)"""
     other_user = serializers.SerializerMethodField()
@@ -50,17 +78,19 @@ class MatchDetailSerializer(serializers.ModelSerializer):
         model = Match
         fields = ['id', 'other_user', 'other_user_profile', 'is_active', 'matched_at']
         read_only_fields = ['id', 'matched_at']
+        list_serializer_class = MatchDetailListSerializer
 
     def get_other_user(self, obj):
         request_user = self.context.get('request').user
         other_user = obj.get_other_user(request_user)
-        return UserSerializer(other_user).data
+        return user_payload(other_user, self.context.get('presence', {}).get(other_user.id))
 
     def get_other_user_profile(self, obj):
         request_user = self.context.get('request').user
         other_user = obj.get_other_user(request_user)
         try:
             profile = other_user.profile
-            return UserProfileSerializer(profile).data
+            cards = self.context.get('profile_cards', {})
+            return cards[profile.pk] if profile.pk in cards else profile_card(profile)
         except:
             return None
\ No newline at end of file
@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# Envoyé par le pipeline post-match (matching.pipeline), hors de la requête,
+# pour les matches nouvellement créés ; peut être renvoyé lors d'un nouvel essai.
+# Argument : matches (liste des Match)
+matches_created = Signal()
+
+# Envoyé quand des matches sont annulés (MatchViewSet.unmatch).
+# Argument : matches (liste des Match)
+matches_ended = Signal()
@@ -1,3 +1,584 @@
-from django.test import TestCase
+import math
+import threading
+from datetime import date, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.geo import KM_PER_DEGREE
+from accounts.models import Interest, UserInterest
+from accounts.tests import create_profile
+from accounts.models import UserProfile
+from chat.models import Conversation
+from . import discovery, like_index, pipeline
+from .discovery import birth_date_range, candidate_queryset, years_before
+from .engine import AlreadySwiped, create_match, record_swipe
+from .models import Match, Swipe
+
+# Pipeline post-match exécuté au commit, événements dans une couche en mémoire
+eager_pipeline = override_settings(
+    MATCH_PIPELINE_EAGER=True,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+
+
+class DiscoverQueryCountTests(TestCase):
+    """Le nombre de requêtes de /discover/ ne dépend pas du nombre de profils"""
+
+    def setUp(self):
+        cache.clear()
+        interests = [Interest.objects.create(name=name) for name in ('Cinéma', 'Rando')]
+        self.profile = create_profile('viewer@example.com')
+        for index in range(12):
+            create_profile(f'candidate{index}@example.com', interests=interests)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def test_discover(self):
+        # remplissage de la file (candidats, likes reçus),
+        # profils + utilisateurs, photos, intérêts
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/matching/discover/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 12)
+        self.assertTrue(all(len(profile['interests']) == 2 for profile in response.data))
+
+        # Cartes en cache : remplissage de la file et profils seulement
+        with self.assertNumQueries(3):
+            self.client.get('/api/matching/discover/')
+
+    def test_ranking(self):
+        interests = list(Interest.objects.all())
+        UserInterest.objects.bulk_create([
+            UserInterest(profile=self.profile, interest=interest) for interest in interests
+        ])
+        self.profile.refresh_interest_mask()
+        liker = create_profile('liker@example.com', interests=interests)
+        Swipe.objects.create(from_user=liker.user, to_user=self.profile.user, swipe_type='like')
+        loner = create_profile('loner@example.com')
+
+        response = self.client.get('/api/matching/discover/')
+        ids = [profile['user']['id'] for profile in response.data]
+        self.assertEqual(ids[0], str(liker.user.id))
+        self.assertEqual(ids[-1], str(loner.user.id))
+
+    def test_shared_interests_filter(self):
+        UserInterest.objects.create(profile=self.profile, interest=Interest.objects.first())
+        self.profile.refresh_interest_mask()
+        loner = create_profile('loner@example.com')
+
+        response = self.client.get('/api/matching/discover/', {'shared_interests': '1'})
+        ids = {profile['user']['id'] for profile in response.data}
+        self.assertEqual(len(ids), 12)
+        self.assertNotIn(str(loner.user.id), ids)
+
+
+class DiscoverFilterTests(TestCase):
+    """Filtres de la requête des candidats (distance, âge, swipes)"""
+
+    def setUp(self):
+        cache.clear()
+        self.profile = create_profile('viewer@example.com', photos=0, max_distance=10)
+        self.user = self.profile.user
+
+    def candidates(self):
+        return set(candidate_queryset(self.user, self.profile).values_list('user__email', flat=True))
+
+    def test_max_distance(self):
+        km_per_degree_east = KM_PER_DEGREE * math.cos(math.radians(self.profile.latitude))
+        for direction, lat_step, lon_step in (('nord', 1 / KM_PER_DEGREE, 0), ('est', 0, 1 / km_per_degree_east)):
+            for name, distance in (('dedans', 9.9), ('dehors', 10.1)):
+                create_profile(
+                    f'{direction}-{name}@example.com', photos=0,
+                    latitude=self.profile.latitude + distance * lat_step,
+                    longitude=self.profile.longitude + distance * lon_step,
+                )
+        self.assertEqual(self.candidates(), {'nord-dedans@example.com', 'est-dedans@example.com'})
+
+    def test_age_preferences_bounds(self):
+        self.profile.min_age_preference, self.profile.max_age_preference = 25, 30
+        today = date.today()
+        for name, birth_date in (
+            ('25-ans-aujourdhui', years_before(today, 25)),
+            ('25-ans-demain', years_before(today, 25) + timedelta(days=1)),
+            ('30-ans', years_before(today, 31) + timedelta(days=1)),
+            ('31-ans-aujourdhui', years_before(today, 31)),
+        ):
+            create_profile(f'{name}@example.com', photos=0, birth_date=birth_date)
+        self.assertEqual(self.candidates(), {'25-ans-aujourdhui@example.com', '30-ans@example.com'})
+
+    def test_february_29(self):
+        self.assertEqual(years_before(date(2024, 2, 29), 1), date(2023, 2, 28))
+        self.assertEqual(years_before(date(2024, 2, 29), 4), date(2020, 2, 29))
+
+        def aged_18(birth_date, today):
+            profile = create_profile(f'{birth_date}-{today}@example.com', photos=0, birth_date=birth_date)
+            return UserProfile.objects.filter(birth_date_range(18, 18, today=today), pk=profile.pk).exists()
+
+        # Né un 29 février : 18 ans le 1er mars d'une année non bissextile (comme UserProfile.age)
+        self.assertFalse(aged_18(date(2000, 2, 29), today=date(2018, 2, 28)))
+        self.assertTrue(aged_18(date(2000, 2, 29), today=date(2018, 3, 1)))
+        # Un 29 février : bornes ramenées au 28
+        self.assertTrue(aged_18(date(2006, 2, 28), today=date(2024, 2, 29)))
+        self.assertFalse(aged_18(date(2006, 3, 1), today=date(2024, 2, 29)))
+        self.assertTrue(aged_18(date(2005, 3, 1), today=date(2024, 2, 29)))
+        self.assertFalse(aged_18(date(2005, 2, 28), today=date(2024, 2, 29)))
+
+    def test_candidate_preferences_must_include_viewer(self):
+        viewer_age = self.profile.age
+        create_profile('accepte@example.com', photos=0, max_age_preference=viewer_age)
+        create_profile('trop-vieux@example.com', photos=0, max_age_preference=viewer_age - 1)
+        create_profile('trop-jeune@example.com', photos=0, min_age_preference=viewer_age + 1)
+        self.assertEqual(self.candidates(), {'accepte@example.com'})
+
+    def test_swiped_profiles_are_excluded(self):
+        liked, passed, swiped_by_other = [
+            create_profile(f'{name}@example.com', photos=0).user for name in ('like', 'pass', 'autre')
+        ]
+        create_profile('nouveau@example.com', photos=0)
+        Swipe.objects.create(from_user=self.user, to_user=liked, swipe_type='like')
+        Swipe.objects.create(from_user=self.user, to_user=passed, swipe_type='pass')
+        # Les swipes des autres (et ceux reçus) n'excluent rien
+        Swipe.objects.create(from_user=liked, to_user=swiped_by_other, swipe_type='like')
+        Swipe.objects.create(from_user=swiped_by_other, to_user=self.user, swipe_type='like')
+        self.assertEqual(self.candidates(), {'autre@example.com', 'nouveau@example.com'})
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/matching/discover/')
+        self.assertEqual(
+            {profile['user']['email'] for profile in response.data},
+            {'autre@example.com', 'nouveau@example.com'}
+        )
+
+
+class DiscoveryQueueTests(TestCase):
+    """File de découverte : remplissage par curseur, dépilement, retrait au swipe"""
+
+    def setUp(self):
+        cache.clear()
+        self.profile = create_profile('viewer@example.com')
+        self.user = self.profile.user
+        self.candidates = [create_profile(f'candidate{index}@example.com', photos=0) for index in range(12)]
+
+    def empty_queue(self):
+        key = discovery.queue_key(self.profile)
+        state = cache.get(key)
+        cache.set(key, {**state, 'ids': []})
+        return state['ids']
+
+    def test_refill_continues_after_cursor(self):
+        served = []
+        with mock.patch.object(discovery, 'SCORING_WINDOW', 5), mock.patch.object(discovery, 'QUEUE_SIZE', 5):
+            for expected in (5, 5, 2):
+                state = discovery.refill_queue(self.user, self.profile, force=True)
+                self.assertEqual(len(state['ids']), expected)
+                served += self.empty_queue()
+            # Parcours épuisé : curseur remis à zéro
+            self.assertIsNone(cache.get(discovery.queue_key(self.profile))['cursor'])
+        self.assertEqual(len(served), 12)
+        self.assertEqual(set(served), {str(profile.user_id) for profile in self.candidates})
+
+    def queued(self):
+        return cache.get(discovery.queue_key(self.profile))['ids']
+
+    def test_pop_serves_each_profile_once(self):
+        first = discovery.pop_candidates(self.user, self.profile, count=5)
+        self.assertEqual(len(self.queued()), 7)
+        second = discovery.pop_candidates(self.user, self.profile, count=5)
+        served = [str(profile.user_id) for profile in first + second]
+        self.assertEqual(len(set(served)), 10)
+        self.assertEqual(self.queued(), [user_id for user_id in self.queued() if user_id not in served])
+
+    def test_refill_does_not_duplicate_queued_profiles(self):
+        discovery.refill_queue(self.user, self.profile)
+        discovery.refill_queue(self.user, self.profile, force=True)
+        self.assertEqual(len(self.queued()), 12)
+        self.assertEqual(len(set(self.queued())), 12)
+
+    def test_swipe_removes_profile_from_queue(self):
+        discovery.refill_queue(self.user, self.profile)
+        swiped = self.queued()[3]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/matching/swipes/', {'to_user': swiped, 'swipe_type': 'pass'})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(swiped, self.queued())
+
+        # Ni resservi par un nouveau remplissage
+        discovery.refill_queue(self.user, self.profile, force=True)
+        served = discovery.pop_candidates(self.user, self.profile, count=20)
+        self.assertNotIn(swiped, [str(profile.user_id) for profile in served])
+        self.assertEqual(len(served), 11)
+
+    def test_swipe_with_uppercase_id_removes_profile(self):
+        discovery.refill_queue(self.user, self.profile)
+        swiped = self.queued()[0]
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/matching/swipes/', {'to_user': swiped.upper(), 'swipe_type': 'pass'})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(swiped, self.queued())
+
+        response = client.get('/api/matching/discover/')
+        self.assertNotIn(swiped, [card['user']['id'] for card in response.data])
+
+    def test_removal_waits_for_refill(self):
+        discovery.refill_queue(self.user, self.profile)
+        swiped = self.queued()[0]
+        remover = threading.Thread(target=discovery.remove_from_queue, args=(self.profile, swiped))
+        with discovery.queue_lock(discovery.queue_key(self.profile)):
+            remover.start()
+            remover.join(0.1)
+            # Bloqué par le verrou : l'état écrit par le détenteur n'est pas écrasé
+            self.assertTrue(remover.is_alive())
+            self.assertIn(swiped, self.queued())
+        remover.join()
+        self.assertNotIn(swiped, self.queued())
+
+
+class MatchQueryCountTests(TestCase):
+    """Le nombre de requêtes des endpoints de match ne dépend pas du nombre de matches"""
+
+    def setUp(self):
+        cache.clear()
+        interests = [Interest.objects.create(name=name) for name in ('Cinéma', 'Rando')]
+        self.profile = create_profile('viewer@example.com', interests=interests)
+        self.others = []
+        for index in range(5):
+            other = create_profile(f'match{index}@example.com', interests=interests)
+            user1, user2 = sorted([self.profile.user, other.user], key=lambda user: user.id)
+            Match.objects.create(user1=user1, user2=user2)
+            self.others.append(other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def test_match_list(self):
+        # count de pagination + matches et profils (jointure),
+        # puis photos et intérêts des cartes absentes du cache
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/matching/matches/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 5)
+
+        # Cartes en cache : plus de requête par profil
+        with self.assertNumQueries(2):
+            cached = self.client.get('/api/matching/matches/')
+        self.assertEqual(cached.data, response.data)
+
+    def test_swipe_creating_match(self):
+        liker = create_profile('liker@example.com', interests=Interest.objects.all())
+        Swipe.objects.create(from_user=liker.user, to_user=self.profile.user, swipe_type='like')
+
+        # swipe et match en deux transactions (8 requêtes avec les savepoints),
+        # rechargement du match, puis photos et intérêts de chaque profil ;
+        # compteurs et conversation sont traités après la réponse
+        with self.assertNumQueries(13):
+            response = self.client.post(
+                '/api/matching/swipes/',
+                {'to_user': str(liker.user.id), 'swipe_type': 'like'}
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_match'])
+        self.assertEqual(len(response.data['match']['user1_profile']['interests']), 2)
+        self.assertEqual(len(response.data['match']['user2_profile']['interests']), 2)
+
+
+@eager_pipeline
+class SwipeEngineTests(TestCase):
+    """Swipes, matches et compteurs du moteur de swipe"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com').user
+        self.bob = create_profile('bob@example.com').user
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_duplicate_swipe_is_rejected(self):
+        self.client.post('/api/matching/swipes/', {'to_user': str(self.bob.id), 'swipe_type': 'pass'})
+        response = self.client.post('/api/matching/swipes/', {'to_user': str(self.bob.id), 'swipe_type': 'like'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Swipe.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.alice).swipe_count, 1)
+
+    def test_invalid_user_id_is_rejected(self):
+        response = self.client.post('/api/matching/swipes/', {'to_user': 'pas-un-uuid', 'swipe_type': 'like'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_mutual_like_creates_one_match(self):
+        _, match = record_swipe(self.bob, str(self.alice.id), 'like')
+        self.assertIsNone(match)
+        with self.captureOnCommitCallbacks(execute=True):
+            _, match = record_swipe(self.alice, str(self.bob.id), 'super_like')
+        self.assertIsNotNone(match)
+        self.assertLess(match.user1_id, match.user2_id)
+
+        for user in (self.alice, self.bob):
+            profile = UserProfile.objects.get(user=user)
+            self.assertEqual((profile.swipe_count, profile.match_count), (1, 1))
+
+    def test_create_match_is_idempotent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = create_match(self.alice.id, self.bob.id)
+            second = create_match(self.bob.id, self.alice.id)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.alice).match_count, 1)
+
+
+@eager_pipeline
+class InterleavedSwipeTests(TestCase):
+    """
+    Entrelacements des requêtes concurrentes rejoués pas à pas (exécutés
+    aussi sous SQLite) : un seul match, un seul incrément par compteur
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com').user
+        self.bob = create_profile('bob@example.com').user
+
+    def counts(self, user):
+        profile = UserProfile.objects.get(user=user)
+        return profile.swipe_count, profile.match_count
+
+    def test_crossing_likes_create_one_match(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_swipe(self.bob, str(self.alice.id), 'like')
+            _, match = record_swipe(self.alice, str(self.bob.id), 'like')
+        self.assertIsNotNone(match)
+
+        # Les deux requêtes ont vu le like de l'autre : celle de Bob crée aussi
+        # le match, l'IntegrityError est rattrapée et rien n'est replanifié
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(create_match(self.bob.id, self.alice.id), match)
+        self.assertEqual(callbacks, [])
+
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(self.counts(self.alice), (1, 1))
+        self.assertEqual(self.counts(self.bob), (1, 1))
+
+    def test_duplicate_like_is_recorded_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_swipe(self.bob, str(self.alice.id), 'like')
+            record_swipe(self.alice, str(self.bob.id), 'like')
+            with self.assertRaises(AlreadySwiped):
+                record_swipe(self.alice, str(self.bob.id), 'like')
+            with self.assertRaises(AlreadySwiped):
+                record_swipe(self.alice, str(self.bob.id), 'super_like')
+
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(Swipe.objects.filter(from_user=self.alice).count(), 1)
+        self.assertEqual(self.counts(self.alice), (1, 1))
+        self.assertEqual(self.counts(self.bob), (1, 1))
+
+
+@skipIf(connection.vendor == 'sqlite', "SQLite sérialise les écritures : pas de concurrence réelle")
+@eager_pipeline
+class ConcurrentSwipeTests(TransactionTestCase):
+    """Sous charge concurrente, les compteurs restent exacts et les matches uniques"""
+
+    def test_concurrent_mutual_likes(self):
+        users = [create_profile(f'user{index}@example.com').user for index in range(8)]
+        pairs = [(a, b) for a in users for b in users if a != b]
+        errors = []
+
+        def swipe(from_user, to_user):
+            try:
+                record_swipe(from_user, str(to_user.id), 'like')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=swipe, args=pair) for pair in pairs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected_matches = len(users) * (len(users) - 1) // 2
+        self.assertEqual(Match.objects.count(), expected_matches)
+        for profile in UserProfile.objects.filter(user__in=users):
+            self.assertEqual(profile.swipe_count, len(users) - 1)
+            self.assertEqual(profile.match_count, len(users) - 1)
+
+
+@eager_pipeline
+class BulkSwipeTests(TestCase):
+    """Ingestion d'un lot de swipes hors ligne"""
+
+    def setUp(self):
+        cache.clear()
+        self.profile = create_profile('viewer@example.com')
+        self.others = [create_profile(f'user{index}@example.com').user for index in range(6)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.profile.user)
+
+    def test_bulk_swipes(self):
+        likers = self.others[:2]
+        for liker in likers:
+            Swipe.objects.create(from_user=liker, to_user=self.profile.user, swipe_type='like')
+        Swipe.objects.create(from_user=self.profile.user, to_user=self.others[5], swipe_type='pass')
+
+        payload = [{'to_user': str(user.id), 'swipe_type': 'like'} for user in self.others] + [
+            {'to_user': str(self.others[3].id), 'swipe_type': 'pass'},
+            {'to_user': 'pas-un-uuid', 'swipe_type': 'like'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/matching/swipes/bulk/', {'swipes': payload}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['created'] * 5 + ['duplicate', 'duplicate', 'invalid'])
+        matched = [result['is_match'] for result in response.data['results']]
+        self.assertEqual(matched, [True, True] + [False] * 6)
+
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        self.assertEqual((profile.swipe_count, profile.match_count), (5, 2))
+        for liker in likers:
+            self.assertEqual(UserProfile.objects.get(user=liker).match_count, 1)
+        self.assertEqual(Match.objects.filter(conversation__isnull=False).count(), 2)
+
+    def test_malformed_items_are_invalid(self):
+        target = str(self.others[0].id)
+        payload = [
+            ['abc'],
+            'abc',
+            None,
+            {'to_user': target, 'swipe_type': ['like']},
+            {'to_user': target, 'swipe_type': {'type': 'like'}},
+            {'to_user': [target], 'swipe_type': 'like'},
+            {'to_user': target, 'swipe_type': 'like'},
+        ]
+        response = self.client.post('/api/matching/swipes/bulk/', {'swipes': payload}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.data['results']]
+        self.assertEqual(statuses, ['invalid'] * 6 + ['created'])
+        self.assertEqual(Swipe.objects.filter(from_user=self.profile.user).count(), 1)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        for liker in self.others:
+            Swipe.objects.create(from_user=liker, to_user=self.profile.user, swipe_type='like')
+        payload = [{'to_user': str(user.id), 'swipe_type': 'like'} for user in self.others]
+
+        # utilisateurs, swipes existants, insertion + relecture + compteur,
+        # likes réciproques, matches + relecture (savepoints compris)
+        with self.assertNumQueries(12):
+            self.client.post('/api/matching/swipes/bulk/', {'swipes': payload}, format='json')
+
+
+@override_settings(LIKE_INDEX_ENABLED=True)
+class LikeIndexTests(TestCase):
+    """Détection de match par l'index des likes reçus"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com').user
+        self.bob = create_profile('bob@example.com').user
+
+    def test_match_detected_without_swipe_query(self):
+        like_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            record_swipe(self.bob, str(self.alice.id), 'like')
+
+        # insertion + compteur, match (savepoints compris)
+        with self.assertNumQueries(7):
+            _, match = record_swipe(self.alice, str(self.bob.id), 'like')
+        self.assertIsNotNone(match)
+
+    def test_new_like_is_visible_without_reload(self):
+        self.assertFalse(like_index.has_liked(self.bob.id, self.alice.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            Swipe.objects.create(from_user=self.bob, to_user=self.alice, swipe_type='like')
+            like_index.add_likes(self.bob.id, self.alice.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(like_index.has_liked(self.bob.id, self.alice.id))
+
+    def test_undone_like_is_removed(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        swipe = Swipe.objects.create(from_user=self.bob, to_user=self.alice, swipe_type='like')
+        self.assertTrue(like_index.has_liked(self.bob.id, self.alice.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(f'/api/matching/swipes/{swipe.id}/')
+        _, match = record_swipe(self.alice, str(self.bob.id), 'like')
+        self.assertIsNone(match)
+
+    def test_evicted_index_falls_back_to_swipes(self):
+        like_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            record_swipe(self.bob, str(self.alice.id), 'like')
+
+        # Éviction par le cache (LRU) : l'ensemble est rechargé depuis Swipe
+        cache.clear()
+        _, match = record_swipe(self.alice, str(self.bob.id), 'like')
+        self.assertIsNotNone(match)
+
+    def test_like_before_load_is_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Swipe.objects.create(from_user=self.bob, to_user=self.alice, swipe_type='like')
+            like_index.add_likes(self.bob.id, self.alice.id)
+        self.assertTrue(like_index.has_liked(self.bob.id, self.alice.id))
+        self.assertFalse(like_index.has_liked(self.alice.id, self.bob.id))
+
+    def test_rebuild_in_batches(self):
+        carol = create_profile('carol@example.com').user
+        Swipe.objects.create(from_user=self.bob, to_user=self.alice, swipe_type='like')
+        Swipe.objects.create(from_user=carol, to_user=self.bob, swipe_type='super_like')
+        Swipe.objects.create(from_user=self.alice, to_user=carol, swipe_type='pass')
+
+        with mock.patch.object(like_index, 'REBUILD_BATCH', 2):
+            self.assertEqual(like_index.rebuild(), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(like_index.likers_among(self.alice.id, [self.bob.id, carol.id]), {self.bob.id})
+            self.assertEqual(like_index.likers_among(self.bob.id, [self.alice.id, carol.id]), {carol.id})
+            self.assertEqual(like_index.likers_among(carol.id, [self.alice.id, self.bob.id]), set())
+
+
+@eager_pipeline
+class MatchPipelineTests(TestCase):
+    """Traitements post-match hors de la requête, rejouables"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = create_profile('alice@example.com').user
+        self.bob = create_profile('bob@example.com').user
+
+    def test_pipeline_runs_after_commit(self):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'user_{self.bob.id}', channel)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            match = create_match(self.alice.id, self.bob.id)
+        self.assertFalse(Match.objects.filter(pk=match.pk, conversation__isnull=False).exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(Match.objects.filter(pk=match.pk, conversation__isnull=False).exists())
+        self.assertEqual(UserProfile.objects.get(user=self.bob).match_count, 1)
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'match.created')
+        self.assertEqual(event['match_id'], str(match.id))
+        self.assertEqual(event['other_user_id'], str(self.alice.id))
+
+    def test_replay_is_idempotent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            match = create_match(self.alice.id, self.bob.id)
+        pipeline.process([match.pk])
+        pipeline.process([match.pk])
+
+        self.assertEqual(Conversation.objects.filter(match=match).count(), 1)
+        for user in (self.alice, self.bob):
+            self.assertEqual(UserProfile.objects.get(user=user).match_count, 1)
@@ -2,15 +2,23 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.utils import timezone
 from .models import Swipe, Match
 from .serializers import SwipeSerializer, MatchSerializer, MatchDetailSerializer
+from .discovery import pop_candidates, remove_from_queue
+from .engine import LIKE_TYPES, AlreadySwiped, record_swipe, record_swipes
+from . import like_index
+from .signals import matches_ended
 from accounts.models import UserProfile
-from accounts.serializers import UserProfileSerializer
+from accounts.cards import profile_cards
 import math
 
 
+MAX_BULK_SWIPES = 500
+
+
 class DiscoverViewSet(viewsets.ViewSet):
     """ViewSet pour découvrir des profils à swiper"""
     permission_classes = [IsAuthenticated]
@@ -26,37 +34,12 @@ class DiscoverViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Récupérer les IDs des utilisateurs déjà swipés
-        swiped_user_ids = Swipe.objects.filter(from_user=user).values_list('to_user_id', flat=True)
-
-        # Filtrer les profils selon les préférences
-        profiles = UserProfile.objects.exclude(
-            Q(user=user) | Q(user__id__in=swiped_user_ids)
-        ).filter(
-            gender=user_profile.looking_for if user_profile.looking_for != 'B' else Q(gender__in=['M', 'F', 'O']),
-            looking_for__in=['B', user_profile.gender]
-        )
-
-        # Filtrer par âge
-        if user_profile.age:
-            profiles = profiles.filter(
-                birth_date__isnull=False
-            )
-            # Filtrer par l'âge calculé (approximatif)
+        # Dépiler 20 profils de la file de découverte
+        # (?shared_interests=1 : uniquement les profils ayant un intérêt commun)
+        shared_interests_only = request.query_params.get('shared_interests') in ('1', 'true')
+        profiles = pop_candidates(user, user_profile, shared_interests_only=shared_interests_only)
 
-        # Filtrer par distance (si coordonnées disponibles)
-        if user_profile.latitude and user_profile.longitude:
-            profiles = profiles.filter(
-                latitude__isnull=False,
-                longitude__isnull=False
-            )
-            # Calcul de distance à faire côté client ou avec PostGIS pour plus de précision
-
-        # Limiter à 20 profils
-        profiles = profiles[:20]
-
-        serializer = UserProfileSerializer(profiles, many=True)
-        return Response(serializer.data)
+        return Response(profile_cards(profiles))
 
 
 class SwipeViewSet(viewsets.ModelViewSet):
@@ -67,8 +50,23 @@ class SwipeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Swipe.objects.filter(from_user=self.request.user)
 
+    def perform_update(self, serializer):
+        previous_to_user_id = serializer.instance.to_user_id
+        swipe = serializer.save()
+        like_index.discard(swipe.from_user_id, previous_to_user_id, swipe.to_user_id)
+        if swipe.swipe_type in LIKE_TYPES:
+            like_index.add_likes(swipe.from_user_id, swipe.to_user_id)
+
+    def perform_destroy(self, instance):
+        like_index.discard(instance.from_user_id, instance.to_user_id)
+        instance.delete()
+
     def create(self, request):
-        """Créer un swipe et vérifier si c'est un match"""
+        """
+        Créer un swipe et vérifier si c'est un match. Les ``match_count``
+        des profils du match sont ceux d'avant le pipeline post-match, qui
+        les incrémente après la réponse.
+        """
         to_user_id = request.data.get('to_user')
         swipe_type = request.data.get('swipe_type', 'pass')
 
@@ -78,51 +76,28 @@ class SwipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Vérifier que l'utilisateur n'a pas déjà swipé
-        if Swipe.objects.filter(from_user=request.user, to_user_id=to_user_id).exists():
+        # Enregistrer le swipe et créer le match éventuel (transactionnel)
+        try:
+            swipe, match = record_swipe(request.user, to_user_id, swipe_type)
+        except AlreadySwiped:
             return Response(
                 {'error': 'Vous avez déjà swipé cet utilisateur'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        except ValidationError:
+            return Response(
+                {'error': 'to_user invalide'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Retirer le profil swipé de la file de découverte
+        remove_from_queue(request.user.profile, swipe.to_user_id)
 
-        # Créer le swipe
-        swipe = Swipe.objects.create(
-            from_user=request.user,
-            to_user_id=to_user_id,
-            swipe_type=swipe_type
-        )
-
-        # Incrémenter le compteur de swipes
-        request.user.profile.swipe_count += 1
-        request.user.profile.save()
-
-        # Vérifier si c'est un match (like mutuel)
-        is_match = False
-        match = None
-
-        if swipe_type in ['like', 'super_like']:
-            # Vérifier si l'autre utilisateur a aussi liké
-            reciprocal_swipe = Swipe.objects.filter(
-                from_user_id=to_user_id,
-                to_user=request.user,
-                swipe_type__in=['like', 'super_like']
-            ).first()
-
-            if reciprocal_swipe:
-                # C'est un match!
-                match = Match.objects.create(
-                    user1=request.user if request.user.id < reciprocal_swipe.from_user.id else reciprocal_swipe.from_user,
-                    user2=reciprocal_swipe.from_user if request.user.id < reciprocal_swipe.from_user.id else request.user
-                )
-
-                # Incrémenter les compteurs de match
-                request.user.profile.match_count += 1
-                request.user.profile.save()
-                
-                reciprocal_swipe.from_user.profile.match_count += 1
-                reciprocal_swipe.from_user.profile.save()
-
-                is_match = True
+        is_match = match is not None
+        if is_match:
+            # Recharger le match avec les profils (compteurs pas encore incrémentés
+            # par le pipeline post-match)
+            match = Match.objects.with_profiles().get(pk=match.pk)
 
         return Response({
             'swipe': SwipeSerializer(swipe).data,
@@ -130,6 +105,41 @@ class SwipeViewSet(viewsets.ModelViewSet):
             'match': MatchSerializer(match).data if match else None
         }, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Enregistrer un lot de swipes (file hors ligne du client)"""
+        swipes = request.data.get('swipes')
+
+        if not isinstance(swipes, list) or not swipes:
+            return Response(
+                {'error': 'swipes requis (liste)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(swipes) > MAX_BULK_SWIPES:
+            return Response(
+                {'error': f'Maximum {MAX_BULK_SWIPES} swipes par lot'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = record_swipes(request.user, swipes)
+
+        # Retirer les profils swipés de la file de découverte
+        remove_from_queue(request.user.profile, *[
+            result['to_user'] for result in results if result['status'] == 'created'
+        ])
+
+        return Response({
+            'results': [
+                {
+                    'to_user': result['to_user'],
+                    'status': result['status'],
+                    'is_match': result['match'] is not None,
+                    'match_id': str(result['match'].id) if result['match'] else None,
+                }
+                for result in results
+            ]
+        })
+
 
 class MatchViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet pour gérer les matches"""
@@ -141,7 +151,7 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
         return Match.objects.filter(
             Q(user1=user) | Q(user2=user),
             is_active=True
-        ).order_by('-matched_at')
+        ).with_profiles().order_by('-matched_at')
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -166,5 +176,8 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
         match = self.get_object()
         match.is_active = False
         match.save()
+
+        # Accès à la conversation coupé (cache des participants de l'app chat)
+        matches_ended.send(sender=Match, matches=[match])
         
         return Response({'status': 'Match annulé'})
\ No newline at end of file